@@ -0,0 +1,138 @@
+"""サイドバー・防災情報に表示する集計値（マテリアライズした集計）
+
+観光スポット数・カテゴリー別件数・営業中の件数、避難所の状態別件数・受け入れ可能人数などを
+データのバージョンごとに1回だけ計算して保持し、表示のたびにはデータフレームを走査しない。
+避難所は ShelterStatusStore の差分通知を受けて、変わった行の分だけ集計を増減する。
+"""
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+OPEN_STATUS = '開設中'
+MINUTES_PER_DAY = 24 * 60
+# 「9:00-17:00」「9時〜17時」のような営業時間（終了が開始より前なら日付をまたぐ）
+HOURS_PATTERN = re.compile(r'(\d{1,2})(?:[:：時](\d{2})?分?)?\s*[-~〜～]\s*(\d{1,2})(?:[:：時](\d{2})?分?)?')
+ALL_DAY = ('終日', '24時間')
+
+
+def parse_opening_hours(value) -> Optional[List[Tuple[int, int]]]:
+    """営業時間を [(開始分, 終了分), ...]（0時からの分、終了は含まない）に変換する
+
+    終日営業は [(0, 1440)]、読み取れない場合は None（営業中の集計から除く）。
+    """
+    if not isinstance(value, str):
+        return None
+    if any(word in value for word in ALL_DAY):
+        return [(0, MINUTES_PER_DAY)]
+    ranges = []
+    for match in HOURS_PATTERN.finditer(value):
+        start = int(match.group(1)) * 60 + int(match.group(2) or 0)
+        end = int(match.group(3)) * 60 + int(match.group(4) or 0)
+        start, end = min(start, MINUTES_PER_DAY), min(end, MINUTES_PER_DAY)
+        if start < end:
+            ranges.append((start, end))
+        elif start > end:
+            ranges.extend([(start, MINUTES_PER_DAY), (0, end)])
+    return ranges or None
+
+
+class TourismAggregates:
+    """観光スポットの集計（データのバージョンごとに1回作る）
+
+    営業中の件数は1日の分ごとの件数（1440要素）を差分配列の累積和で作っておき、
+    時刻を添字にして取り出す。
+    """
+
+    def __init__(self, tourism_df, version=None):
+        self.version = version
+        self.total = len(tourism_df)
+        self.by_category: Dict[str, int] = dict(Counter(tourism_df['カテゴリ']).most_common())
+        diff = np.zeros(MINUTES_PER_DAY + 1, dtype=np.int32)
+        self.unknown_hours = 0
+        for value in tourism_df['営業時間'] if '営業時間' in tourism_df.columns else []:
+            ranges = parse_opening_hours(value)
+            if ranges is None:
+                self.unknown_hours += 1
+                continue
+            for start, end in ranges:
+                diff[start] += 1
+                diff[end] -= 1
+        self._open_by_minute = np.cumsum(diff[:MINUTES_PER_DAY])
+
+    def open_now(self, now: Optional[datetime] = None) -> int:
+        """指定時刻（省略時は現在）に営業時間内のスポット数"""
+        now = now or datetime.now()
+        return int(self._open_by_minute[now.hour * 60 + now.minute])
+
+    def snapshot(self, now: Optional[datetime] = None) -> Dict:
+        return {'total': self.total, 'by_category': dict(self.by_category),
+                'open_now': self.open_now(now), 'unknown_hours': self.unknown_hours}
+
+
+class ShelterAggregates:
+    """避難所の集計（状態別・カテゴリー別の件数、開設中の受け入れ可能人数）
+
+    ShelterStatusStore に登録し、差分が適用されるたびに変わった行の旧い値を引いて新しい値を足す。
+    表示側は snapshot() で保持している値を読むだけ。
+
+    Args:
+        store: 共有の避難所ストア（shelter_feed.ShelterStatusStore）
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.by_status: Counter = Counter()
+        self.capacity_by_status: Counter = Counter()
+        self.open_by_category: Counter = Counter()
+        self.by_category: Counter = Counter()
+        self.incremental_updates = 0
+        with store.lock:
+            df = store.df
+            categories = df['カテゴリ'] if 'カテゴリ' in df.columns else ['避難所'] * len(df)
+            # 行ごとの直近の値（差分で旧い値を引くために保持する）
+            self._rows = {idx: (status, int(capacity), category) for idx, status, capacity, category
+                          in zip(df.index, df['状態'], df['収容人数'], categories)}
+            for status, capacity, category in self._rows.values():
+                self._add(status, capacity, category, 1)
+            self.version = store.version
+            store.subscribe(self._on_change)
+
+    def _add(self, status: str, capacity: int, category: str, sign: int):
+        self.by_status[status] += sign
+        self.capacity_by_status[status] += sign * capacity
+        self.by_category[category] += sign
+        if status == OPEN_STATUS:
+            self.open_by_category[category] += sign
+
+    def _on_change(self, changed: List[int], version: int):
+        with self.store.lock:
+            current = {idx: (self.store.df.at[idx, '状態'], int(self.store.df.at[idx, '収容人数']))
+                       for idx in changed}
+        with self._lock:
+            for idx, (status, capacity) in current.items():
+                old_status, old_capacity, category = self._rows[idx]
+                self._add(old_status, old_capacity, category, -1)
+                self._add(status, capacity, category, 1)
+                self._rows[idx] = (status, capacity, category)
+            self.version = max(self.version, version)
+            self.incremental_updates += 1
+
+    def close(self):
+        self.store.unsubscribe(self._on_change)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'version': self.version,
+                'total': len(self._rows),
+                'open': self.by_status[OPEN_STATUS],
+                'open_capacity': self.capacity_by_status[OPEN_STATUS],
+                'by_status': {k: v for k, v in self.by_status.items() if v},
+                'by_category': {k: v for k, v in self.by_category.items() if v},
+                'open_by_category': {k: v for k, v in self.open_by_category.items() if v},
+            }
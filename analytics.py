@@ -0,0 +1,290 @@
+"""利用状況の記録と月別人気ランキングの集計モジュール
+
+スポットの閲覧・選択・ルート算出をイベントとしてキューに積むだけで描画は待たず、
+バックグラウンドのスレッドがJSONLファイルへ追記しながら月ごとの集計を更新する。
+集計は Count-Min Sketch（任意スポットの回数推定）と Space-Saving（上位k件）で行うため、
+イベントが数百万件になってもメモリ使用量は月あたり一定になる。
+"""
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# イベント種別ごとの人気度への重み
+EVENT_WEIGHTS = {
+    'view': 1,    # 単一スポットの詳細を表示
+    'select': 2,  # 訪問したいスポットとして選択
+    'route': 3,   # 最適化ルートに含めて算出
+}
+
+
+class CountMinSketch:
+    """Count-Min Sketch（過大評価のみ起こる頻度推定）"""
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, key: str):
+        data = key.encode('utf-8')
+        return [zlib.crc32(data, seed) % self.width for seed in range(1, self.depth + 1)]
+
+    def add(self, key: str, count: int = 1):
+        self.table[np.arange(self.depth), self._columns(key)] += count
+        self.total += count
+
+    def estimate(self, key: str) -> int:
+        return int(self.table[np.arange(self.depth), self._columns(key)].min())
+
+    def to_dict(self):
+        return {'width': self.width, 'depth': self.depth, 'total': self.total, 'table': self.table.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['width'], data['depth'])
+        sketch.table = np.array(data['table'], dtype=np.int64)
+        sketch.total = data['total']
+        return sketch
+
+
+class SpaceSaving:
+    """Space-Saving による上位k件の追跡"""
+
+    def __init__(self, k: int = 50):
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, key: str, count: int = 1):
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.k:
+            self.counts[key] = count
+            self.errors[key] = 0
+        else:
+            # 最小のカウンタを置き換え、その値を誤差として引き継ぐ
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.counts[key] = floor + count
+            self.errors[key] = floor
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def to_dict(self):
+        return {'k': self.k, 'counts': self.counts, 'errors': self.errors}
+
+    @classmethod
+    def from_dict(cls, data):
+        tracker = cls(data['k'])
+        tracker.counts = dict(data['counts'])
+        tracker.errors = dict(data['errors'])
+        return tracker
+
+
+class MonthlyRanking:
+    """月（'YYYY-MM'）ごとの人気度スケッチ"""
+
+    def __init__(self, k: int = 50, width: int = 2048, depth: int = 4):
+        self.k = k
+        self.width = width
+        self.depth = depth
+        self.months: Dict[str, Tuple[CountMinSketch, SpaceSaving]] = {}
+        self.lock = threading.Lock()
+
+    def add(self, month: str, spot: str, weight: int = 1):
+        with self.lock:
+            if month not in self.months:
+                self.months[month] = (CountMinSketch(self.width, self.depth), SpaceSaving(self.k))
+            sketch, heavy = self.months[month]
+            sketch.add(spot, weight)
+            heavy.add(spot, weight)
+
+    def top(self, month: str, n: int = 10) -> List[Tuple[str, int]]:
+        """指定月の上位n件を (スポット名, 推定スコア) で返す"""
+        with self.lock:
+            if month not in self.months:
+                return []
+            sketch, heavy = self.months[month]
+            # Space-Saving の候補を Count-Min の推定値（より正確な上界）で並べ直す
+            candidates = [(name, min(count, sketch.estimate(name))) for name, count in heavy.counts.items()]
+        return sorted(candidates, key=lambda item: (-item[1], item[0]))[:n]
+
+    def total(self, month: str) -> int:
+        with self.lock:
+            return self.months[month][0].total if month in self.months else 0
+
+    def to_dict(self):
+        with self.lock:
+            return {month: {'cms': cms.to_dict(), 'ss': ss.to_dict()} for month, (cms, ss) in self.months.items()}
+
+    def load_dict(self, data):
+        with self.lock:
+            self.months = {
+                month: (CountMinSketch.from_dict(v['cms']), SpaceSaving.from_dict(v['ss']))
+                for month, v in data.items()
+            }
+
+
+class EventLogger:
+    """イベントを非同期でJSONLに追記し、月別ランキングを更新する
+
+    Args:
+        log_dir: イベントログ（events-YYYYMM.jsonl）とスナップショットの保存先
+        flush_interval: 書き込みスレッドがまとめて処理する間隔（秒）
+        snapshot_every: このイベント数ごとに集計のスナップショットを保存する
+    """
+
+    SNAPSHOT_NAME = 'ranking_snapshot.json'
+
+    def __init__(self, log_dir: str = 'analytics', flush_interval: float = 1.0,
+                 snapshot_every: int = 10000):
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.ranking = MonthlyRanking()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._offsets: Dict[str, int] = {}  # ログファイル → 集計済みバイト数
+        self._since_snapshot = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._month_range = (0.0, 0.0, '')  # 直近に使った月の (開始時刻, 終了時刻, 'YYYY-MM')
+        self.dropped = 0
+        self.written = 0
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._restore()
+            self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+    def log(self, kind: str, spot: Optional[str] = None, **fields):
+        """イベントを記録する（キューに積むだけなので描画をブロックしない）"""
+        event = {'t': round(time.time(), 3), 'k': kind}
+        if spot is not None:
+            event['s'] = spot
+        event.update(fields)
+        self._queue.put(event)
+
+    def _log_path(self, month: str) -> str:
+        return os.path.join(self.log_dir, f"events-{month.replace('-', '')}.jsonl")
+
+    def _month_of(self, ts: float) -> str:
+        """UNIX時刻 → 'YYYY-MM'（同じ月が続く間は境界の比較だけで済ませる）"""
+        start, end, month = self._month_range
+        if start <= ts < end:
+            return month
+        local = time.localtime(ts)
+        start = time.mktime((local.tm_year, local.tm_mon, 1, 0, 0, 0, 0, 0, -1))
+        next_year, next_month = (local.tm_year + 1, 1) if local.tm_mon == 12 else (local.tm_year, local.tm_mon + 1)
+        end = time.mktime((next_year, next_month, 1, 0, 0, 0, 0, 0, -1))
+        month = f"{local.tm_year}-{local.tm_mon:02d}"
+        self._month_range = (start, end, month)
+        return month
+
+    def _count(self, event, counts: Counter):
+        spot = event.get('s')
+        weight = EVENT_WEIGHTS.get(event.get('k'))
+        if spot is None or weight is None:
+            return
+        counts[(self._month_of(event['t']), spot)] += weight
+
+    def _aggregate(self, counts: Counter):
+        # 同じ (月, スポット) はまとめて1回だけスケッチに加算する
+        for (month, spot), weight in counts.items():
+            self.ranking.add(month, spot, weight)
+
+    def _drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not events:
+            return
+        by_month: Dict[str, List[str]] = {}
+        for event in events:
+            month = self._month_of(event['t'])
+            by_month.setdefault(month, []).append(json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+        for month, lines in by_month.items():
+            path = self._log_path(month)
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+            try:
+                with open(path, 'ab') as f:
+                    f.write(data)
+            except OSError:
+                self.dropped += len(lines)
+                continue
+            self._offsets[path] = self._offsets.get(path, 0) + len(data)
+            self.written += len(lines)
+        counts = Counter()
+        for event in events:
+            self._count(event, counts)
+        self._aggregate(counts)
+        self._since_snapshot += len(events)
+        if self._since_snapshot >= self.snapshot_every:
+            self.save_snapshot()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._drain()
+            self._stop.wait(self.flush_interval)
+        self._drain()
+        self.save_snapshot()
+
+    def save_snapshot(self):
+        """集計状態と集計済みのログ位置を保存する"""
+        path = os.path.join(self.log_dir, self.SNAPSHOT_NAME)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'offsets': self._offsets, 'ranking': self.ranking.to_dict()}, f)
+        os.replace(tmp, path)
+        self._since_snapshot = 0
+
+    def _restore(self):
+        """スナップショットを読み込み、その後に追記されたログだけを再集計する"""
+        path = os.path.join(self.log_dir, self.SNAPSHOT_NAME)
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+                self.ranking.load_dict(data.get('ranking', {}))
+                self._offsets = data.get('offsets', {})
+            except (OSError, ValueError, KeyError):
+                self.ranking = MonthlyRanking()
+                self._offsets = {}
+        for name in sorted(os.listdir(self.log_dir)):
+            if not (name.startswith('events-') and name.endswith('.jsonl')):
+                continue
+            log_path = os.path.join(self.log_dir, name)
+            offset = self._offsets.get(log_path, 0)
+            counts = Counter()
+            with open(log_path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # 書きかけの行は集計しない
+                    offset += len(line)
+                    try:
+                        self._count(json.loads(line), counts)
+                    except ValueError:
+                        continue
+            self._aggregate(counts)
+            self._offsets[log_path] = offset
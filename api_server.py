@@ -0,0 +1,415 @@
+"""ヘッドレスの経路計算・最寄り避難所API
+
+Streamlitのセッションや再実行を介さずに、提携アプリやキオスク端末から
+最寄り避難所検索・複数スポットの最適化ルート・Google Mapsリンク生成を使えるようにする。
+標準ライブラリの asyncio だけで動く軽量なHTTP/1.1サーバー（keep-alive対応）。
+経路計算などの処理はスレッドプール（HITA_API_WORKERS 本、既定 4）で実行し、イベントループは止めない。
+
+エンドポイント:
+    GET  /health
+    GET  /v1/shelters/nearest?lat=33.32&lng=130.94&k=5&open_only=1&hazard=exclude|penalize
+    POST /v1/route/optimize   {"mode": "tourism"|"disaster", "origin": [lat, lng],
+                               "spots": [スポット名, ...], "travel_mode": "driving"}
+    POST /v1/maps/link        {"origin": [lat, lng], "waypoints": [[lat, lng], ...],
+                               "destination": [lat, lng], "mode": "walking"}
+    POST /v1/batch            {"requests": [{"op": "nearest"|"optimize"|"maps_link", ...}, ...]}
+
+使い方（単独起動）:
+    python api_server.py --port 8600
+Streamlitアプリ内で起動する場合は HITA_API_PORT を設定すると、
+アプリと同じメモリ上のデータ（フィードで更新される避難所の状態など）を共有する。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from route_engine import (
+    optimize_route_tourism,
+    optimize_route_disaster,
+    evaluate_route_tourism,
+    evaluate_route_disaster,
+    create_google_maps_multi_link
+)
+from cold_start import STARTUP
+from hazards import hazard_adjusted_distances, load_hazard_index
+from local_search import improve_route, PARALLEL_SEARCH_MIN_SPOTS
+from route_cache import dataset_fingerprint, route_cache_key
+from travel_time import TravelTimeModel
+
+EARTH_RADIUS_KM = 6371
+MAX_BATCH_SIZE = 1000
+MAX_BODY_BYTES = 1024 * 1024
+# 経路計算などを実行するスレッド数（イベントループは受信・送信だけを行う）
+DEFAULT_WORKERS = 4
+TRAVEL_MODES = ('driving', 'walking', 'bicycling', 'transit')
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingService:
+    """HTTP APIの処理本体（Streamlitアプリとデータを共有できる）
+
+    Args:
+        tourism_df: 観光データ
+        disaster_df: 防災データ（ShelterStatusStore.df の作成時のもの）
+        wait_forecaster: 観光ルートで到着時刻の待ち時間を予測する WaitTimeForecaster（省略可）
+        route_cache: 算出結果を共有する RouteCache（省略可、アプリと同じものを渡せば結果を相互に再利用する）
+        travel_model: 移動手段ごとの所要時間モデル（省略時は新しく作る）
+        load_governor: アプリの LoadGovernor（省略可、/health で運転モードと縮退の回数を返す）
+        hazard_index: ハザード区域の索引 HazardIndex（省略可、最寄り避難所の検索で区域内の避難所を除外・減点する）
+        shelter_store: 避難所ストア ShelterStatusStore（省略可、渡せばリクエストごとに最新の開設状況を使う）
+    """
+
+    def __init__(self, tourism_df, disaster_df, wait_forecaster=None, route_cache=None, travel_model=None,
+                 load_governor=None, hazard_index=None, shelter_store=None):
+        self.tourism_df = tourism_df
+        self._disaster_df = disaster_df
+        self.shelter_store = shelter_store
+        self.wait_forecaster = wait_forecaster
+        self.route_cache = route_cache
+        self.travel_model = travel_model or TravelTimeModel()
+        self.load_governor = load_governor
+        self._fingerprints = {'tourism': dataset_fingerprint(tourism_df),
+                              'disaster': dataset_fingerprint(disaster_df)}
+        self._tourism_index = {name: idx for idx, name in zip(tourism_df.index, tourism_df['スポット名'])}
+        self._disaster_index = {name: idx for idx, name in zip(disaster_df.index, disaster_df['スポット名'])}
+        # 避難所の座標は変わらないので、最寄り検索用にラジアンで保持しておく
+        self._shelter_lat = np.radians(disaster_df['緯度'].to_numpy(dtype=float))
+        self._shelter_lng = np.radians(disaster_df['経度'].to_numpy(dtype=float))
+        # 避難所ごとのハザード区域（座標と同じく変わらないので最初に1回だけ判定する）
+        self.hazard_index = hazard_index
+        self._shelter_hazard_levels = np.zeros(len(disaster_df), dtype=np.int32)
+        self._shelter_hazards = [[] for _ in range(len(disaster_df))]
+        if hazard_index is not None:
+            lat, lng = disaster_df['緯度'].to_numpy(dtype=float), disaster_df['経度'].to_numpy(dtype=float)
+            self._shelter_hazard_levels = hazard_index.point_levels(lat, lng)
+            self._shelter_hazards = [sorted({zone.label for zone in zones})
+                                     for zones in hazard_index.point_zones(lat, lng)]
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def disaster_df(self):
+        """防災データ（ストアがあれば最新のもの。ストアは更新のたびにデータフレームを差し替える）"""
+        return self.shelter_store.df if self.shelter_store is not None else self._disaster_df
+
+    # --- 各操作 ---
+
+    def nearest_shelters(self, lat: float, lng: float, k: int = 5, open_only: bool = False,
+                         hazard: Optional[str] = None) -> List[Dict]:
+        """現在地から近い順に避難所を返す（hazard='exclude' はハザード区域内を除外、'penalize' は危険度に応じて後ろへ）"""
+        lat_rad, lng_rad = np.radians(lat), np.radians(lng)
+        a = (np.sin((self._shelter_lat - lat_rad) / 2) ** 2
+             + np.cos(lat_rad) * np.cos(self._shelter_lat) * np.sin((self._shelter_lng - lng_rad) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        shelters = self.disaster_df  # 1回だけ読み、以降は同じ時点のデータを使う
+        statuses = shelters['状態'].to_numpy()
+        if open_only:
+            distances = np.where(statuses == '開設中', distances, np.inf)
+        ranking = distances
+        if hazard is not None:
+            ranking = hazard_adjusted_distances(distances, self._shelter_hazard_levels, hazard)
+        k = max(1, min(int(k), len(distances)))
+        nearest = np.argpartition(ranking, k - 1)[:k]
+        nearest = nearest[np.argsort(ranking[nearest])]
+        results = []
+        for pos in nearest:
+            if not np.isfinite(ranking[pos]):
+                continue
+            row = shelters.iloc[pos]
+            results.append({
+                'name': row['スポット名'],
+                'lat': float(row['緯度']),
+                'lng': float(row['経度']),
+                'distance_km': round(float(distances[pos]), 3),
+                'walk_minutes': int((distances[pos] / 4) * 60),
+                'status': row['状態'],
+                'capacity': int(row['収容人数']),
+                'hazards': self._shelter_hazards[pos],
+            })
+        return results
+
+    def optimize(self, mode: str, origin, spots: List[str], travel_mode: Optional[str] = None) -> Dict:
+        """スポット名のリストから最適化ルートを算出する"""
+        origin = _parse_point(origin, 'origin')
+        if mode == 'tourism':
+            df, index = self.tourism_df, self._tourism_index
+        elif mode == 'disaster':
+            df, index = self.disaster_df, self._disaster_index
+        else:
+            raise ValueError("mode は 'tourism' または 'disaster' を指定してください")
+        unknown = [name for name in spots if name not in index]
+        if unknown:
+            raise ValueError(f"不明なスポット: {', '.join(unknown)}")
+        selected_indices = [index[name] for name in spots]
+
+        if mode == 'tourism':
+            travel_mode = travel_mode or 'driving'
+            if travel_mode not in TRAVEL_MODES:
+                raise ValueError(f"travel_mode は {', '.join(TRAVEL_MODES)} のいずれかを指定してください")
+            travel_times = self.travel_model.travel_times(origin, df, travel_mode, self._fingerprints['tourism'])
+            wait_time_fn = None
+            wait_version = None
+            if self.wait_forecaster is not None:
+                self.wait_forecaster.refresh()
+                wait_version = self.wait_forecaster.store.version
+                wait_time_fn = lambda idx, eta: self.wait_forecaster.expected_wait(df.at[idx, 'スポット名'], eta)
+
+            def compute():
+                route, _, _ = optimize_route_tourism(origin, df, selected_indices, wait_time_fn=wait_time_fn,
+                                                     travel_times=travel_times)
+                if len(route) >= PARALLEL_SEARCH_MIN_SPOTS:
+                    route = _improved_or_greedy(origin, df, route, travel_times=travel_times,
+                                                wait_time_fn=wait_time_fn)
+                return route
+
+            # 訪問順は到着時刻の予測待ち時間で変わるので、待ち時間データと出発時刻（15分単位）もキーに含める
+            version = (self._fingerprints['tourism'], wait_version, int(time.time() // 900))
+            route = self._cached_route(mode, origin, spots, travel_mode, version, compute)
+            total_dist, total_time = evaluate_route_tourism(origin, df, route, wait_time_fn=wait_time_fn,
+                                                            travel_times=travel_times)
+        else:
+            travel_mode = 'walking'
+            travel_times = self.travel_model.travel_times(origin, df, travel_mode, self._fingerprints['disaster'])
+
+            def compute():
+                route, _, _ = optimize_route_disaster(origin, df, selected_indices)
+                if len(route) >= PARALLEL_SEARCH_MIN_SPOTS:
+                    route = _improved_or_greedy(origin, df, route)
+                return route
+
+            route = self._cached_route(mode, origin, spots, travel_mode, self._fingerprints['disaster'], compute)
+            total_dist, total_time = evaluate_route_disaster(origin, df, route, travel_times=travel_times)
+
+        return {
+            'route': [df.at[idx, 'スポット名'] for idx in route],
+            'total_distance_km': round(total_dist, 3),
+            'total_time_minutes': round(total_time, 1),
+            'travel_mode': travel_mode,
+            'maps_url': route_maps_url(origin, df, route, travel_mode),
+        }
+
+    def _cached_route(self, mode, origin, spots, travel_mode, version, compute) -> List[int]:
+        if self.route_cache is None:
+            return compute()
+        key = route_cache_key(mode, origin, spots, travel_mode, version)
+        route, _ = self.route_cache.get_or_compute(key, compute)
+        return route
+
+    def maps_link(self, origin, destination, waypoints=None, mode: str = 'driving') -> Dict:
+        origin = _parse_point(origin, 'origin')
+        destination = _parse_point(destination, 'destination')
+        waypoints = [_parse_point(p, 'waypoints') for p in (waypoints or [])]
+        if mode not in TRAVEL_MODES:
+            raise ValueError(f"mode は {', '.join(TRAVEL_MODES)} のいずれかを指定してください")
+        return {'url': create_google_maps_multi_link(origin, waypoints, destination, mode)}
+
+    def run_op(self, request: Dict) -> Dict:
+        """バッチ内の1件を処理する"""
+        if not isinstance(request, dict):
+            raise ValueError("リクエストはJSONオブジェクトで指定してください")
+        op = request.get('op')
+        if op == 'nearest':
+            return {'shelters': self.nearest_shelters(
+                float(request['lat']), float(request['lng']),
+                int(request.get('k', 5)), bool(request.get('open_only', False)), request.get('hazard'))}
+        if op == 'optimize':
+            return self.optimize(request.get('mode', 'tourism'), request.get('origin'),
+                                 list(request.get('spots', [])), request.get('travel_mode'))
+        if op == 'maps_link':
+            return self.maps_link(request.get('origin'), request.get('destination'),
+                                  request.get('waypoints'), request.get('mode', 'driving'))
+        raise ValueError(f"不明な op: {op}")
+
+    # --- HTTPのルーティング ---
+
+    def handle(self, method: str, target: str, body: bytes) -> Tuple[int, Dict]:
+        with self._count_lock:
+            self.request_count += 1
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise ValueError("リクエストの本文はJSONオブジェクトで指定してください")
+            if method == 'GET' and url.path == '/health':
+                health = {'status': 'ok', 'requests': self.request_count}
+                if self.route_cache is not None:
+                    health['route_cache'] = self.route_cache.stats()
+                if self.load_governor is not None:
+                    health['load'] = self.load_governor.metrics()
+                health['startup'] = STARTUP.metrics()
+                health['hazard_zones'] = len(self.hazard_index) if self.hazard_index is not None else 0
+                return 200, health
+            if method == 'GET' and url.path == '/v1/shelters/nearest':
+                return 200, {'shelters': self.nearest_shelters(
+                    float(query['lat']), float(query['lng']),
+                    int(query.get('k', 5)), query.get('open_only') in ('1', 'true'), query.get('hazard'))}
+            if method == 'POST' and url.path == '/v1/route/optimize':
+                return 200, self.run_op(dict(payload, op='optimize'))
+            if method == 'POST' and url.path == '/v1/maps/link':
+                return 200, self.run_op(dict(payload, op='maps_link'))
+            if method == 'POST' and url.path == '/v1/batch':
+                requests = payload.get('requests', [])
+                if not isinstance(requests, list) or not all(isinstance(r, dict) for r in requests):
+                    raise ValueError("requests はJSONオブジェクトのリストで指定してください")
+                if len(requests) > MAX_BATCH_SIZE:
+                    return 413, {'error': f"1回のバッチは{MAX_BATCH_SIZE}件までです"}
+                return 200, {'results': [self._run_op_safely(r) for r in requests]}
+            return 404, {'error': 'not found'}
+        except (KeyError, ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            # 想定外のエラーでもクライアントには必ず応答を返す
+            logger.exception("APIリクエストの処理に失敗しました: %s %s", method, target)
+            return 500, {'error': f"internal error: {type(e).__name__}"}
+
+    def _run_op_safely(self, request: Dict) -> Dict:
+        try:
+            return {'ok': True, 'result': self.run_op(request)}
+        except (KeyError, ValueError, TypeError) as e:
+            return {'ok': False, 'error': str(e)}
+        except Exception as e:
+            logger.exception("バッチ内のリクエストの処理に失敗しました")
+            return {'ok': False, 'error': f"internal error: {type(e).__name__}"}
+
+
+def _improved_or_greedy(origin, df, route: List[int], travel_times=None, wait_time_fn=None) -> List[int]:
+    """局所探索で訪問順を改善する（失敗した場合は貪欲法の訪問順をそのまま返す）"""
+    try:
+        improved, _ = improve_route(origin, df, route, seed=0, travel_times=travel_times,
+                                    wait_time_fn=wait_time_fn)
+    except Exception:
+        logger.exception("訪問順の改善に失敗しました（貪欲法の訪問順を返します）")
+        return route
+    return improved
+
+
+def _parse_point(value, name: str) -> List[float]:
+    try:
+        lat, lng = float(value[0]), float(value[1])
+    except (TypeError, ValueError, IndexError):
+        raise ValueError(f"{name} は [緯度, 経度] で指定してください")
+    return [lat, lng]
+
+
+def route_maps_url(origin, spots_df, route: List[int], mode: str) -> Optional[str]:
+    """訪問順のインデックスから複数経由地のGoogle Mapsリンクを作る"""
+    if not route:
+        return None
+    points = [(spots_df.at[idx, '緯度'], spots_df.at[idx, '経度']) for idx in route]
+    return create_google_maps_multi_link(origin, points[:-1], points[-1], mode)
+
+
+# --- asyncio によるHTTPサーバー ---
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+async def _handle_connection(service: RoutingService, executor: ThreadPoolExecutor,
+                             reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            lines = head.decode('latin-1').split('\r\n')
+            try:
+                method, target, version = lines[0].split(' ', 2)
+            except ValueError:
+                break
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0) or 0)
+            if length > MAX_BODY_BYTES:
+                status, payload, body = 413, {'error': 'request body too large'}, b''
+            else:
+                body = await reader.readexactly(length) if length else b''
+                if urlsplit(target).path == '/health':
+                    # 軽い処理なので、経路計算で実行スレッドが埋まっていてもすぐに返す
+                    status, payload = service.handle(method, target, body)
+                else:
+                    status, payload = await loop.run_in_executor(executor, service.handle, method, target, body)
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            keep_alive = (headers.get('connection', '').lower() != 'close'
+                          and version == 'HTTP/1.1' and status != 413)
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+async def serve(service: RoutingService, host: str = '127.0.0.1', port: int = 8600,
+                workers: Optional[int] = None):
+    """APIサーバーを起動する（workers は経路計算などを実行するスレッド数。省略時は HITA_API_WORKERS）"""
+    workers = workers or int(os.environ.get('HITA_API_WORKERS', DEFAULT_WORKERS))
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='routing-api-worker')
+    server = await asyncio.start_server(
+        lambda r, w: _handle_connection(service, executor, r, w), host, port, limit=MAX_BODY_BYTES
+    )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def start_in_thread(service: RoutingService, host: str = '127.0.0.1', port: int = 8600) -> threading.Thread:
+    """別スレッドのイベントループでAPIサーバーを起動する（Streamlitアプリへの組み込み用）"""
+    thread = threading.Thread(target=lambda: asyncio.run(serve(service, host, port)),
+                              name="routing-api", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    from shelter_feed import ShelterStatusStore, FeedIngestor, feed_source_from_env
+    from route_cache import RouteCache
+    from spots_data import load_spots_frames
+
+    parser = argparse.ArgumentParser(description="日田なび 経路計算・最寄り避難所API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--spots', default='spots.xlsx')
+    parser.add_argument('--workers', type=int, help=f"経路計算のスレッド数（既定 {DEFAULT_WORKERS}）")
+    args = parser.parse_args()
+
+    tourism_df, disaster_df = load_spots_frames(args.spots)
+    store = ShelterStatusStore(disaster_df)
+    source = feed_source_from_env()
+    if source is not None:
+        FeedIngestor(store, source).start()
+    hazard_index, hazard_error = load_hazard_index()
+    if hazard_error:
+        print(f"ハザード区域: {hazard_error}")
+    service = RoutingService(tourism_df, store.df, route_cache=RouteCache(), hazard_index=hazard_index,
+                             shelter_store=store)
+    STARTUP.mark('ready')
+    print(f"routing API: http://{args.host}:{args.port}")
+    asyncio.run(serve(service, args.host, args.port, args.workers))
+
+
+if __name__ == '__main__':
+    main()
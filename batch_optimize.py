@@ -0,0 +1,234 @@
+"""最適化ルートのバッチ計算CLI
+
+観光バス1台ごと・地区ごとの避難順序など、多数の行程をまとめて計算する。
+入力（CSV または JSONL）の各行を、プロセスプールで並列に解いて JSONL で順次出力し、
+最後に処理件数と1秒あたりの処理数を表示する。
+スポット間の距離行列と移動手段ごとの所要時間行列は親プロセスで1回だけ計算して
+共有メモリに置き、各ワーカーはコピーせずに参照する。
+
+入力の列（CSV）/ キー（JSONL）:
+    id          行程の識別子（省略時は行番号）
+    origin      出発地 "緯度,経度"（または origin_lat / origin_lng の2列）
+    spots       訪問スポット名（CSVでは "|" 区切り、JSONLではリスト）
+    mode        tourism / disaster（観光 / 防災）
+    start_time  出発時刻 ISO 8601（省略時は現在時刻）
+    travel_mode driving / walking / bicycling / transit（省略時は mode に応じた既定値）
+
+使い方:
+    python batch_optimize.py itineraries.csv --workers 8 --out results.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from distance_matrix import SharedMatrix, spots_matrix
+from route_engine import optimize_route_tourism, optimize_route_disaster, create_google_maps_multi_link
+from route_cache import dataset_fingerprint
+from spots_data import load_spots_frames
+from travel_time import TravelTimeModel, TRAVEL_PROFILES
+
+MODE_ALIASES = {'tourism': 'tourism', '観光': 'tourism', 'disaster': 'disaster', '防災': 'disaster'}
+
+# ワーカープロセスごとの状態（initializer で設定する）
+_worker = {}
+
+
+def read_jobs(path: str) -> Iterator[Dict]:
+    """CSV / JSONL から行程を読み込む（拡張子で判定、"-" は標準入力のJSONL）
+
+    JSONL の読めない行は止めずに、エラーとして結果に出力する行程（'_error'）にする。
+    """
+    if path == '-' or path.endswith(('.jsonl', '.ndjson')):
+        f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        with f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    job = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield {'id': line_no, '_error': f"JSONとして読めません: {e}"}
+                    continue
+                if not isinstance(job, dict):
+                    yield {'id': line_no, '_error': "行程はJSONオブジェクトで指定してください"}
+                    continue
+                job.setdefault('id', line_no)
+                yield job
+        return
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for line_no, row in enumerate(csv.DictReader(f), 1):
+            job = {k: v for k, v in row.items() if v not in (None, '')}
+            if 'spots' in job:
+                job['spots'] = [name.strip() for name in job['spots'].split('|') if name.strip()]
+            job.setdefault('id', line_no)
+            yield job
+
+
+def _init_worker(tourism_df, disaster_df, tourism_handle, disaster_handle, travel_model, time_handles, versions):
+    _worker['frames'] = {'tourism': tourism_df, 'disaster': disaster_df}
+    # データのバージョン（所要時間モデルのキャッシュのキー。行程ごとにデータを走査しない）
+    _worker['versions'] = versions
+    _worker['matrices'] = {
+        'tourism': SharedMatrix.attach(tourism_handle),
+        'disaster': SharedMatrix.attach(disaster_handle),
+    }
+    _worker['travel_model'] = travel_model
+    # (mode, 移動手段) → 所要時間行列
+    _worker['time_matrices'] = {key: SharedMatrix.attach(handle) for key, handle in time_handles.items()}
+    _worker['index'] = {
+        mode: {name: pos for pos, name in enumerate(df['スポット名'])}
+        for mode, df in _worker['frames'].items()
+    }
+
+
+def _parse_origin(job: Dict) -> List[float]:
+    if 'origin' in job:
+        origin = job['origin']
+        if isinstance(origin, str):
+            origin = origin.split(',')
+        return [float(origin[0]), float(origin[1])]
+    return [float(job['origin_lat']), float(job['origin_lng'])]
+
+
+def solve_job(job: Dict) -> Dict:
+    """1件の行程を解く（ワーカープロセス内で実行）"""
+    result = {'id': job.get('id')}
+    if '_error' in job:
+        result['error'] = job['_error']
+        return result
+    try:
+        mode = MODE_ALIASES.get(str(job.get('mode', 'tourism')))
+        if mode is None:
+            raise ValueError(f"不明な mode: {job.get('mode')}")
+        df = _worker['frames'][mode]
+        index = _worker['index'][mode]
+        matrix = _worker['matrices'][mode].array
+        origin = _parse_origin(job)
+        spots = job.get('spots') or []
+        unknown = [name for name in spots if name not in index]
+        if unknown:
+            raise ValueError(f"不明なスポット: {', '.join(unknown)}")
+        selected = [index[name] for name in spots]
+        start_time = datetime.fromisoformat(job['start_time']) if job.get('start_time') else datetime.now()
+
+        travel_mode = job.get('travel_mode', 'driving' if mode == 'tourism' else 'walking')
+        if (mode, travel_mode) not in _worker['time_matrices']:
+            raise ValueError(f"不明な travel_mode: {travel_mode}")
+        travel_times = (_worker['travel_model'].origin_times(origin, df, travel_mode,
+                                                             version=_worker['versions'][mode]),
+                        _worker['time_matrices'][(mode, travel_mode)].array)
+
+        if mode == 'tourism':
+            route, total_dist, total_time = optimize_route_tourism(
+                origin, df, selected, start_time=start_time, dist_matrix=matrix, travel_times=travel_times)
+        else:
+            route, total_dist, total_time = optimize_route_disaster(
+                origin, df, selected, dist_matrix=matrix, travel_times=travel_times)
+
+        points = [(float(df.iloc[pos]['緯度']), float(df.iloc[pos]['経度'])) for pos in route]
+        result.update({
+            'mode': mode,
+            'route': [df.iloc[pos]['スポット名'] for pos in route],
+            'total_distance_km': round(float(total_dist), 3),
+            'total_time_minutes': round(float(total_time), 1),
+            'start_time': start_time.isoformat(timespec='minutes'),
+            'end_time': (start_time + timedelta(minutes=float(total_time))).isoformat(timespec='minutes'),
+            'maps_url': create_google_maps_multi_link(origin, points[:-1], points[-1], travel_mode) if points else None,
+        })
+    except (KeyError, ValueError, TypeError, IndexError) as e:
+        result['error'] = str(e)
+    return result
+
+
+def solve_chunk(jobs: List[Dict]) -> List[Dict]:
+    return [solve_job(job) for job in jobs]
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(jobs, out, workers: int, chunk_size: int = 16, spots_path: str = 'spots.xlsx') -> Dict:
+    """行程を並列に解き、完了した順に out へJSONLで書き出す"""
+    tourism_df, disaster_df = load_spots_frames(spots_path)
+    shared = {
+        'tourism': SharedMatrix.create(spots_matrix(tourism_df)),
+        'disaster': SharedMatrix.create(spots_matrix(disaster_df)),
+    }
+    travel_model = TravelTimeModel()
+    versions = {'tourism': dataset_fingerprint(tourism_df), 'disaster': dataset_fingerprint(disaster_df)}
+    for travel_mode in TRAVEL_PROFILES:
+        for mode, df in (('tourism', tourism_df), ('disaster', disaster_df)):
+            shared[(mode, travel_mode)] = SharedMatrix.create(travel_model.matrix(df, travel_mode, versions[mode]))
+    time_handles = {key: matrix.handle for key, matrix in shared.items() if isinstance(key, tuple)}
+    count = errors = 0
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(tourism_df, disaster_df, shared['tourism'].handle, shared['disaster'].handle,
+                      travel_model, time_handles, versions)
+        ) as executor:
+            # 投入数を制限して、大きな入力でもメモリに全件を載せない
+            pending = set()
+            for chunk in _chunks(jobs, chunk_size):
+                pending.add(executor.submit(solve_chunk, chunk))
+                if len(pending) >= workers * 4:
+                    done = next(as_completed(pending))
+                    pending.remove(done)
+                    count, errors = _write_results(done.result(), out, count, errors)
+            for done in as_completed(pending):
+                count, errors = _write_results(done.result(), out, count, errors)
+    finally:
+        for matrix in shared.values():
+            matrix.close()
+    elapsed = time.perf_counter() - started
+    return {'count': count, 'errors': errors, 'seconds': elapsed,
+            'per_second': count / elapsed if elapsed > 0 else 0.0}
+
+
+def _write_results(results, out, count, errors):
+    for result in results:
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        count += 1
+        errors += 'error' in result
+    out.flush()
+    return count, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="最適化ルートのバッチ計算")
+    parser.add_argument('input', help="CSV または JSONL（- で標準入力のJSONL）")
+    parser.add_argument('--out', default='-', help="出力先JSONL（既定は標準出力）")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=16)
+    parser.add_argument('--spots', default='spots.xlsx')
+    args = parser.parse_args()
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w', encoding='utf-8')
+    try:
+        stats = run_batch(read_jobs(args.input), out, args.workers, args.chunk_size, args.spots)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{stats['count']}件（エラー {stats['errors']}件）を {stats['seconds']:.2f}秒で処理 "
+          f"— {stats['per_second']:.1f}件/秒（workers={args.workers}）", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
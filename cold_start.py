@@ -0,0 +1,53 @@
+"""起動時間（コールドスタート）の計測
+
+オートスケールで新しいコンテナが起動してから、最初の利用者に画面が表示されるまでの時間を記録する。
+プロセスの起動時刻（Linux では /proc から取得）を起点に、
+「モジュールの読み込み完了」「初回の画面表示の完了」などの時点を1回ずつ記録し、
+ヘッドレスAPIの /health と tools/measure_cold_start.py から参照する。
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+def process_start_time() -> float:
+    """このプロセスの起動時刻（UNIX時刻）。/proc が無い環境ではこのモジュールの読み込み時刻"""
+    try:
+        with open('/proc/self/stat') as f:
+            # 2番目の項目（コマンド名）は空白を含み得るので、閉じ括弧より後ろを分割する
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        started_ticks = int(fields[19])
+        return time.time() - uptime + started_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class StartupTimer:
+    """プロセスの起動から各時点までの経過秒数を記録する（各時点は最初の1回だけ記録）"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else process_start_time()
+        self._marks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name: str) -> float:
+        """時点を記録し、起動からの経過秒数を返す（記録済みならその値）"""
+        with self._lock:
+            if name not in self._marks:
+                self._marks[name] = time.time() - self.started_at
+            return self._marks[name]
+
+    def seconds(self, name: str) -> Optional[float]:
+        with self._lock:
+            return self._marks.get(name)
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: round(seconds, 3) for name, seconds in self._marks.items()}
+
+
+# プロセス全体で1つ（Streamlitの再実行ではモジュールが読み込み直されないので値は保たれる）
+STARTUP = StartupTimer()
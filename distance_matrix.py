@@ -0,0 +1,82 @@
+"""スポット間の距離行列と共有メモリのモジュール
+
+スポット間の距離（km）を numpy でまとめて計算しておき、最適化ルートの計算中は
+表引きで済ませる。バッチ処理ではプロセスごとにコピーせず、
+multiprocessing.shared_memory に1つだけ置いて各ワーカーから参照する。
+"""
+from multiprocessing import shared_memory
+from typing import Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_matrix(lat, lng, dtype=np.float64) -> np.ndarray:
+    """全スポット間の距離行列（km）を返す（calculate_distance と同じ式）"""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return (2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).astype(dtype)
+
+
+def origin_distances(origin, lat, lng) -> np.ndarray:
+    """1地点から全スポットへの距離（km）"""
+    lat0, lng0 = np.radians(origin[0]), np.radians(origin[1])
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lng - lng0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def cross_distances(from_lat, from_lng, to_lat, to_lng) -> np.ndarray:
+    """複数の地点から全スポットへの距離行列（km、地点数 × スポット数）"""
+    from_lat = np.radians(np.asarray(from_lat, dtype=np.float64))[:, None]
+    from_lng = np.radians(np.asarray(from_lng, dtype=np.float64))[:, None]
+    to_lat = np.radians(np.asarray(to_lat, dtype=np.float64))[None, :]
+    to_lng = np.radians(np.asarray(to_lng, dtype=np.float64))[None, :]
+    a = (np.sin((to_lat - from_lat) / 2) ** 2
+         + np.cos(from_lat) * np.cos(to_lat) * np.sin((to_lng - from_lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def spots_matrix(spots_df, dtype=np.float64) -> np.ndarray:
+    """データフレームの行順（iloc の位置）に対応した距離行列"""
+    return haversine_matrix(spots_df['緯度'].to_numpy(), spots_df['経度'].to_numpy(), dtype)
+
+
+class SharedMatrix:
+    """共有メモリ上の距離行列
+
+    親プロセスで create() し、ワーカーには handle（名前・形状・型）だけを渡して attach() する。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype, owner: bool):
+        self._shm = shm
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.owner = owner
+
+    @classmethod
+    def create(cls, matrix: np.ndarray) -> 'SharedMatrix':
+        shm = shared_memory.SharedMemory(create=True, size=max(1, matrix.nbytes))
+        shared = cls(shm, matrix.shape, matrix.dtype, owner=True)
+        shared.array[...] = matrix
+        return shared
+
+    @classmethod
+    def attach(cls, handle) -> 'SharedMatrix':
+        name, shape, dtype = handle
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, tuple(shape), np.dtype(dtype), owner=False)
+
+    @property
+    def handle(self):
+        return self._shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        self.array = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
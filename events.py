@@ -0,0 +1,349 @@
+"""イベントカレンダー（開催期間の区間木と会場の空間索引）
+
+イベントを開催期間の区間木と会場座標のグリッドに登録し、
+「滞在期間中に開催されるイベント」「このスポットの近くのイベント」を問い合わせられるようにする。
+複数の月にまたがるイベント（千年あかり 10月下旬～11月中旬 など）も1件として扱う。
+
+読み込み元（先に見つかったもの）:
+    HITA_EVENTS_PATH のCSV（既定 events.csv） → spots.xlsx の「イベント」シート → 組み込みの年間イベント
+列: イベント名・開始日・終了日（必須）、開催時期・内容・会場・緯度・経度（任意）
+開始日・終了日は毎年開催なら「MM-DD」、その年だけなら「YYYY-MM-DD」。
+曜日で決まる日程（第4土曜・日曜 など）は、その曜日が入り得る期間を登録し、開催時期に表示用の文言を書く。
+
+Streamlitには依存しない。
+"""
+import bisect
+import csv
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from distance_matrix import origin_distances
+from spots_data import SPOTS_PATH, ingest_workbook
+
+EVENTS_PATH = 'events.csv'
+EVENTS_SHEET = 'イベント'
+REQUIRED_COLUMNS = ['イベント名', '開始日', '終了日']
+
+# 毎年開催のイベントを当てはめる基準年（2月29日を含むうるう年）
+_REFERENCE_YEAR = 2000
+# 空間索引のグリッドの大きさ（度、約1km）
+GRID_CELL_DEG = 0.01
+
+# 組み込みの年間イベント（イベント名, 開始日, 終了日, 開催時期, 内容, 会場, 緯度, 経度）。座標は会場のおおよその位置
+DEFAULT_EVENTS = [
+    ("天領日田おひなまつり", "02-15", "03-31", "2月中旬～3月下旬", "豆田町一帯で雛人形を展示する春の風物詩",
+     "豆田町", 33.3256, 130.9394),
+    ("おおやま梅まつり", "03-01", "03-20", "3月上旬～中旬", "約6,000本の梅が咲き誇る梅園での祭り",
+     "大山町", 33.2530, 130.9290),
+    ("亀山公園桜まつり", "03-25", "04-10", "3月下旬～4月上旬", "約1,000本の桜が咲く日田市を代表する桜の名所",
+     "亀山公園", 33.3172, 130.9389),
+    ("日田川開き観光祭", "05-22", "05-28", "5月第4土曜・日曜", "九州最大級の花火大会を含む日田最大の祭り",
+     "三隈川", 33.3183, 130.9325),
+    ("あまがせの夏まつり", "06-21", "06-30", "6月下旬", "天ヶ瀬温泉街で開催される夏の祭り",
+     "天ヶ瀬温泉", 33.2960, 131.0670),
+    ("日田祇園祭", "07-22", "07-28", "7月第4土曜・日曜", "300年以上の歴史を持つユネスコ無形文化遺産の祭り",
+     "豆田町・隈町", 33.3219, 130.9414),
+    ("天ヶ瀬おもてなし花火", "08-11", "08-20", "8月中旬", "天ヶ瀬温泉街で開催される花火大会",
+     "天ヶ瀬温泉", 33.2960, 131.0670),
+    ("日田市民音楽祭", "09-11", "09-20", "9月中旬", "日田市で開催される音楽イベント",
+     "パトリア日田", 33.3194, 130.9410),
+    ("小鹿田焼民陶祭", "10-08", "10-14", "10月第2土曜・日曜", "伝統工芸の小鹿田焼の窯元を巡るイベント",
+     "小鹿田焼の里", 33.3930, 130.9600),
+    ("日田天領まつり", "10-15", "10-21", "10月第3土曜・日曜", "西国筋郡代着任行列や時代絵巻パレードが見どころ",
+     "豆田町", 33.3256, 130.9394),
+    ("千年あかり", "10-21", "11-20", "10月下旬～11月中旬", "豆田町と花月川周辺で竹灯籠を灯すイベント",
+     "豆田町・花月川", 33.3270, 130.9400),
+    ("大山ダム湖畔周遊ウォーキング", "12-01", "12-10", "12月上旬", "大山ダム周辺を歩くウォーキングイベント",
+     "大山ダム", 33.2890, 130.9260),
+]
+
+
+@dataclass(frozen=True)
+class Event:
+    """1件のイベント（year が None なら毎年開催）"""
+    name: str
+    start: Tuple[int, int]  # (月, 日)
+    end: Tuple[int, int]
+    year: Optional[int] = None
+    period: str = ''
+    description: str = ''
+    venue: str = ''
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+
+    @property
+    def has_location(self) -> bool:
+        return self.lat is not None and self.lng is not None
+
+    @property
+    def period_text(self) -> str:
+        """表示用の開催時期（未設定なら日付から作る）"""
+        if self.period:
+            return self.period
+        prefix = f"{self.year}年" if self.year else ""
+        return f"{prefix}{self.start[0]}月{self.start[1]}日～{self.end[0]}月{self.end[1]}日"
+
+    def dates_in(self, year: int) -> Tuple[date, date]:
+        """指定した年に始まる回の開始日・終了日（年をまたぐ場合は終了日が翌年）"""
+        start = date(year, *self.start)
+        end_year = year + 1 if self.end < self.start else year
+        return start, date(end_year, *self.end)
+
+
+def parse_event_date(value) -> Tuple[Optional[int], int, int]:
+    """'MM-DD'・'M/D'・'YYYY-MM-DD'・日付型の値を (年 or None, 月, 日) に変換する"""
+    if isinstance(value, (datetime, date, pd.Timestamp)):
+        return value.year, value.month, value.day
+    text = str(value).strip().replace('/', '-').replace('.', '-')
+    parts = text.split('-')
+    try:
+        numbers = [int(p) for p in parts]
+    except ValueError:
+        raise ValueError(f"日付を解釈できません: {value}")
+    if len(numbers) == 2:
+        year, month, day = None, numbers[0], numbers[1]
+    elif len(numbers) == 3:
+        year, month, day = numbers
+    else:
+        raise ValueError(f"日付を解釈できません: {value}")
+    # 存在する日付か確認する（毎年開催は2月29日も許す）
+    date(year or _REFERENCE_YEAR, month, day)
+    return year, month, day
+
+
+def _optional_float(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def _optional_text(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return str(value).strip()
+
+
+def events_from_records(records: Iterable[Dict]) -> List[Event]:
+    """表の行（列名 → 値）からイベントを作る
+
+    Raises:
+        ValueError: 必須の列がない・日付を解釈できない場合
+    """
+    events = []
+    for i, record in enumerate(records, 1):
+        missing = [col for col in REQUIRED_COLUMNS if col not in record]
+        if missing:
+            raise ValueError(f"イベントデータに'{missing[0]}'カラムがありません")
+        name = _optional_text(record['イベント名'])
+        if not name:
+            continue
+        try:
+            start_year, *start = parse_event_date(record['開始日'])
+            end_year, *end = parse_event_date(record['終了日'])
+        except ValueError as e:
+            raise ValueError(f"イベント「{name}」（{i}行目）: {e}")
+        if (start_year is None) != (end_year is None):
+            raise ValueError(f"イベント「{name}」（{i}行目）: 開始日と終了日は両方とも年を付けるか、両方とも省略してください")
+        if start_year is not None and not (
+                (end_year == start_year and end >= start) or (end_year == start_year + 1 and end < start)):
+            raise ValueError(f"イベント「{name}」（{i}行目）: 終了日は開始日から1年未満の日付にしてください")
+        events.append(Event(
+            name=name, start=tuple(start), end=tuple(end), year=start_year,
+            period=_optional_text(record.get('開催時期')),
+            description=_optional_text(record.get('内容')),
+            venue=_optional_text(record.get('会場')),
+            lat=_optional_float(record.get('緯度')), lng=_optional_float(record.get('経度')),
+        ))
+    return events
+
+
+def default_events() -> List[Event]:
+    columns = ['イベント名', '開始日', '終了日', '開催時期', '内容', '会場', '緯度', '経度']
+    return events_from_records(dict(zip(columns, row)) for row in DEFAULT_EVENTS)
+
+
+def load_events(path: Optional[str] = None, workbook: str = SPOTS_PATH,
+                sheet: Optional[pd.DataFrame] = None) -> List[Event]:
+    """CSV → spots.xlsx の「イベント」シート → 組み込みデータ の順にイベントを読み込む
+
+    sheet にスポットデータと一緒に読み込み済みの「イベント」シートを渡すと、ワークブックを開き直さない。
+    """
+    path = path if path is not None else os.environ.get('HITA_EVENTS_PATH', EVENTS_PATH)
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            return events_from_records(csv.DictReader(f))
+    if sheet is None and workbook and os.path.exists(workbook):
+        sheet = ingest_workbook(workbook, sheets=(EVENTS_SHEET,))[0].get(EVENTS_SHEET)
+    if sheet is not None:
+        return events_from_records(sheet.to_dict('records'))
+    return default_events()
+
+
+class IntervalTree:
+    """閉区間 [start, end] の区間木（中心点で分割する静的な木）
+
+    Args:
+        intervals: (start, end, value) のリスト（start <= end の整数）
+    """
+
+    def __init__(self, intervals: List[Tuple[int, int, object]]):
+        self.size = len(intervals)
+        self._root = self._build(list(intervals))
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        points = sorted(p for start, end, _ in intervals for p in (start, end))
+        center = points[len(points) // 2]
+        left = [iv for iv in intervals if iv[1] < center]
+        right = [iv for iv in intervals if iv[0] > center]
+        middle = [iv for iv in intervals if iv[0] <= center <= iv[1]]
+        by_start = sorted(middle, key=lambda iv: iv[0])
+        by_end = sorted(middle, key=lambda iv: iv[1])
+        return {
+            'center': center,
+            'starts': [iv[0] for iv in by_start], 'by_start': by_start,
+            'ends': [iv[1] for iv in by_end], 'by_end': by_end,
+            'left': self._build(left), 'right': self._build(right),
+        }
+
+    def overlap(self, lo: int, hi: int) -> List[object]:
+        """[lo, hi] と重なる区間の値"""
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if hi < node['center']:
+                # 中心より左側の問い合わせ: 中心を含む区間のうち start <= hi のもの
+                found.extend(iv[2] for iv in node['by_start'][:bisect.bisect_right(node['starts'], hi)])
+                stack.append(node['left'])
+            elif lo > node['center']:
+                # 中心より右側の問い合わせ: 中心を含む区間のうち end >= lo のもの
+                found.extend(iv[2] for iv in node['by_end'][bisect.bisect_left(node['ends'], lo):])
+                stack.append(node['right'])
+            else:
+                found.extend(iv[2] for iv in node['by_start'])
+                stack.append(node['left'])
+                stack.append(node['right'])
+        return found
+
+
+class EventCalendar:
+    """開催期間（区間木）と会場（グリッド）で索引を付けたイベント
+
+    毎年開催のイベントは基準年の通し日で、その年だけのイベントは日付の通し番号で別の木に登録する。
+    年をまたぐ毎年開催のイベント（12月～1月など）は年末までと年始からの2つの区間に分ける。
+    """
+
+    def __init__(self, events: List[Event]):
+        self.events = list(events)
+        recurring, dated = [], []
+        for i, event in enumerate(self.events):
+            if event.year is None:
+                start = self._day_of_year(event.start)
+                end = self._day_of_year(event.end)
+                if end >= start:
+                    recurring.append((start, end, i))
+                else:
+                    recurring.append((start, self._day_of_year((12, 31)), i))
+                    recurring.append((self._day_of_year((1, 1)), end, i))
+            else:
+                start, end = event.dates_in(event.year)
+                dated.append((start.toordinal(), end.toordinal(), i))
+        self._recurring = IntervalTree(recurring)
+        self._dated = IntervalTree(dated)
+        self._grid: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for i, event in enumerate(self.events):
+            if event.has_location:
+                self._grid[self._cell(event.lat, event.lng)].append(i)
+
+    def __len__(self):
+        return len(self.events)
+
+    @staticmethod
+    def _day_of_year(month_day: Tuple[int, int]) -> int:
+        return date(_REFERENCE_YEAR, *month_day).timetuple().tm_yday
+
+    @staticmethod
+    def _cell(lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / GRID_CELL_DEG)), int(math.floor(lng / GRID_CELL_DEG))
+
+    def _recurring_ranges(self, start: date, end: date) -> List[Tuple[int, int]]:
+        """期間を基準年の通し日の区間に変換する（年をまたぐ場合は分割し、1年以上なら全体）"""
+        if (end - start).days >= 365:
+            return [(1, 366)]
+        lo = self._day_of_year((start.month, start.day))
+        hi = self._day_of_year((end.month, end.day))
+        if start.year == end.year:
+            return [(lo, hi)]
+        return [(lo, 366), (1, hi)]
+
+    def _sorted(self, indices, start: Optional[date] = None) -> List[Event]:
+        def key(i):
+            event = self.events[i]
+            if event.year is not None:
+                return event.dates_in(event.year)[0]
+            # 毎年開催は、期間の開始日以降で最初に始まる回の順にする（開催中のものは開始日が前の年になる）
+            base = start or date(_REFERENCE_YEAR, 1, 1)
+            first = date(base.year, *event.start) if event.start != (2, 29) else date(base.year, 3, 1)
+            if event.end < event.start and (base.month, base.day) <= event.end:
+                first = first.replace(year=base.year - 1)
+            return first
+        return [self.events[i] for i in sorted(indices, key=key)]
+
+    def _between_indices(self, start: date, end: date) -> set:
+        indices = set(self._dated.overlap(start.toordinal(), end.toordinal()))
+        for lo, hi in self._recurring_ranges(start, end):
+            indices.update(self._recurring.overlap(lo, hi))
+        return indices
+
+    def between(self, start: date, end: date) -> List[Event]:
+        """期間 [start, end] に開催されるイベント（開始の早い順）"""
+        if end < start:
+            start, end = end, start
+        return self._sorted(self._between_indices(start, end), start)
+
+    def in_month(self, month: int, year: Optional[int] = None) -> List[Event]:
+        """指定した月に開催されるイベント"""
+        year = year or date.today().year
+        first = date(year, month, 1)
+        last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        return self.between(first, last)
+
+    def near(self, lat: float, lng: float, radius_km: float,
+             start: Optional[date] = None, end: Optional[date] = None) -> List[Tuple[Event, float]]:
+        """地点から radius_km 以内で開催されるイベントと距離（km、近い順）。期間を指定すると絞り込む"""
+        # 緯度1度は約111km、経度1度は緯度に応じて短くなる
+        lat_cells = int(math.ceil(radius_km / (111.0 * GRID_CELL_DEG)))
+        lng_cells = int(math.ceil(radius_km / (111.0 * math.cos(math.radians(lat)) * GRID_CELL_DEG)))
+        row, col = self._cell(lat, lng)
+        candidates = [i for r in range(row - lat_cells, row + lat_cells + 1)
+                      for c in range(col - lng_cells, col + lng_cells + 1)
+                      for i in self._grid.get((r, c), ())]
+        if start is not None:
+            end = end or start
+            in_period = self._between_indices(min(start, end), max(start, end))
+            candidates = [i for i in candidates if i in in_period]
+        if not candidates:
+            return []
+        distances = origin_distances((lat, lng), [self.events[i].lat for i in candidates],
+                                     [self.events[i].lng for i in candidates])
+        found = [(self.events[i], float(d)) for i, d in zip(candidates, distances) if d <= radius_km]
+        return sorted(found, key=lambda item: item[1])
+
+    def prompt_lines(self, start: date, end: date) -> str:
+        """Geminiのプロンプトに埋め込むイベント一覧（該当がなければ「なし」）"""
+        events = self.between(start, end)
+        if not events:
+            return "なし"
+        return "\n".join(f"- {e.name}（{e.period_text}、{e.venue or '日田市内'}）: {e.description}" for e in events)
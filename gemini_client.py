@@ -0,0 +1,262 @@
+"""Gemini API（generateContent）のクライアント管理
+
+APIキーごとのクライアントをプロセス内で使い回し、キーごと・全体の同時実行数とリクエスト頻度
+（トークンバケット）を制限する。429 / 5xx と接続の拒否・切断は回数を決めて待ち時間を伸ばしながら再試行する。
+タイムアウトは再試行しない（応答しない接続先に何度も待たされ、その間ずっと同時実行数の枠を使い続けるため）。
+
+SDK（google-generativeai）の genai.configure はプロセス全体の設定のため、キーの異なる利用者が
+同時に使うと設定が入れ替わってしまう。ここでは REST API を urllib で直接呼び、設定をクライアントごとに持つ。
+接続先は HITA_GEMINI_BASE_URL で変更できる（tools/gemini_stub_server.py のスタブなど）。
+"""
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DEFAULT_BASE_URL = 'https://generativelanguage.googleapis.com'
+DEFAULT_MODEL = 'gemini-2.0-flash-exp'
+# 再試行するHTTPステータス（レート制限とサーバー側の一時的なエラー）
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# 再試行する通信エラー（すぐに失敗が分かるもの。タイムアウトは含めない）
+RETRY_CONNECTION_ERRORS = (ConnectionRefusedError, ConnectionResetError)
+
+
+class GeminiError(Exception):
+    """Gemini API の呼び出しに失敗した（status は HTTPステータス、通信エラーは None）
+
+    通信エラーは connection_retryable が True のもの（接続の拒否・切断）だけ再試行する。
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None,
+                 connection_retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.connection_retryable = connection_retryable
+
+    @property
+    def retryable(self) -> bool:
+        if self.status is None:
+            return self.connection_retryable
+        return self.status in RETRY_STATUSES
+
+
+class TokenBucket:
+    """トークンバケット（1秒あたり rate 個補充、最大 capacity 個）
+
+    Args:
+        rate: 1秒あたりに補充するトークン数（平均のリクエスト数/秒）
+        capacity: ためておけるトークン数（連続して送れるリクエスト数）
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """トークンを1つ取る。取れた場合は 0、取れない場合は次のトークンまでの秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def refund(self):
+        """取ったトークンを1つ戻す（ほかの制限で待ちきれず、リクエストを送らなかった場合）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def acquire(self, timeout: float) -> bool:
+        """トークンが取れるまで最大 timeout 秒待つ"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class GeminiClient:
+    """1つのAPIキー用のクライアント（接続先・モデル・キーごとの制限を持つ）"""
+
+    def __init__(self, api_key: str, base_url: str, model: str, timeout: float,
+                 rate: float, burst: float, concurrency: int):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.requests = 0
+
+    def generate(self, prompt: str) -> str:
+        """generateContent を1回呼び、応答のテキストを返す（再試行はしない）"""
+        self.requests += 1
+        url = f"{self.base_url}/v1beta/models/{self.model}:generateContent"
+        body = json.dumps({'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}).encode('utf-8')
+        request = urllib.request.Request(url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'x-goog-api-key': self.api_key,
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise GeminiError(self._error_message(e), status=e.code, retry_after=self._retry_after(e))
+        except (urllib.error.URLError, OSError) as e:
+            reason = e.reason if isinstance(e, urllib.error.URLError) else e
+            if isinstance(reason, (TimeoutError, socket.timeout)):
+                raise GeminiError(f"Gemini API の応答がタイムアウトしました（{self.timeout:g}秒）")
+            raise GeminiError(f"Gemini API に接続できませんでした: {e}",
+                              connection_retryable=isinstance(reason, RETRY_CONNECTION_ERRORS))
+        except ValueError:
+            raise GeminiError("Gemini API の応答を解釈できませんでした", status=502)
+        try:
+            parts = payload['candidates'][0]['content']['parts']
+        except (KeyError, IndexError, TypeError):
+            reason = (payload.get('promptFeedback') or {}).get('blockReason')
+            raise GeminiError(f"応答がありませんでした（{reason}）" if reason else "応答がありませんでした", status=200)
+        return ''.join(part.get('text', '') for part in parts)
+
+    @staticmethod
+    def _error_message(error: urllib.error.HTTPError) -> str:
+        try:
+            message = json.loads(error.read())['error']['message']
+        except (ValueError, KeyError, TypeError, OSError):
+            message = error.reason
+        return f"Gemini API エラー（{error.code}）: {message}"
+
+    @staticmethod
+    def _retry_after(error: urllib.error.HTTPError) -> Optional[float]:
+        try:
+            return float(error.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+
+class GeminiClientManager:
+    """APIキーごとのクライアントを使い回し、頻度・同時実行数の制限と再試行を行う
+
+    Args:
+        base_url: APIの接続先（省略時は HITA_GEMINI_BASE_URL、無ければ Google のAPI）
+        model: モデル名
+        max_clients: 保持するクライアント数（超えた分は最後に使われた順に破棄）
+        key_rate / key_burst / key_concurrency: APIキーごとの 1秒あたりのリクエスト数・連続数・同時実行数
+        global_rate / global_burst / global_concurrency: プロセス全体での同上
+        max_retries: 429 / 5xx / 接続の拒否・切断時の再試行回数（タイムアウトは再試行しない）
+        backoff / max_backoff: 再試行の待ち時間の初期値と上限（秒、試行ごとに2倍にし、ゆらぎを加える）
+        acquire_timeout: 制限の空きを待つ最大秒数（超えると混雑として失敗する）
+        timeout: 1回のリクエストのタイムアウト（秒）
+    """
+
+    def __init__(self, base_url: Optional[str] = None, model: str = DEFAULT_MODEL, max_clients: int = 256,
+                 key_rate: float = 0.5, key_burst: float = 3, key_concurrency: int = 2,
+                 global_rate: float = 10.0, global_burst: float = 20, global_concurrency: int = 16,
+                 max_retries: int = 3, backoff: float = 1.0, max_backoff: float = 16.0,
+                 acquire_timeout: float = 30.0, timeout: float = 60.0):
+        self.base_url = base_url or os.environ.get('HITA_GEMINI_BASE_URL') or DEFAULT_BASE_URL
+        self.model = model
+        self.max_clients = max_clients
+        self.key_limits = (key_rate, key_burst, key_concurrency)
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.global_slots = threading.BoundedSemaphore(global_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.acquire_timeout = acquire_timeout
+        self.timeout = timeout
+        self._clients: 'OrderedDict[str, GeminiClient]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def client(self, api_key: str) -> GeminiClient:
+        """APIキーのクライアント（無ければ作成）。キーそのものではなくハッシュで管理する"""
+        digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        with self._lock:
+            client = self._clients.get(digest)
+            if client is not None:
+                self._clients.move_to_end(digest)
+                return client
+            client = GeminiClient(api_key, self.base_url, self.model, self.timeout, *self.key_limits)
+            self._clients[digest] = client
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+            return client
+
+    def _backoff_seconds(self, attempt: int, error: GeminiError) -> float:
+        if error.retry_after is not None:
+            return min(self.max_backoff, error.retry_after)
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _throttled(self, message: str, *buckets: TokenBucket) -> GeminiError:
+        """制限の空きを待ちきれなかった。送らなかったリクエストの分のトークンは戻す"""
+        for bucket in buckets:
+            bucket.refund()
+        self._count('throttled')
+        return GeminiError(message, status=429)
+
+    def _acquire(self, client: GeminiClient, deadline: float):
+        """キーごと・全体の頻度と同時実行数の空きを待つ（待ちきれない場合は GeminiError）"""
+        remaining = lambda: max(0.0, deadline - time.monotonic())
+        busy = "AIの利用が集中しています。しばらくしてから再度お試しください。"
+        if not client.bucket.acquire(remaining()):
+            raise self._throttled(busy)
+        if not self.global_bucket.acquire(remaining()):
+            raise self._throttled(busy, client.bucket)
+        if not client.slots.acquire(timeout=remaining()):
+            raise self._throttled("同じAPIキーでの生成が実行中です。完了してから再度お試しください。",
+                                  client.bucket, self.global_bucket)
+        if not self.global_slots.acquire(timeout=remaining()):
+            client.slots.release()
+            raise self._throttled(busy, client.bucket, self.global_bucket)
+
+    def generate(self, api_key: str, prompt: str) -> str:
+        """制限の範囲内で generateContent を呼び、429 / 5xx は再試行して応答のテキストを返す"""
+        if not api_key:
+            raise GeminiError("APIキーが設定されていません", status=401)
+        self._count('calls')
+        client = self.client(api_key)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(client, time.monotonic() + self.acquire_timeout)
+            try:
+                self._count('requests')
+                return client.generate(prompt)
+            except GeminiError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    self._count('failures')
+                    raise
+                error = e
+            finally:
+                self.global_slots.release()
+                client.slots.release()
+            # 待っている間は同時実行数の枠を他の利用者に譲る
+            self._count('retries')
+            time.sleep(self._backoff_seconds(attempt, error))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters, clients=len(self._clients))
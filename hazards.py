@@ -0,0 +1,181 @@
+"""ハザード区域（洪水・土砂災害など）の読み込みと判定
+
+ローカルの GeoJSON（HITA_HAZARD_DIR、既定は hazards/ の *.geojson）から浸水想定区域・土砂災害警戒区域などの
+ポリゴンを読み込み、STR木（shapely.STRtree）と準備済みジオメトリ（shapely.prepare）で索引を作る。
+地点・避難所・経路の区間がどの区域に入るかを判定し、最寄りの避難所の順位付けで危険な避難所を
+除外または減点するのに使う。
+
+GeoJSON の各フィーチャーのプロパティ（いずれも省略可）:
+    hazard  区域の種類（flood / landslide など。省略時はファイル名）
+    name    区域の名前
+    level   危険度（1以上の整数。浸水深のランクなど。省略時は 1）
+
+shapely（2.0以降）が無い環境では SHAPELY_AVAILABLE が False になり、ハザード区域は使わない。
+"""
+import glob
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import shapely
+    from shapely import STRtree
+    from shapely.geometry import LineString, Point, shape
+    SHAPELY_AVAILABLE = True
+except ImportError:
+    SHAPELY_AVAILABLE = False
+
+HAZARD_DIR = 'hazards'
+# 区域の種類の表示名
+HAZARD_LABELS = {
+    'flood': '洪水浸水想定区域',
+    'landslide': '土砂災害警戒区域',
+    'inland_flood': '内水浸水想定区域',
+}
+# 減点する場合、危険度1あたり距離に加える値（km）
+HAZARD_PENALTY_KM = 2.0
+
+
+@dataclass(frozen=True)
+class HazardZone:
+    """ハザード区域1つ（geometry は経度・緯度の順の shapely ジオメトリ）"""
+    kind: str
+    name: str
+    level: int
+    geometry: object
+
+    @property
+    def label(self) -> str:
+        return HAZARD_LABELS.get(self.kind, self.kind)
+
+
+def load_hazard_zones(directory: Optional[str] = None) -> List[HazardZone]:
+    """ディレクトリ内の *.geojson を読み込む（ディレクトリが無ければ空）
+
+    Raises:
+        ValueError: GeoJSON として読めない・ポリゴン以外のジオメトリがある場合
+    """
+    directory = directory if directory is not None else os.environ.get('HITA_HAZARD_DIR', HAZARD_DIR)
+    zones = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.geojson'))):
+        default_kind = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path, encoding='utf-8') as f:
+                collection = json.load(f)
+            features = collection['features'] if collection.get('type') == 'FeatureCollection' else [collection]
+            for feature in features:
+                properties = feature.get('properties') or {}
+                geometry = shape(feature['geometry'])
+                if geometry.geom_type not in ('Polygon', 'MultiPolygon'):
+                    raise ValueError(f"ポリゴン以外のジオメトリです: {geometry.geom_type}")
+                if not geometry.is_valid:
+                    geometry = geometry.buffer(0)
+                zones.append(HazardZone(
+                    kind=str(properties.get('hazard') or default_kind),
+                    name=str(properties.get('name') or ''),
+                    level=max(1, int(properties.get('level') or 1)),
+                    geometry=geometry,
+                ))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"{os.path.basename(path)} を読み込めませんでした: {e}")
+    return zones
+
+
+class HazardIndex:
+    """ハザード区域の空間索引
+
+    区域の外接矩形の STR木で候補を絞り、準備済みジオメトリで内外を判定する。
+    座標はすべて (緯度, 経度) で受け取る。
+    """
+
+    def __init__(self, zones: Sequence[HazardZone]):
+        self.zones = list(zones)
+        geometries = np.array([zone.geometry for zone in self.zones], dtype=object)
+        shapely.prepare(geometries)
+        self.tree = STRtree(geometries)
+        self.levels = np.array([zone.level for zone in self.zones], dtype=np.int32)
+        self._geojson = None
+
+    def __len__(self):
+        return len(self.zones)
+
+    def zones_at(self, lat: float, lng: float) -> List[HazardZone]:
+        """地点を含む区域"""
+        return [self.zones[i] for i in self.tree.query(Point(lng, lat), predicate='intersects')]
+
+    def point_levels(self, lat, lng) -> np.ndarray:
+        """各地点を含む区域の最大の危険度（区域外は 0）。地点をまとめて1回の問い合わせで判定する"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        levels = np.zeros(len(lat), dtype=np.int32)
+        if len(lat) and self.zones:
+            point_idx, zone_idx = self.tree.query(shapely.points(lng, lat), predicate='intersects')
+            np.maximum.at(levels, point_idx, self.levels[zone_idx])
+        return levels
+
+    def point_zones(self, lat, lng) -> List[List[HazardZone]]:
+        """各地点を含む区域のリスト"""
+        result = [[] for _ in range(len(lat))]
+        if len(lat) and self.zones:
+            point_idx, zone_idx = self.tree.query(
+                shapely.points(np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64)),
+                predicate='intersects')
+            for p, z in zip(point_idx, zone_idx):
+                result[p].append(self.zones[z])
+        return result
+
+    def leg_zones(self, start: Sequence[float], end: Sequence[float]) -> List[HazardZone]:
+        """2地点を結ぶ直線の区間が通る区域"""
+        line = LineString([(start[1], start[0]), (end[1], end[0])])
+        return [self.zones[i] for i in self.tree.query(line, predicate='intersects')]
+
+    def route_zones(self, origin: Sequence[float], stops: Sequence[Sequence[float]]) -> List[List[HazardZone]]:
+        """出発地から stops を順に回る各区間が通る区域"""
+        points = [origin, *stops]
+        return [self.leg_zones(a, b) for a, b in zip(points, points[1:])]
+
+    def geojson(self) -> Dict:
+        """地図に重ねる FeatureCollection（プロパティは種類・表示名・名前・危険度。初回だけ作る）"""
+        if self._geojson is None:
+            self._geojson = self._build_geojson()
+        return self._geojson
+
+    def _build_geojson(self) -> Dict:
+        return {
+            'type': 'FeatureCollection',
+            'features': [{
+                'type': 'Feature',
+                'geometry': shapely.geometry.mapping(zone.geometry),
+                'properties': {'hazard': zone.kind, 'label': zone.label, 'name': zone.name, 'level': zone.level},
+            } for zone in self.zones],
+        }
+
+
+def hazard_adjusted_distances(distances, levels, policy: Optional[str],
+                              penalty_km: float = HAZARD_PENALTY_KM) -> np.ndarray:
+    """ハザード区域内の避難所を除外（'exclude'）または危険度に応じて減点（'penalize'）した距離"""
+    distances = np.asarray(distances, dtype=np.float64)
+    if policy is None:
+        return distances
+    levels = np.asarray(levels)
+    if policy == 'exclude':
+        return np.where(levels > 0, np.inf, distances)
+    if policy == 'penalize':
+        return distances + levels * penalty_km
+    raise ValueError("hazard は 'exclude' または 'penalize' を指定してください")
+
+
+def load_hazard_index(directory: Optional[str] = None) -> Tuple[Optional[HazardIndex], Optional[str]]:
+    """索引を作る。使えない場合は (None, 理由)（データが無いだけなら理由も None）"""
+    if not SHAPELY_AVAILABLE:
+        return None, "shapely（2.0以降）がインストールされていないため、ハザード区域は使えません"
+    try:
+        zones = load_hazard_zones(directory)
+    except (OSError, ValueError) as e:
+        return None, str(e)
+    if not zones:
+        return None, None
+    return HazardIndex(zones), None
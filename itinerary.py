@@ -0,0 +1,189 @@
+"""複数日の観光プラン（宿泊先を起点に1日ずつ回る巡回路への分割）
+
+選んだスポットが1日で回りきれない場合に、1日の観光時間（移動・滞在・待ち時間の合計）の上限の中で
+日ごとの巡回路（宿泊先 → スポット → … → 宿泊先）に分ける。配送計画問題（VRP）と同じ形で、
+Clarke-Wright のセービング法で日数の少ない初期解を作り、日ごとの 2-opt・日をまたいだ1点移動と、
+最も短い日をほかの日へ振り分ける局所探索で総移動時間を減らす。
+
+移動時間は TravelTimeModel のスポット間の所要時間行列（データのバージョンと移動手段ごとにキャッシュ済み）と
+宿泊先からの所要時間を使う（帰りは行きと同じ所要時間とみなす）。
+"""
+from typing import Dict, Hashable, List, Optional, Sequence
+
+from distance_matrix import haversine_matrix
+
+# 日をまたいだ改善の最大反復回数（1回ごとに1点だけ動かす）
+MAX_MOVES = 500
+
+
+class _Plan:
+    """宿泊先を 0 番、スポットを 1..n 番とした所要時間表で日ごとの巡回路を評価する"""
+
+    def __init__(self, travel: List[List[float]], stay: List[float], day_minutes: float):
+        self.travel = travel
+        self.stay = stay
+        self.day_minutes = day_minutes
+
+    def travel_minutes(self, tour: Sequence[int]) -> float:
+        path = [0, *tour, 0]
+        return sum(self.travel[a][b] for a, b in zip(path, path[1:]))
+
+    def minutes(self, tour: Sequence[int]) -> float:
+        return self.travel_minutes(tour) + sum(self.stay[node] for node in tour)
+
+    def fits(self, tour: Sequence[int]) -> bool:
+        return self.minutes(tour) <= self.day_minutes + 1e-9
+
+    def savings(self, nodes: Sequence[int]) -> List[List[int]]:
+        """セービング法（片道2回分の移動を1本の移動にまとめて短くなる順に、上限内で日をつなぐ）"""
+        tours = {node: [node] for node in nodes}
+        tour_of = {node: node for node in nodes}
+        t = self.travel
+        pairs = sorted(((t[0][i] + t[j][0] - t[i][j], i, j) for i in nodes for j in nodes if i != j),
+                       reverse=True)
+        for saving, i, j in pairs:
+            if saving <= 0:
+                break
+            a, b = tour_of[i], tour_of[j]
+            if a == b or tours[a][-1] != i or tours[b][0] != j:
+                continue
+            merged = tours[a] + tours[b]
+            if not self.fits(merged):
+                continue
+            tours[a] = merged
+            del tours[b]
+            for node in tours[a]:
+                tour_of[node] = a
+        return list(tours.values())
+
+    def two_opt(self, tour: List[int]) -> List[int]:
+        """1日の巡回路の中の区間の反転で改善できる限り改善する"""
+        best = self.travel_minutes(tour)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(tour) - 1):
+                for j in range(i + 1, len(tour)):
+                    candidate = tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+                    cost = self.travel_minutes(candidate)
+                    if cost < best - 1e-9:
+                        tour, best, improved = candidate, cost, True
+        return tour
+
+    def best_insertion(self, tour: Sequence[int], node: int):
+        """上限内で node を入れたときの (増える移動時間, 挿入後の巡回路)。入らなければ None"""
+        best = None
+        base = self.travel_minutes(tour)
+        for pos in range(len(tour) + 1):
+            candidate = [*tour[:pos], node, *tour[pos:]]
+            if not self.fits(candidate):
+                continue
+            delta = self.travel_minutes(candidate) - base
+            if best is None or delta < best[0]:
+                best = (delta, candidate)
+        return best
+
+    def relocate(self, tours: List[List[int]]) -> bool:
+        """スポットを1つ別の日へ移して総移動時間が減れば移す"""
+        for a, tour in enumerate(tours):
+            for pos, node in enumerate(tour):
+                rest = tour[:pos] + tour[pos + 1:]
+                if not self.fits(rest):
+                    continue
+                gain = self.travel_minutes(tour) - self.travel_minutes(rest)
+                for b, other in enumerate(tours):
+                    if b == a:
+                        continue
+                    inserted = self.best_insertion(other, node)
+                    if inserted is not None and inserted[0] < gain - 1e-9:
+                        tours[a], tours[b] = rest, inserted[1]
+                        return True
+        return False
+
+    def dissolve(self, tours: List[List[int]]) -> bool:
+        """最も短い日のスポットをほかの日へ振り分けられれば、その日をなくす"""
+        if len(tours) < 2:
+            return False
+        shortest = min(range(len(tours)), key=lambda k: self.minutes(tours[k]))
+        others = [list(tour) for k, tour in enumerate(tours) if k != shortest]
+        for node in tours[shortest]:
+            options = [(inserted[0], k, inserted[1]) for k, other in enumerate(others)
+                       for inserted in [self.best_insertion(other, node)] if inserted is not None]
+            if not options:
+                return False
+            _, k, tour = min(options, key=lambda option: option[:2])
+            others[k] = tour
+        tours[:] = others
+        return True
+
+    def improve(self, tours: List[List[int]]) -> List[List[int]]:
+        tours = [self.two_opt(tour) for tour in tours]
+        while self.dissolve(tours):
+            pass
+        for _ in range(MAX_MOVES):
+            if not self.relocate(tours):
+                break
+            tours = [self.two_opt(tour) for tour in tours if tour]
+        return tours
+
+
+def plan_itinerary(lodging: Sequence[float], spots_df, selected_indices: Sequence[int], model,
+                   mode: str = 'driving', day_minutes: float = 480,
+                   wait_minutes: Optional[Dict[int, float]] = None, version: Optional[Hashable] = None) -> Dict:
+    """選んだスポットを1日の観光時間の上限内で日ごとの巡回路に分ける
+
+    Args:
+        lodging: 宿泊先の座標（毎日ここから出発して戻る）
+        spots_df: 観光データ
+        selected_indices: 選んだスポット（spots_df の行位置）
+        model: 所要時間モデル（travel_time.TravelTimeModel）
+        mode: 移動手段
+        day_minutes: 1日の観光時間の上限（分、移動・滞在・待ち時間の合計）
+        wait_minutes: スポットごとの待ち時間（分）。省略時は「待ち時間（分）」列の値を使う
+        version: spots_df のデータのバージョン（所要時間モデルのキャッシュのキー。省略時は内容から計算する）
+    Returns:
+        {'days': [{'route', 'travel_minutes', 'stay_minutes', 'total_minutes', 'distance_km'}, ...],
+         'over_budget': 単独でも上限を超えるスポット（それぞれ1日として days に含める）}
+    """
+    selected = list(dict.fromkeys(selected_indices))
+    if not selected:
+        return {'days': [], 'over_budget': []}
+
+    origin_times, time_matrix = model.travel_times(lodging, spots_df, mode, version)
+    n = len(selected)
+    travel = [[0.0] * (n + 1) for _ in range(n + 1)]
+    for a, i in enumerate(selected, 1):
+        travel[0][a] = travel[a][0] = float(origin_times[i])
+        row = time_matrix[i]
+        for b, j in enumerate(selected, 1):
+            travel[a][b] = float(row[j])
+
+    stay = [0.0]
+    for i in selected:
+        spot = spots_df.iloc[i]
+        wait = wait_minutes.get(i) if wait_minutes is not None else None
+        stay.append(float(spot.get('所要時間（参考）', 60))
+                    + float(wait if wait is not None else spot.get('待ち時間（分）', 0)))
+
+    plan = _Plan(travel, stay, day_minutes)
+    nodes = list(range(1, n + 1))
+    over_budget = [node for node in nodes if not plan.fits([node])]
+    feasible = [node for node in nodes if node not in over_budget]
+    tours = plan.improve(plan.savings(feasible)) + [[node] for node in over_budget]
+
+    # 報告用の距離（宿泊先と選んだスポットの直線距離）
+    lat = [lodging[0], *spots_df['緯度'].iloc[selected]]
+    lng = [lodging[1], *spots_df['経度'].iloc[selected]]
+    dist = haversine_matrix(lat, lng)
+
+    days = []
+    for tour in sorted(tours, key=lambda tour: -plan.minutes(tour)):
+        path = [0, *tour, 0]
+        days.append({
+            'route': [selected[node - 1] for node in tour],
+            'travel_minutes': plan.travel_minutes(tour),
+            'stay_minutes': sum(stay[node] for node in tour),
+            'total_minutes': plan.minutes(tour),
+            'distance_km': float(sum(dist[a, b] for a, b in zip(path, path[1:]))),
+        })
+    return {'days': days, 'over_budget': [selected[node - 1] for node in over_budget]}
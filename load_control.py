@@ -0,0 +1,150 @@
+"""アクセス集中時の縮退運転（ロードシェディング）と受け入れ制御
+
+同時セッション数か再実行の所要時間（p95）がしきい値を超えるか、運用者が切り替えると縮退モードに入り、
+AI機能の停止・観光マップの静的表示・一覧の件数制限などで1回の再実行あたりの負荷を下げる。
+さらにセッション数が受け入れ上限を超えた場合は、新しい観光モードのセッションを受け付けず、
+防災モードのセッションは常に受け付ける（防災を優先する）。
+
+運用者による切り替え:
+    HITA_LOAD_MODE=degraded / normal / auto（既定は auto）
+    HITA_DEGRADED_FLAG のファイル（既定 degraded.flag）が存在する間は縮退モード（再起動不要）
+"""
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Optional
+
+import numpy as np
+
+NORMAL = 'normal'
+DEGRADED = 'degraded'
+
+
+class LoadGovernor:
+    """同時セッション数と再実行の所要時間から運転モードを決める
+
+    Args:
+        max_sessions: これを超えると縮退モードに入るアクティブセッション数
+        admit_sessions: これを超えると新しい観光モードのセッションを受け付けないセッション数
+        latency_threshold: 縮退モードに入る再実行所要時間のp95（秒）
+        session_ttl: 最後の再実行からこの秒数が経ったセッションはアクティブとみなさない
+        cooldown: 通常モードへ戻るまでに、しきい値を下回り続ける必要がある秒数
+        window: p95 を計算する直近の再実行数
+    """
+
+    def __init__(self, max_sessions: int = 150, admit_sessions: int = 300, latency_threshold: float = 2.0,
+                 session_ttl: float = 120.0, cooldown: float = 60.0, window: int = 200,
+                 flag_path: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.admit_sessions = admit_sessions
+        self.latency_threshold = latency_threshold
+        self.session_ttl = session_ttl
+        self.cooldown = cooldown
+        self.flag_path = flag_path if flag_path is not None else os.environ.get('HITA_DEGRADED_FLAG', 'degraded.flag')
+        self._override: Optional[str] = None
+        env_mode = os.environ.get('HITA_LOAD_MODE', 'auto')
+        if env_mode in (NORMAL, DEGRADED):
+            self._override = env_mode
+        self._sessions: Dict[str, float] = {}  # セッションID → 最後の再実行時刻
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._mode = NORMAL
+        self._calm_since: Optional[float] = None
+        self._flag_checked = (0.0, False)
+        self.shed = Counter()
+        self.mode_changes = 0
+
+    # --- 入力 ---
+
+    def admit(self, session_id: str, disaster: bool) -> bool:
+        """再実行の開始時に呼ぶ。受け付けない場合は False"""
+        now = time.time()
+        with self._lock:
+            known = session_id in self._sessions
+            active = self._active_sessions(now)
+            if not known and not disaster and active >= self.admit_sessions:
+                self.shed['admission'] += 1
+                return False
+            self._sessions[session_id] = now
+            self._update_mode(now)
+            return True
+
+    def record_latency(self, seconds: float):
+        """再実行の終了時に所要時間（秒）を記録する"""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._update_mode(time.time())
+
+    def set_override(self, mode: Optional[str]):
+        """運用者による切り替え（None で自動判定に戻す）"""
+        if mode not in (None, NORMAL, DEGRADED):
+            raise ValueError(f"不明な運転モード: {mode}")
+        with self._lock:
+            self._override = mode
+
+    def record_shed(self, feature: str):
+        """縮退のために省略した処理を数える"""
+        self.shed[feature] += 1
+
+    # --- 判定 ---
+
+    def _active_sessions(self, now: float) -> int:
+        expired = [sid for sid, seen in self._sessions.items() if now - seen > self.session_ttl]
+        for sid in expired:
+            del self._sessions[sid]
+        return len(self._sessions)
+
+    def _p95(self) -> float:
+        return float(np.percentile(self._latencies, 95)) if self._latencies else 0.0
+
+    def _flag_set(self, now: float) -> bool:
+        # ファイルの確認は数秒に1回だけ
+        checked_at, value = self._flag_checked
+        if now - checked_at > 2.0:
+            value = bool(self.flag_path) and os.path.exists(self.flag_path)
+            self._flag_checked = (now, value)
+        return value
+
+    def _update_mode(self, now: float):
+        overloaded = (len(self._sessions) > self.max_sessions or self._p95() > self.latency_threshold)
+        if overloaded:
+            self._calm_since = None
+            new_mode = DEGRADED
+        elif self._mode == DEGRADED:
+            # 負荷が下がってもしばらくは縮退モードを続ける（切り替えの繰り返しを防ぐ）
+            if self._calm_since is None:
+                self._calm_since = now
+            new_mode = NORMAL if now - self._calm_since >= self.cooldown else DEGRADED
+        else:
+            new_mode = NORMAL
+        if new_mode != self._mode:
+            self._mode = new_mode
+            self.mode_changes += 1
+
+    @property
+    def mode(self) -> str:
+        """現在の運転モード（運用者の切り替え > フラグファイル > 自動判定）"""
+        with self._lock:
+            if self._override is not None:
+                return self._override
+            if self._flag_set(time.time()):
+                return DEGRADED
+            return self._mode
+
+    @property
+    def degraded(self) -> bool:
+        return self.mode == DEGRADED
+
+    def metrics(self) -> Dict:
+        mode = self.mode
+        with self._lock:
+            return {
+                'mode': mode,
+                'auto_mode': self._mode,
+                'override': self._override,
+                'active_sessions': self._active_sessions(time.time()),
+                'rerun_p95_seconds': round(self._p95(), 3),
+                'mode_changes': self.mode_changes,
+                'shed': dict(self.shed),
+            }
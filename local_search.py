@@ -0,0 +1,330 @@
+"""多数のスポットを選んだときの巡回順の改善（並列マルチスタート局所探索）
+
+貪欲法（optimize_route_tourism / optimize_route_disaster）の結果を初期解として、
+2-opt と1点移動（relocate）による局所探索に、摂動（区間の入れ替え）と
+ランダムな再スタートを組み合わせた反復局所探索をワーカープールで並列に実行し、
+共通の期限までに得られた中で最も移動距離（所要時間行列を渡した場合は移動時間）の短い巡回順を採用する。
+
+観光ルートで到着時刻の予測待ち時間（wait_time_fn）を渡した場合は、貪欲法と同じく
+移動・待ち・滞在の合計時間で比べる。待ち時間はワーカーへ渡すために到着時刻 WAIT_STEP_MINUTES 分刻みの表にし、
+最後に元の訪問順と改善した訪問順を wait_time_fn で計算し直して、短い方を採用する。
+
+試行数は既定で DEFAULT_RESTARTS 回に固定し、ワーカー数（CPU数）に応じて各ワーカーへ振り分ける。
+seed を指定した場合は期限を使わず、各試行を反復回数だけで打ち切るので、同じ seed・同じ入力からは
+マシンやワーカー数、処理の速さに関係なく常に同じ結果になる（結果は全セッションで共有するキャッシュにも入るため）。
+seed を省略した場合だけ、乱数を選び直して共通の期限までに得られた中から選ぶ。
+"""
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from distance_matrix import haversine_matrix
+
+# この数以上のスポットが選ばれたときに画面から並列探索を使う
+PARALLEL_SEARCH_MIN_SPOTS = 20
+# 予測待ち時間の表の到着時刻の刻み（分）
+WAIT_STEP_MINUTES = 10
+# 既定の試行数（ワーカー数に依存させない）
+DEFAULT_RESTARTS = 8
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_search_pool(workers: int) -> ProcessPoolExecutor:
+    """探索用のプロセスプールを返す（プロセス内で使い回す）
+
+    Streamlitのサーバーはスレッドを多数持つため、fork ではなく spawn でワーカーを作る。
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def discard_search_pool(pool: ProcessPoolExecutor):
+    """ワーカーが異常終了して使えなくなったプールを捨てる（次の get_search_pool で作り直す）"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_workers = None, 0
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def path_cost(path: Sequence[int], dist) -> float:
+    """出発地（0番）から始まる開いた経路の長さ"""
+    return sum(dist[a][b] for a, b in zip(path, path[1:]))
+
+
+def _two_opt(path: List[int], dist) -> bool:
+    """2-opt（区間の反転）で改善できる限り改善する。先頭の出発地は固定"""
+    n = len(path)
+    improved_any = False
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = path[i - 1], path[i]
+            d_ab = dist[a][b]
+            for j in range(i + 1, n):
+                c = path[j]
+                delta = dist[a][c] - d_ab
+                if j + 1 < n:
+                    d = path[j + 1]
+                    delta += dist[b][d] - dist[c][d]
+                if delta < -1e-9:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    improved = improved_any = True
+                    break
+            if improved:
+                break
+    return improved_any
+
+
+def _relocate(path: List[int], dist) -> bool:
+    """1点を別の位置へ移して改善できる限り改善する"""
+    n = len(path)
+    improved_any = False
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n):
+            node = path[i]
+            prev = path[i - 1]
+            nxt = path[i + 1] if i + 1 < n else None
+            removed_gain = dist[prev][node]
+            if nxt is not None:
+                removed_gain += dist[node][nxt] - dist[prev][nxt]
+            rest = path[:i] + path[i + 1:]
+            best_delta, best_pos = -1e-9, None
+            for pos in range(1, len(rest) + 1):
+                before = rest[pos - 1]
+                after = rest[pos] if pos < len(rest) else None
+                added = dist[before][node]
+                if after is not None:
+                    added += dist[node][after] - dist[before][after]
+                delta = added - removed_gain
+                if delta < best_delta:
+                    best_delta, best_pos = delta, pos
+            if best_pos is not None:
+                path[:] = rest[:best_pos] + [node] + rest[best_pos:]
+                improved = improved_any = True
+                break
+    return improved_any
+
+
+def local_optimum(path: List[int], dist) -> List[int]:
+    path = list(path)
+    while _two_opt(path, dist) | _relocate(path, dist):
+        pass
+    return path
+
+
+def _perturb(path: List[int], rng: random.Random) -> List[int]:
+    """区間の入れ替え（開いた経路用のダブルブリッジ）"""
+    n = len(path)
+    if n < 5:
+        body = path[1:]
+        rng.shuffle(body)
+        return [path[0]] + body
+    i, j, k = sorted(rng.sample(range(1, n), 3))
+    return path[:i] + path[j:k] + path[i:j] + path[k:]
+
+
+class ArrivalObjective:
+    """移動・待ち・滞在の合計時間（分）による訪問順の評価（ワーカーへ渡せるようにリストだけで持つ）
+
+    Args:
+        travel: 所要時間表（0番が出発地、向きあり）
+        stay: 各スポットの滞在時間
+        waits: waits[スポット][到着時刻 // step] の待ち時間（表の外は最後の値）
+        step: 待ち時間の表の刻み（分）
+    """
+
+    def __init__(self, travel: List[List[float]], stay: List[float], waits: List[List[float]], step: float):
+        self.travel = travel
+        self.stay = stay
+        self.waits = waits
+        self.step = step
+
+    def minutes(self, path: Sequence[int]) -> float:
+        clock = 0.0
+        for a, b in zip(path, path[1:]):
+            clock += self.travel[a][b]
+            row = self.waits[b]
+            clock += row[min(int(clock // self.step), len(row) - 1)] + self.stay[b]
+        return clock
+
+
+def search_restart(dist, initial: List[int], seed: int, restart: int, iterations: int,
+                   deadline: Optional[float],
+                   objective: Optional[ArrivalObjective] = None) -> Tuple[float, int, List[int]]:
+    """1回の試行（0番は初期解から、それ以外はランダムな並びから）
+
+    局所探索の近傍は移動時間（dist）で探し、解の採否は objective があればその合計時間で決める。
+    """
+    score = objective.minutes if objective is not None else (lambda path: path_cost(path, dist))
+    rng = random.Random(seed * 1000003 + restart)
+    if restart == 0:
+        start = list(initial)
+    else:
+        body = list(initial[1:])
+        rng.shuffle(body)
+        start = [initial[0]] + body
+    best = local_optimum(start, dist)
+    best_cost = score(best)
+    if restart == 0 and objective is not None and score(initial) <= best_cost:
+        best, best_cost = list(initial), score(initial)
+    for _ in range(iterations):
+        if deadline is not None and time.time() >= deadline:
+            break
+        candidate = local_optimum(_perturb(best, rng), dist)
+        cost = score(candidate)
+        if cost < best_cost - 1e-9:
+            best, best_cost = candidate, cost
+    return best_cost, restart, best
+
+
+def _search_in_pool(workers: int, dist, initial: List[int], seed: int, restarts: int, iterations: int,
+                    deadline: Optional[float], deadline_seconds: float,
+                    objective: Optional[ArrivalObjective]) -> List[Tuple[float, int, List[int]]]:
+    """プロセスプールで各試行を実行する（プールが壊れていれば捨てて BrokenProcessPool を送出する）
+
+    期限（deadline）がない場合は全試行の終了を待つ。
+    """
+    pool = get_search_pool(workers)
+    try:
+        futures = [pool.submit(search_restart, dist, initial, seed, r, iterations, deadline, objective)
+                   for r in range(restarts)]
+        # 期限がある場合、ワーカーの起動待ちなどで期限を過ぎた試行は捨てる（少し余裕を持たせる）
+        done, not_done = wait(futures, timeout=None if deadline is None else deadline_seconds + 1.0)
+        for future in not_done:
+            future.cancel()
+        if any(isinstance(f.exception(), BrokenProcessPool) for f in done if not f.cancelled()):
+            raise BrokenProcessPool("探索用のワーカープロセスが異常終了しました")
+    except BrokenProcessPool:
+        discard_search_pool(pool)
+        raise
+    return [f.result() for f in done if not f.cancelled() and f.exception() is None]
+
+
+def _arrival_objective(route: List[int], spots_df, travel: np.ndarray,
+                       wait_time_fn: Callable[[int, datetime], float], start_time: datetime,
+                       step: float = WAIT_STEP_MINUTES) -> Tuple[ArrivalObjective, Callable[[Sequence[int]], float]]:
+    """予測待ち時間の表による評価と、wait_time_fn をそのまま使う評価（最終確認用）を作る"""
+    stay = [0.0] + [float(spots_df.iloc[i].get('所要時間（参考）', 60)) for i in route]
+    travel_list = travel.tolist()
+
+    def exact_minutes(path: Sequence[int]) -> float:
+        clock = 0.0
+        for a, b in zip(path, path[1:]):
+            clock += travel_list[a][b]
+            clock += wait_time_fn(route[b - 1], start_time + timedelta(minutes=clock)) + stay[b]
+        return clock
+
+    # 表の範囲は元の訪問順の所要時間の2倍まで（それより遅い到着は最後の値を使う）
+    horizon = 2 * exact_minutes(list(range(len(route) + 1)))
+    offsets = [k * step for k in range(int(horizon // step) + 2)]
+    waits = [[0.0] * len(offsets)] + [[float(wait_time_fn(idx, start_time + timedelta(minutes=m))) for m in offsets]
+                                      for idx in route]
+    return ArrivalObjective(travel_list, stay, waits, step), exact_minutes
+
+
+def improve_route(current_loc: List[float], spots_df, route: List[int], restarts: int = DEFAULT_RESTARTS,
+                  iterations: int = 100, seed: Optional[int] = None, deadline_seconds: float = 2.0,
+                  workers: Optional[int] = None,
+                  travel_times: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                  wait_time_fn: Optional[Callable[[int, datetime], float]] = None,
+                  start_time: Optional[datetime] = None) -> Tuple[List[int], float]:
+    """巡回順を並列マルチスタート局所探索で改善する
+
+    Args:
+        current_loc: 出発地 [緯度, 経度]
+        spots_df: スポットデータ（route は iloc の位置）
+        route: 初期解（貪欲法の訪問順）
+        restarts: 試行数（0番は初期解からの反復局所探索、それ以外はランダム再スタート）
+        iterations: 各試行の摂動回数
+        seed: 乱数シード。指定した場合は期限を使わず反復回数だけで打ち切る（結果が再現できる）
+        deadline_seconds: seed を省略した場合の全試行に共通の期限（秒）
+        workers: ワーカープロセス数（None でCPU数、試行数が上限。CPUが1つの場合と 0 はこのプロセス内で順に実行）
+        travel_times: (出発地からの所要時間, スポット間の所要時間行列)（分）。あれば移動時間を最小化する
+        wait_time_fn: (スポット, 到着予定時刻) → 予測待ち時間（分）。あれば移動・待ち・滞在の合計時間を最小化する
+        start_time: 出発時刻（wait_time_fn を使う場合。省略時は現在時刻）
+    Returns: (改善後の訪問順, 総移動距離km または総移動時間（分）。wait_time_fn があれば合計時間（分）)
+    """
+    if travel_times is not None:
+        origin_times, time_matrix = travel_times
+        positions = np.asarray(route)
+        cost = np.zeros((len(route) + 1, len(route) + 1))
+        cost[0, 1:] = origin_times[positions]
+        cost[1:, 1:] = time_matrix[np.ix_(positions, positions)]
+        travel = cost.copy()
+        # 2-opt は区間を反転するので往復の平均で対称にしておく（出発地へは戻らない）
+        cost[1:, 0] = cost[0, 1:]
+        dist = ((cost + cost.T) / 2).tolist()
+    else:
+        lat = [current_loc[0]] + [float(spots_df.iloc[i]['緯度']) for i in route]
+        lng = [current_loc[1]] + [float(spots_df.iloc[i]['経度']) for i in route]
+        km = haversine_matrix(lat, lng)
+        # 所要時間行列がない場合の移動時間は貪欲法と同じく時速40km
+        travel = km / 40 * 60
+        dist = km.tolist()
+    # 0番が出発地、1..k が route の各スポット（リストの方が要素アクセスが速い）
+    initial = list(range(len(route) + 1))
+    objective, exact_minutes = None, None
+    if wait_time_fn is not None and route:
+        objective, exact_minutes = _arrival_objective(route, spots_df, travel, wait_time_fn,
+                                                      start_time or datetime.now())
+    score = exact_minutes or (lambda path: path_cost(path, dist))
+    if len(route) < 3:
+        return list(route), score(initial)
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+        deadline = time.time() + deadline_seconds
+    else:
+        # 途中で打ち切った結果は処理の速さで変わるので、seed を指定した場合は期限を使わない
+        deadline = None
+
+    restarts = max(1, restarts)
+    if workers is None:
+        workers = os.cpu_count() or 1
+        if workers == 1:
+            # CPUが1つなら別プロセスにしても速くならない
+            workers = 0
+    workers = min(workers, restarts)
+    results = []
+    if workers > 0:
+        try:
+            results = _search_in_pool(workers, dist, initial, seed, restarts, iterations, deadline, deadline_seconds,
+                                      objective)
+        except BrokenProcessPool:
+            # ワーカーが異常終了した場合、プールは次回作り直し、今回はこのプロセス内で探索する
+            workers = 0
+    if workers <= 0:
+        for r in range(restarts):
+            results.append(search_restart(dist, initial, seed, r, iterations, deadline, objective))
+
+    # 初期解そのものも候補に入れ、(評価値, 試行番号) で選ぶので結果は並列実行の順序に依存しない
+    results.append((objective.minutes(initial) if objective is not None else path_cost(initial, dist),
+                    restarts, initial))
+    _, _, best = min(results, key=lambda item: (item[0], item[1]))
+    best_cost = score(best)
+    if exact_minutes is not None:
+        # 待ち時間の表は近似なので、元の訪問順より長くなる場合は元の訪問順のままにする
+        initial_cost = exact_minutes(initial)
+        if initial_cost <= best_cost:
+            best, best_cost = initial, initial_cost
+    return [route[node - 1] for node in best[1:]], best_cost
@@ -0,0 +1,85 @@
+"""グループの集合場所の検索
+
+家族や団体が別々の宿などから出発する場合に、全員の出発地からの所要時間をもとに
+集合するスポット（観光スポット・避難所）を選ぶ。目的は「最も遠い人の所要時間」または
+「全員の所要時間の合計」の最小化。
+
+全候補について出発地ごとの直線距離を行列でまとめて計算し、距離に1kmあたりの最短の所要時間を
+掛けた値（所要時間の下限）の小さい順に、少しずつ実際の所要時間を計算する。
+下限が上位 k 件の最悪値を超えた時点で、残りの候補は計算しない。
+"""
+import heapq
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from distance_matrix import cross_distances
+
+# 目的（最も遠い人の所要時間 / 全員の合計）
+OBJECTIVES = {
+    'max': lambda times: times.max(axis=0),
+    'sum': lambda times: times.sum(axis=0),
+}
+
+
+def meeting_points(origins: Sequence[Tuple[float, float]], spots_df, model, mode: str = 'walking',
+                   objective: str = 'max', k: int = 3, batch: int = 16,
+                   version: Optional[Hashable] = None) -> Tuple[List[Dict], int]:
+    """出発地の全員にとって良い集合場所を上位 k 件返す
+
+    Args:
+        origins: 出発地の座標 [(緯度, 経度), ...]
+        spots_df: 候補のスポット
+        model: 所要時間モデル（travel_time.TravelTimeModel）
+        mode: 移動手段（全員同じ）
+        objective: 'max'（最も遠い人の所要時間）または 'sum'（全員の合計）
+        k: 返す件数
+        batch: 実際の所要時間をまとめて計算する候補数
+        version: spots_df のデータのバージョン（所要時間モデルのキャッシュのキー。省略時は内容から計算する）
+
+    Returns:
+        ([{'index', 'name', 'times', 'max_minutes', 'total_minutes'}, ...]（良い順）,
+         実際の所要時間を計算した候補数)
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"不明な目的: {objective}")
+    if not len(origins) or spots_df.empty:
+        return [], 0
+    score_of = OBJECTIVES[objective]
+    origins = np.asarray(origins, dtype=np.float64)
+    dist = cross_distances(origins[:, 0], origins[:, 1],
+                           spots_df['緯度'].to_numpy(dtype=np.float64), spots_df['経度'].to_numpy(dtype=np.float64))
+    lower_bound = score_of(dist * model.minutes_per_km_bound(mode))
+    order = np.argsort(lower_bound, kind='stable')
+
+    best: List[Tuple[float, int]] = []  # (-スコア, -位置) の最大ヒープ（上位 k 件の最悪値が先頭）
+    times_by_position: Dict[int, np.ndarray] = {}
+    evaluated = 0
+    for start in range(0, len(order), batch):
+        block = order[start:start + batch]
+        if len(best) == k and lower_bound[block[0]] > -best[0][0]:
+            break
+        times = np.stack([model.origin_times(origin, spots_df, mode, positions=block, version=version) for origin in origins])
+        evaluated += len(block)
+        for column, (position, score) in enumerate(zip(block, score_of(times))):
+            entry = (-float(score), -int(position))
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+            else:
+                continue
+            times_by_position[int(position)] = times[:, column]
+
+    results = []
+    for _, negative_position in sorted(best, reverse=True):
+        position = -negative_position
+        times = times_by_position[position]
+        results.append({
+            'index': spots_df.index[position],
+            'name': spots_df['スポット名'].iat[position],
+            'times': [float(t) for t in times],
+            'max_minutes': float(times.max()),
+            'total_minutes': float(times.sum()),
+        })
+    return results, evaluated
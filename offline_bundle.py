@@ -0,0 +1,371 @@
+"""防災モードの静的オフライン版の書き出し
+
+避難指示の発令時などアクセスが集中したときに、タップごとにStreamlitの再実行を伴わずに済むよう、
+避難所データを静的ファイルのまとまり（バンドル）に変換する。
+どの静的Webサーバー（またはCDN）からでも配信でき、ブラウザは Service Worker で
+オフラインでも表示できる。最寄り避難所の検索と距離の計算はブラウザ側で行う。
+
+書き出すファイル:
+    shelters.json  避難所の名前・種別・座標・説明（座標などが変わったときだけ書き直す）
+    status.json    開設状況と収容人数（開設状況が変わるたびに書き直す、数KB）
+    grid.json      最寄り検索用の格子（セル → 避難所番号、座標が変わったときだけ書き直す）
+    index.html / app.js / sw.js  最寄り避難所ページと Service Worker
+
+ShelterStatusStore に登録すると、差分が届くたびに内容が変わったファイルだけを書き直す。
+
+使い方:
+    python offline_bundle.py --out offline            # 1回だけ書き出す
+    python offline_bundle.py --out offline --watch    # HITA_SHELTER_FEED の更新を反映し続ける
+    python offline_bundle.py --out offline --serve 8800
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+# 最寄り検索用の格子の大きさ（度、約1km）
+GRID_CELL_DEG = 0.01
+
+INDEX_HTML = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>日田なび 最寄りの避難所（オフライン版）</title>
+<style>
+body { font-family: sans-serif; margin: 0; padding: 12px; background: #f7f7f7; }
+h1 { font-size: 1.2em; margin: 0 0 8px; }
+.meta { color: #666; font-size: 0.85em; }
+button { font-size: 1em; padding: 8px 14px; margin: 4px 4px 4px 0; }
+.card { background: #fff; border-radius: 8px; padding: 10px 12px; margin: 8px 0; box-shadow: 0 1px 2px #0002; }
+.open { color: #2e7d32; font-weight: bold; }
+.standby { color: #ef6c00; font-weight: bold; }
+</style>
+</head>
+<body>
+<h1>🏥 最寄りの避難所</h1>
+<p class="meta" id="meta">読み込み中...</p>
+<div>
+  <button id="locate">📍 現在地から探す</button>
+  <label><input type="checkbox" id="open-only"> 開設中のみ</label>
+</div>
+<div>
+  <input id="manual" placeholder="緯度,経度（例: 33.3219,130.9414）" size="28">
+  <button id="search">検索</button>
+</div>
+<p class="meta" id="message"></p>
+<div id="results"></div>
+<script src="app.js?v=__VERSION__"></script>
+</body>
+</html>
+"""
+
+APP_JS = r"""const state = { shelters: null, grid: null, status: null, origin: null };
+
+async function loadJSON(name) {
+  const response = await fetch(name, { cache: 'no-cache' });
+  return response.json();
+}
+
+async function loadData() {
+  [state.shelters, state.grid] = await Promise.all([loadJSON('shelters.json'), loadJSON('grid.json')]);
+  await refreshStatus();
+}
+
+async function refreshStatus() {
+  try {
+    state.status = await loadJSON('status.json');
+  } catch (e) {
+    // オフラインで status.json を取得できない場合は Service Worker のキャッシュが返る
+  }
+  const updated = state.status ? state.status.updated : '不明';
+  document.getElementById('meta').textContent =
+    `避難所 ${state.shelters.rows.length}箇所 ・ 開設状況の更新: ${updated}`;
+  if (state.origin) render();
+}
+
+function distanceKm(lat1, lng1, lat2, lng2) {
+  const toRad = (d) => d * Math.PI / 180;
+  const dLat = toRad(lat2 - lat1), dLng = toRad(lng2 - lng1);
+  const a = Math.sin(dLat / 2) ** 2 + Math.cos(toRad(lat1)) * Math.cos(toRad(lat2)) * Math.sin(dLng / 2) ** 2;
+  return 2 * 6371 * Math.atan2(Math.sqrt(a), Math.sqrt(1 - a));
+}
+
+// 格子を現在地のセルから外側へ1周ずつ広げて候補を集める
+function nearest(lat, lng, k, openOnly) {
+  const { cell, cells } = state.grid;
+  const ci = Math.floor(lat / cell), cj = Math.floor(lng / cell);
+  const candidates = [];
+  const accept = (id) => !openOnly || (state.status && state.status.status[id] === '開設中');
+  let foundAt = null;
+  for (let r = 0; r <= state.grid.max_ring; r++) {
+    for (let i = ci - r; i <= ci + r; i++) {
+      for (let j = cj - r; j <= cj + r; j++) {
+        if (Math.max(Math.abs(i - ci), Math.abs(j - cj)) !== r) continue;
+        for (const id of cells[`${i}:${j}`] || []) if (accept(id)) candidates.push(id);
+      }
+    }
+    if (foundAt === null && candidates.length >= k) foundAt = r;
+    // 見つかった周の1周外側まで調べて、格子の境界付近にある、より近い避難所の取りこぼしを防ぐ
+    if (foundAt !== null && r >= foundAt + 1) break;
+  }
+  // 避難所の範囲の外にいる場合など、格子全体の周数まで広げても k 件に届かなければ全件から探す
+  if (candidates.length < k) {
+    candidates.length = 0;
+    state.shelters.rows.forEach((_, id) => { if (accept(id)) candidates.push(id); });
+  }
+  return candidates
+    .map((id) => [id, distanceKm(lat, lng, state.shelters.rows[id][2], state.shelters.rows[id][3])])
+    .sort((a, b) => a[1] - b[1])
+    .slice(0, k);
+}
+
+// フィードから届いた値も表示するので、HTMLとして解釈されないようにする
+function esc(value) {
+  return String(value).replace(/[&<>"']/g, (c) => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' })[c]);
+}
+
+function render() {
+  const [lat, lng] = state.origin;
+  const openOnly = document.getElementById('open-only').checked;
+  const results = nearest(lat, lng, 5, openOnly);
+  const container = document.getElementById('results');
+  container.innerHTML = '';
+  if (!results.length) {
+    container.textContent = '条件に合う避難所がありません';
+    return;
+  }
+  for (const [id, dist] of results) {
+    const [name, category, sLat, sLng, description] = state.shelters.rows[id];
+    const status = state.status ? state.status.status[id] : '不明';
+    const capacity = state.status ? state.status.capacity[id] : '-';
+    const link = `https://www.google.com/maps/dir/?api=1&origin=${lat},${lng}` +
+      `&destination=${sLat},${sLng}&travelmode=walking`;
+    const card = document.createElement('div');
+    card.className = 'card';
+    card.innerHTML =
+      `<b>${esc(name)}</b> <span class="${status === '開設中' ? 'open' : 'standby'}">${esc(status)}</span><br>` +
+      `📏 ${dist.toFixed(2)} km ・ 🚶 徒歩約${Math.round(dist / 4 * 60)}分 ・ 収容: ${esc(capacity)}名<br>` +
+      `<span class="meta">${esc(category)} ${esc(description)}</span><br>` +
+      `<a href="${link}" target="_blank" rel="noopener">🗺️ Google Mapsで経路を表示</a>`;
+    container.appendChild(card);
+  }
+}
+
+function setOrigin(lat, lng) {
+  state.origin = [lat, lng];
+  document.getElementById('message').textContent = `現在地: ${lat.toFixed(5)}, ${lng.toFixed(5)}`;
+  render();
+}
+
+document.getElementById('locate').addEventListener('click', () => {
+  if (!navigator.geolocation) {
+    document.getElementById('message').textContent = 'この端末では位置情報を取得できません';
+    return;
+  }
+  document.getElementById('message').textContent = '位置情報を取得中...';
+  navigator.geolocation.getCurrentPosition(
+    (pos) => setOrigin(pos.coords.latitude, pos.coords.longitude),
+    (err) => { document.getElementById('message').textContent = `位置情報を取得できません: ${err.message}`; },
+    { enableHighAccuracy: true, timeout: 10000, maximumAge: 60000 }
+  );
+});
+
+document.getElementById('search').addEventListener('click', () => {
+  const [lat, lng] = document.getElementById('manual').value.split(',').map(Number);
+  if (Number.isFinite(lat) && Number.isFinite(lng)) setOrigin(lat, lng);
+});
+
+document.getElementById('open-only').addEventListener('change', () => { if (state.origin) render(); });
+
+if ('serviceWorker' in navigator) navigator.serviceWorker.register('sw.js');
+loadData();
+setInterval(refreshStatus, 60000);
+"""
+
+SW_JS = """// 静的ファイルはキャッシュ優先、開設状況（status.json）はネットワーク優先で取得できなければキャッシュ
+const CACHE = 'hita-offline-__VERSION__';
+const STATIC_FILES = ['./', 'index.html', 'app.js?v=__VERSION__', 'shelters.json', 'grid.json', 'status.json'];
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(caches.open(CACHE).then((cache) => cache.addAll(STATIC_FILES)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((key) => key !== CACHE).map((key) => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (url.pathname.endsWith('status.json')) {
+    event.respondWith(
+      fetch(event.request)
+        .then((response) => {
+          const copy = response.clone();
+          caches.open(CACHE).then((cache) => cache.put('status.json', copy));
+          return response;
+        })
+        .catch(() => caches.match('status.json'))
+    );
+    return;
+  }
+  event.respondWith(caches.match(event.request, { ignoreSearch: false }).then((hit) => hit || fetch(event.request)));
+});
+"""
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def shelters_payload(disaster_df) -> Dict:
+    """避難所の変わらない情報（行の順番が避難所番号）"""
+    rows = [
+        [row['スポット名'], row['カテゴリ'], round(float(row['緯度']), 6), round(float(row['経度']), 6), row['説明']]
+        for _, row in disaster_df.iterrows()
+    ]
+    return {'fields': ['name', 'category', 'lat', 'lng', 'description'], 'rows': rows}
+
+
+def status_payload(disaster_df, version: int) -> Dict:
+    return {
+        'version': version,
+        'updated': datetime.now().strftime('%Y/%m/%d %H:%M:%S'),
+        'status': disaster_df['状態'].tolist(),
+        'capacity': [int(c) for c in disaster_df['収容人数']],
+    }
+
+
+def grid_payload(disaster_df, cell: float = GRID_CELL_DEG) -> Dict:
+    """セル 'i:j'（緯度・経度を cell で割った整数）→ 避難所番号のリスト"""
+    cells: Dict[str, list] = {}
+    for pos, (lat, lng) in enumerate(zip(disaster_df['緯度'], disaster_df['経度'])):
+        cells.setdefault(f"{math.floor(lat / cell)}:{math.floor(lng / cell)}", []).append(pos)
+    keys = [tuple(int(v) for v in key.split(':')) for key in cells]
+    # 格子の中から格子全体を覆う周の数（格子の外にいて、ここまでで足りない場合は全件から探す）
+    span = max(max(i for i, _ in keys) - min(i for i, _ in keys),
+               max(j for _, j in keys) - min(j for _, j in keys)) if keys else 0
+    return {'cell': cell, 'max_ring': span + 1, 'cells': cells}
+
+
+class OfflineBundleExporter:
+    """防災データから静的バンドルを書き出し、変更のたびに必要なファイルだけを書き直す
+
+    Args:
+        store: ShelterStatusStore（df・lock・version・subscribe を使う）
+        out_dir: 書き出し先のディレクトリ
+        min_interval: 連続した更新をまとめる間隔（秒）
+    """
+
+    def __init__(self, store, out_dir: str, min_interval: float = 2.0):
+        self.store = store
+        self.out_dir = out_dir
+        self.min_interval = min_interval
+        self._digests: Dict[str, str] = {}
+        self._dirty = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.exports = 0
+        self.files_written = 0
+
+    def start(self):
+        if self._thread is None:
+            self.export()
+            self.store.subscribe(self._on_change)
+            self._thread = threading.Thread(target=self._run, name="offline-bundle", daemon=True)
+            self._thread.start()
+        return self
+
+    def _on_change(self, changed, version):
+        self._dirty.set()
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            # 短時間の連続更新は1回の書き出しにまとめる
+            time.sleep(self.min_interval)
+            self._dirty.clear()
+            try:
+                self.export()
+            except OSError:
+                self._dirty.set()
+
+    def _write(self, name: str, data: bytes) -> bool:
+        """内容が変わったときだけ書き直す（途中の状態を配信しないよう置き換えで書く）"""
+        digest = hashlib.sha1(data).hexdigest()
+        path = os.path.join(self.out_dir, name)
+        if self._digests.get(name) == digest and os.path.exists(path):
+            return False
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._digests[name] = digest
+        self.files_written += 1
+        return True
+
+    def export(self) -> Dict[str, bool]:
+        """バンドルを書き出し、ファイルごとに書き直したかどうかを返す"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        with self.store.lock:
+            df = self.store.df.copy()
+            version = self.store.version
+        shelters = _dumps(shelters_payload(df))
+        grid = _dumps(grid_payload(df))
+        # 避難所情報か格子が変わったときだけ Service Worker のキャッシュを入れ替える
+        static_version = hashlib.sha1(shelters + grid + APP_JS.encode('utf-8')).hexdigest()[:12]
+        written = {
+            'shelters.json': self._write('shelters.json', shelters),
+            'grid.json': self._write('grid.json', grid),
+            'status.json': self._write('status.json', _dumps(status_payload(df, version))),
+            'app.js': self._write('app.js', APP_JS.encode('utf-8')),
+            'index.html': self._write('index.html', INDEX_HTML.replace('__VERSION__', static_version).encode('utf-8')),
+            'sw.js': self._write('sw.js', SW_JS.replace('__VERSION__', static_version).encode('utf-8')),
+        }
+        self.exports += 1
+        return written
+
+
+def main():
+    from shelter_feed import ShelterStatusStore, FeedIngestor, feed_source_from_env
+    from spots_data import load_spots_frames
+
+    parser = argparse.ArgumentParser(description="防災モードの静的オフライン版を書き出す")
+    parser.add_argument('--out', default='offline')
+    parser.add_argument('--spots', default='spots.xlsx')
+    parser.add_argument('--watch', action='store_true', help="HITA_SHELTER_FEED の更新を反映し続ける")
+    parser.add_argument('--serve', type=int, metavar='PORT', help="書き出したバンドルを配信する（確認用）")
+    args = parser.parse_args()
+
+    _, disaster_df = load_spots_frames(args.spots)
+    store = ShelterStatusStore(disaster_df)
+    exporter = OfflineBundleExporter(store, args.out)
+    written = exporter.export()
+    print(f"{args.out}: {', '.join(name for name, changed in written.items() if changed)} を書き出しました")
+
+    if args.watch:
+        source = feed_source_from_env()
+        if source is None:
+            parser.error("--watch には HITA_SHELTER_FEED の設定が必要です")
+        FeedIngestor(store, source).start()
+        exporter.start()
+    if args.serve:
+        from functools import partial
+        from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+        handler = partial(SimpleHTTPRequestHandler, directory=args.out)
+        print(f"http://127.0.0.1:{args.serve}/")
+        ThreadingHTTPServer(('127.0.0.1', args.serve), handler).serve_forever()
+    elif args.watch:
+        threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""算出済みの訪問順の差分更新
+
+最適化ルートを算出した後にスポットを1つ追加・削除したり、現在地が移動したり、待ち時間の予測が
+変わったりしたときに、訪問順を最初から計算し直さず、保存してある訪問順を直して使う。
+
+    追加  最も移動時間の増えない位置に挿入（cheapest insertion）し、挿入位置の周りだけ並べ替える
+    削除  訪問順から取り除いて前後をつなぎ、つないだ位置の周りだけ並べ替える
+    移動  先頭から到着済みのスポットを除き、新しい現在地から先頭の数か所だけを並べ替える
+
+並べ替えは前後を固定した REPAIR_WINDOW か所の全順列で行うため、1回の更新の計算量は
+訪問先の数によらずほぼ一定（挿入位置の探索と到着時刻の積み上げだけが訪問先の数に比例する）。
+"""
+from itertools import permutations
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from distance_matrix import origin_distances
+
+# 並べ替える範囲（か所）
+REPAIR_WINDOW = 5
+# 現在地がこの距離（km）以内に入ったスポットは到着済みとみなす
+ARRIVAL_RADIUS_KM = 0.15
+
+
+class RouteCost:
+    """訪問順の評価（移動時間と、到着予定時刻の待ち時間の合計。滞在時間は到着時刻の計算にだけ使う）
+
+    Args:
+        origin_times: 現在地から各スポットまでの所要時間（分、TravelTimeModel.travel_times の1つ目）
+        time_matrix: スポット間の所要時間行列（分）
+        stay_minutes: スポットごとの滞在時間（分、省略時は0）
+        wait_minutes: (スポット, 出発からの経過分) → 到着時の待ち時間（分）。省略時は0
+    """
+
+    def __init__(self, origin_times, time_matrix, stay_minutes: Optional[Callable[[int], float]] = None,
+                 wait_minutes: Optional[Callable[[int, float], float]] = None):
+        self.origin_times = origin_times
+        self.time_matrix = time_matrix
+        self.stay_minutes = stay_minutes
+        self.wait_minutes = wait_minutes
+
+    def leg(self, a: Optional[int], b: int) -> float:
+        """a（None は現在地）から b までの移動時間"""
+        if a is None:
+            return float(self.origin_times[b])
+        return float(self.time_matrix[a][b])
+
+    def _visit(self, stop: int, arrival: float) -> Tuple[float, float]:
+        """(待ち時間, 出発時刻)"""
+        wait = self.wait_minutes(stop, arrival) if self.wait_minutes is not None else 0.0
+        stay = self.stay_minutes(stop) if self.stay_minutes is not None else 0.0
+        return wait, arrival + wait + stay
+
+    def departure(self, route: Sequence[int], count: int) -> float:
+        """先頭から count か所を回ってそこを出発する時刻（出発からの経過分）"""
+        clock, previous = 0.0, None
+        for stop in route[:count]:
+            _, clock = self._visit(stop, clock + self.leg(previous, stop))
+            previous = stop
+        return clock
+
+    def segment(self, before: Optional[int], stops: Sequence[int], after: Optional[int], clock: float) -> float:
+        """before を clock に出発して stops を順に回り、after（None なら終点）に着くまでの移動と待ち時間"""
+        cost, previous = 0.0, before
+        for stop in stops:
+            travel = self.leg(previous, stop)
+            wait, clock = self._visit(stop, clock + travel)
+            cost += travel + wait
+            previous = stop
+        if after is not None and stops:
+            cost += self.leg(previous, after)
+        return cost
+
+
+def repair(route: List[int], start: int, cost: RouteCost, window: int = REPAIR_WINDOW) -> List[int]:
+    """route[start:start + window] を、前後のスポットを固定したまま最も良い順に並べ替える"""
+    start = max(0, min(start, len(route) - window))
+    stops = route[start:start + window]
+    if len(stops) < 2:
+        return route
+    before = route[start - 1] if start > 0 else None
+    after = route[start + len(stops)] if start + len(stops) < len(route) else None
+    clock = cost.departure(route, start)
+    best = min(permutations(stops), key=lambda order: cost.segment(before, order, after, clock))
+    return route[:start] + list(best) + route[start + len(stops):]
+
+
+def cheapest_insertion(route: List[int], stop: int, cost: RouteCost) -> Tuple[List[int], int]:
+    """移動時間の増加が最も小さい位置に stop を挿入する。(新しい訪問順, 挿入位置) を返す"""
+    best_position, best_delta = len(route), None
+    for position in range(len(route) + 1):
+        before = route[position - 1] if position > 0 else None
+        after = route[position] if position < len(route) else None
+        delta = cost.leg(before, stop)
+        if after is not None:
+            delta += cost.leg(stop, after) - cost.leg(before, after)
+        if best_delta is None or delta < best_delta:
+            best_position, best_delta = position, delta
+    return route[:best_position] + [stop] + route[best_position:], best_position
+
+
+def update_selection(route: Sequence[int], selected: Sequence[int], cost: RouteCost) -> List[int]:
+    """選択の変更（追加・削除）を訪問順に反映する。選択の順に関係なく、既存の順序はできるだけ保つ"""
+    wanted = set(selected)
+    route = list(route)
+    # 削除: 取り除いた位置の前後をつないで、その周りだけ並べ替える
+    for position in reversed(range(len(route))):
+        if route[position] not in wanted:
+            del route[position]
+            if route:
+                route = repair(route, position - REPAIR_WINDOW // 2, cost)
+    # 追加: 挿入してから、その周りだけ並べ替える
+    present = set(route)
+    for stop in selected:
+        if stop not in present:
+            route, position = cheapest_insertion(route, stop, cost)
+            route = repair(route, position - REPAIR_WINDOW // 2, cost)
+            present.add(stop)
+    return route
+
+
+def reached_stops(route: Sequence[int], location: Sequence[float], spots_df,
+                  radius_km: float = ARRIVAL_RADIUS_KM) -> int:
+    """残りの訪問順の先頭から、現在地が近くにあるスポットが続く数を到着済みとして返す
+
+    先頭から順にしか進めないので、出発地の近くで終わる周回ルートや、待ち時間のために後ろへ回した
+    近くのスポットがあっても、その前のスポットまでまとめて到着済みにはしない。
+    """
+    if not route:
+        return 0
+    positions = list(route)
+    dist = origin_distances(location, spots_df['緯度'].to_numpy()[positions], spots_df['経度'].to_numpy()[positions])
+    reached = 0
+    while reached < len(positions) and dist[reached] <= radius_km:
+        reached += 1
+    return reached
+
+
+def resume(route: Sequence[int], cost: RouteCost) -> List[int]:
+    """新しい現在地（cost の origin_times）から、残りの訪問順の先頭だけを並べ替える"""
+    return repair(list(route), 0, cost) if route else []
@@ -0,0 +1,110 @@
+"""最適化ルートの結果キャッシュ（全セッション・APIで共有）
+
+日田駅や豆田町の駐車場など同じ場所から、人気の組み合わせを選ぶ利用者が多いため、
+(出発地を丸めた座標, 選択スポットの並べ替え済みリスト, 移動手段, データのバージョン) を
+キーとして訪問順を保存し、同じ条件の算出は計算せずに返す。
+保存するのは訪問順だけで、総移動距離・総所要時間は実際の出発地から計算し直す。
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+# 出発地を丸める桁数（小数第3位 ≒ 100m）
+ORIGIN_DECIMALS = 3
+
+
+def dataset_fingerprint(spots_df) -> int:
+    """スポット名と座標から計算したデータのバージョン（内容が同じなら同じ値）"""
+    hashed = pd.util.hash_pandas_object(spots_df[['スポット名', '緯度', '経度']], index=True)
+    return int(hashed.sum() & 0x7FFFFFFFFFFFFFFF)
+
+
+def route_cache_key(mode: str, origin, spot_names: Iterable[str], travel_mode: str,
+                    dataset_version: Hashable) -> Tuple:
+    """キャッシュのキー（選択の順番や出発地の細かな違いは同じキーになる）"""
+    return (
+        mode,
+        (round(float(origin[0]), ORIGIN_DECIMALS), round(float(origin[1]), ORIGIN_DECIMALS)),
+        tuple(sorted(spot_names)),
+        travel_mode,
+        dataset_version,
+    )
+
+
+class RouteCache:
+    """LRUで古いものから捨てる訪問順のキャッシュ
+
+    Args:
+        max_entries: 保存する結果の最大件数
+        max_stops: 保存する訪問順の合計スポット数の上限（大きな選択でメモリを使い過ぎないように）
+    """
+
+    def __init__(self, max_entries: int = 2048, max_stops: int = 50000):
+        self.max_entries = max_entries
+        self.max_stops = max_stops
+        self._entries: 'OrderedDict[Tuple, List[int]]' = OrderedDict()
+        self._stops = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple) -> Optional[List[int]]:
+        with self._lock:
+            route = self._entries.get(key)
+            if route is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(route)
+
+    def put(self, key: Tuple, route: List[int]):
+        route = list(route)
+        if len(route) > self.max_stops:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._stops -= len(old)
+            self._entries[key] = route
+            self._stops += len(route)
+            while len(self._entries) > self.max_entries or self._stops > self.max_stops:
+                _, evicted = self._entries.popitem(last=False)
+                self._stops -= len(evicted)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Tuple, compute: Callable[[], List[int]]) -> Tuple[List[int], bool]:
+        """キャッシュにあればそれを、なければ compute() の結果を保存して返す
+
+        Returns: (訪問順, キャッシュから返したか)
+        """
+        route = self.get(key)
+        if route is not None:
+            return route, True
+        route = compute()
+        self.put(key, route)
+        return list(route), False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stops = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'stops': self._stops,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hit_rate, 4),
+            }
@@ -0,0 +1,284 @@
+"""経路計算・Google Mapsリンク生成のモジュール
+
+Streamlitの画面（streamlit_app.py）とヘッドレスのHTTP API（api_server.py）の
+両方から使うため、Streamlitには依存しない。
+"""
+from datetime import datetime, timedelta
+from math import radians, sin, cos, sqrt, atan2
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 距離計算関数
+def calculate_distance(lat1, lng1, lat2, lng2):
+    """2点間の距離を計算（km）- ヒュベニの公式"""
+    R = 6371  # 地球の半径（km）
+
+    lat1_rad = radians(lat1)
+    lat2_rad = radians(lat2)
+    delta_lat = radians(lat2 - lat1)
+    delta_lng = radians(lng2 - lng1)
+
+    a = sin(delta_lat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lng/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1-a))
+
+    return R * c
+
+# 1区間の移動時間（分）
+def _travel_minutes(travel_times, from_idx: Optional[int], to_idx: int, dist: float, speed_kmh: float) -> float:
+    """所要時間行列があれば表引きし、なければ一定速度で計算する"""
+    if travel_times is None:
+        return (dist / speed_kmh) * 60
+    origin_times, time_matrix = travel_times
+    if from_idx is None:
+        return float(origin_times[to_idx])
+    return float(time_matrix[from_idx, to_idx])
+
+# 最適化経路算出関数（観光モード：待ち時間考慮）
+def optimize_route_tourism(current_loc: List[float], spots_df: pd.DataFrame, selected_indices: List[int],
+                           wait_time_fn: Optional[Callable[[int, datetime], float]] = None,
+                           start_time: Optional[datetime] = None,
+                           dist_matrix: Optional[np.ndarray] = None,
+                           travel_times: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[List[int], float, float]:
+    """
+    観光モード用の最適化経路算出（待ち時間と距離を考慮）
+    Args:
+        wait_time_fn: (スポットのインデックス, 到着予定時刻) → 予測待ち時間（分）。
+            省略時は「待ち時間（分）」列の値を使う
+        start_time: 出発時刻（省略時は現在時刻）
+        dist_matrix: スポット間の距離行列（km、spots_df の行順）。あればスポット間の距離は表引きする
+        travel_times: 移動手段ごとの (出発地からの所要時間, スポット間の所要時間行列)（分、TravelTimeModel.travel_times）。
+            あれば距離の代わりに所要時間で順位付けし、移動時間に使う。省略時は時速40kmで計算する
+    Returns: (訪問順のインデックスリスト, 総移動距離, 総所要時間)
+    """
+    if not selected_indices:
+        return [], 0.0, 0.0
+
+    if start_time is None:
+        start_time = datetime.now()
+
+    unvisited = selected_indices.copy()
+    route = []
+    current_position = current_loc
+    current_idx = None  # 現在地がスポットの場合はそのインデックス
+    total_distance = 0.0
+    total_time = 0.0
+
+    while unvisited:
+        # 各未訪問スポットのスコアを計算
+        scores = []
+        distances = []
+        travel_minutes = []
+        wait_times = []
+
+        for idx in unvisited:
+            spot = spots_df.iloc[idx]
+            if dist_matrix is not None and current_idx is not None:
+                dist = float(dist_matrix[current_idx, idx])
+            else:
+                dist = calculate_distance(
+                    current_position[0], current_position[1],
+                    spot['緯度'], spot['経度']
+                )
+            distances.append(dist)
+            travel_minutes.append(_travel_minutes(travel_times, current_idx, idx, dist, 40))
+            if wait_time_fn is not None:
+                # 到着予定時刻の待ち時間を予測値で評価する
+                eta = start_time + timedelta(minutes=total_time + travel_minutes[-1])
+                wait_time = wait_time_fn(idx, eta)
+            else:
+                wait_time = spot.get('待ち時間（分）', 0)
+            wait_times.append(wait_time)
+
+        # 距離ランキング（近い順に1, 2, 3...。所要時間行列があれば移動時間の短い順）
+        closeness = travel_minutes if travel_times is not None else distances
+        distance_ranks = [sorted(closeness).index(d) + 1 for d in closeness]
+
+        # 待ち時間ランキング（短い順に1, 2, 3...）
+        wait_time_ranks = [sorted(wait_times).index(w) + 1 for w in wait_times]
+
+        # スコア計算: S = RD + RW（小さいほど良い）
+        scores = [distance_ranks[i] + wait_time_ranks[i] for i in range(len(unvisited))]
+
+        # 最小スコアのスポットを選択
+        min_score_idx = scores.index(min(scores))
+        selected_idx = unvisited[min_score_idx]
+
+        route.append(selected_idx)
+        selected_spot = spots_df.iloc[selected_idx]
+
+        # 移動距離と時間を加算
+        travel_dist = distances[min_score_idx]
+        total_distance += travel_dist
+        total_time += travel_minutes[min_score_idx]
+        total_time += selected_spot.get('所要時間（参考）', 60)
+        total_time += wait_times[min_score_idx]
+
+        # 現在地を更新
+        current_position = [selected_spot['緯度'], selected_spot['経度']]
+        current_idx = selected_idx
+        unvisited.remove(selected_idx)
+
+    return route, total_distance, total_time
+
+# 最適化経路算出関数（防災モード：最近傍法）
+def optimize_route_disaster(current_loc: List[float], spots_df: pd.DataFrame, selected_indices: List[int],
+                            dist_matrix: Optional[np.ndarray] = None,
+                            travel_times: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[List[int], float, float]:
+    """
+    防災モード用の最適化経路算出（距離のみ考慮）
+    Args:
+        dist_matrix: スポット間の距離行列（km、spots_df の行順）。あればスポット間の距離は表引きする
+        travel_times: 徒歩の (出発地からの所要時間, スポット間の所要時間行列)（分）。
+            総所要時間の計算に使う。省略時は時速4kmで計算する
+    Returns: (訪問順のインデックスリスト, 総移動距離, 総所要時間)
+    """
+    if not selected_indices:
+        return [], 0.0, 0.0
+
+    unvisited = selected_indices.copy()
+    route = []
+    current_position = current_loc
+    current_idx = None  # 現在地がスポットの場合はそのインデックス
+    total_distance = 0.0
+    total_time = 0.0
+
+    while unvisited:
+        # 最も近いスポットを選択
+        min_dist = float('inf')
+        nearest_idx = None
+
+        for idx in unvisited:
+            spot = spots_df.iloc[idx]
+            if dist_matrix is not None and current_idx is not None:
+                dist = float(dist_matrix[current_idx, idx])
+            else:
+                dist = calculate_distance(
+                    current_position[0], current_position[1],
+                    spot['緯度'], spot['経度']
+                )
+            if dist < min_dist:
+                min_dist = dist
+                nearest_idx = idx
+
+        route.append(nearest_idx)
+        selected_spot = spots_df.iloc[nearest_idx]
+
+        # 移動距離と時間を加算
+        total_distance += min_dist
+        total_time += _travel_minutes(travel_times, current_idx, nearest_idx, min_dist, 4)
+
+        # 現在地を更新
+        current_position = [selected_spot['緯度'], selected_spot['経度']]
+        current_idx = nearest_idx
+        unvisited.remove(nearest_idx)
+
+    return route, total_distance, total_time
+
+# 訪問順が決まっているルートの評価（観光モード）
+def evaluate_route_tourism(current_loc: List[float], spots_df: pd.DataFrame, route: List[int],
+                           wait_time_fn: Optional[Callable[[int, datetime], float]] = None,
+                           start_time: Optional[datetime] = None,
+                           dist_matrix: Optional[np.ndarray] = None,
+                           travel_times: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[float, float]:
+    """
+    訪問順どおりに回った場合の総移動距離と総所要時間（optimize_route_tourism と同じ計算）
+    Returns: (総移動距離, 総所要時間)
+    """
+    if start_time is None:
+        start_time = datetime.now()
+
+    current_position = current_loc
+    current_idx = None
+    total_distance = 0.0
+    total_time = 0.0
+
+    for idx in route:
+        spot = spots_df.iloc[idx]
+        if dist_matrix is not None and current_idx is not None:
+            dist = float(dist_matrix[current_idx, idx])
+        else:
+            dist = calculate_distance(current_position[0], current_position[1], spot['緯度'], spot['経度'])
+        total_distance += dist
+        total_time += _travel_minutes(travel_times, current_idx, idx, dist, 40)
+        if wait_time_fn is not None:
+            total_time += wait_time_fn(idx, start_time + timedelta(minutes=total_time))
+        else:
+            total_time += spot.get('待ち時間（分）', 0)
+        total_time += spot.get('所要時間（参考）', 60)
+        current_position = [spot['緯度'], spot['経度']]
+        current_idx = idx
+
+    return total_distance, total_time
+
+# 訪問順が決まっているルートの評価（防災モード）
+def evaluate_route_disaster(current_loc: List[float], spots_df: pd.DataFrame, route: List[int],
+                            dist_matrix: Optional[np.ndarray] = None,
+                            travel_times: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[float, float]:
+    """
+    訪問順どおりに回った場合の総移動距離と総所要時間（徒歩）
+    Returns: (総移動距離, 総所要時間)
+    """
+    current_position = current_loc
+    current_idx = None
+    total_distance = 0.0
+    total_time = 0.0
+
+    for idx in route:
+        spot = spots_df.iloc[idx]
+        if dist_matrix is not None and current_idx is not None:
+            dist = float(dist_matrix[current_idx, idx])
+        else:
+            dist = calculate_distance(current_position[0], current_position[1], spot['緯度'], spot['経度'])
+        total_distance += dist
+        total_time += _travel_minutes(travel_times, current_idx, idx, dist, 4)
+        current_position = [spot['緯度'], spot['経度']]
+        current_idx = idx
+
+    return total_distance, total_time
+
+# Google Mapsリンク生成関数（単一目的地）
+def create_google_maps_link(origin, destination, mode='driving'):
+    """Google Mapsの外部リンクを生成（単一目的地）"""
+    modes = {
+        'driving': 'driving',
+        'walking': 'walking',
+        'bicycling': 'bicycling',
+        'transit': 'transit'
+    }
+    base_url = "https://www.google.com/maps/dir/?api=1"
+    link = f"{base_url}&origin={origin[0]},{origin[1]}&destination={destination[0]},{destination[1]}&travelmode={modes[mode]}"
+    return link
+
+# Google Mapsリンク生成関数（複数経由地）
+def create_google_maps_multi_link(origin: List[float], waypoints: List[Tuple[float, float]], destination: Tuple[float, float], mode='driving') -> str:
+    """
+    Google Mapsの外部リンクを生成（複数経由地対応）
+    Args:
+        origin: 出発地 [緯度, 経度]
+        waypoints: 経由地のリスト [(緯度, 経度), ...]
+        destination: 最終目的地 (緯度, 経度)
+        mode: 移動手段
+    Returns:
+        Google Maps URL
+    """
+    modes = {
+        'driving': 'driving',
+        'walking': 'walking',
+        'bicycling': 'bicycling',
+        'transit': 'transit'
+    }
+
+    base_url = "https://www.google.com/maps/dir/?api=1"
+    url = f"{base_url}&origin={origin[0]},{origin[1]}&destination={destination[0]},{destination[1]}"
+
+    if waypoints:
+        waypoints_str = "|".join([f"{lat},{lng}" for lat, lng in waypoints])
+        url += f"&waypoints={waypoints_str}"
+
+    url += f"&travelmode={modes.get(mode, 'driving')}"
+
+    return url
+
+
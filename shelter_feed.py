@@ -0,0 +1,304 @@
+"""避難所の開設状況フィードを取り込むモジュール
+
+フィード（ポーリングするJSONLファイル、ローカルHTTPエンドポイント、キュー）から
+避難所ごとの差分（状態・収容人数）を受け取り、全セッションで共有している
+防災データフレームを更新する。更新は変更を適用したコピーへの差し替えで行い、読み取り側は
+ロックを取らずに store.df を1回読めば、更新の途中ではない一貫したデータを使える。更新ごとにバージョンを進め、
+各セッションは自分が最後に見たバージョン以降に変わった行だけを再描画する。
+
+差分レコードの形式（JSON 1件）:
+    {"name": "中央公民館", "status": "開設中", "capacity": 300}
+    キーは "スポット名"/"状態"/"収容人数"/"No" でもよい。
+"""
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+# 差分レコードのキー → データフレームのカラム
+FIELD_ALIASES = {
+    'status': '状態',
+    '状態': '状態',
+    'capacity': '収容人数',
+    '収容人数': '収容人数',
+}
+INT_FIELDS = {'収容人数'}
+
+
+class ShelterStatusStore:
+    """防災データフレームを共有し、差分を適用するストア
+
+    差分は df のコピーに適用してから df を差し替える（既に読み出したデータフレームは変更しない）。
+
+    Args:
+        disaster_df: 全セッションで共有する防災データ（最初の df。以降の更新では変更しない）
+        history_size: changed_since で遡れる更新バッチ数
+    """
+
+    def __init__(self, disaster_df, history_size: int = 1000):
+        self.df = disaster_df
+        self.lock = threading.RLock()
+        self.version = 0
+        self._by_name = {name: idx for idx, name in zip(disaster_df.index, disaster_df['スポット名'])}
+        self._by_no = {}
+        if 'No' in disaster_df.columns:
+            self._by_no = {str(no): idx for idx, no in zip(disaster_df.index, disaster_df['No'])}
+        self._history = deque(maxlen=history_size)  # (version, [変更された行インデックス])
+        self._listeners: List[Callable[[List[int], int], None]] = []
+        self.stats = {'received': 0, 'applied': 0, 'coalesced': 0, 'unknown': 0, 'batches': 0}
+
+    def _resolve(self, delta: Dict) -> Optional[int]:
+        name = delta.get('name', delta.get('スポット名'))
+        if name is not None and name in self._by_name:
+            return self._by_name[name]
+        no = delta.get('no', delta.get('No'))
+        if no is not None:
+            return self._by_no.get(str(no))
+        return None
+
+    def apply(self, deltas: Iterable[Dict]) -> List[int]:
+        """差分をまとめて適用し、実際に値が変わった行のインデックスを返す
+
+        同じ避難所への複数の差分はフィールドごとに最後の値だけを使う
+        （災害時の短時間の連続更新でも1バッチにつき1回の通知で済む）。
+        """
+        merged: Dict[int, Dict] = {}
+        received = 0
+        unknown = 0
+        for delta in deltas:
+            received += 1
+            idx = self._resolve(delta)
+            if idx is None:
+                unknown += 1
+                continue
+            fields = merged.setdefault(idx, {})
+            for key, value in delta.items():
+                column = FIELD_ALIASES.get(key)
+                if column is not None:
+                    fields[column] = value
+
+        changed = []
+        with self.lock:
+            df = None  # 変更がある場合だけコピーを作る
+            for idx, fields in merged.items():
+                row_changed = False
+                for column, value in fields.items():
+                    if column in INT_FIELDS:
+                        try:
+                            value = int(value)
+                        except (TypeError, ValueError):
+                            continue
+                    if column not in self.df.columns:
+                        continue
+                    if self.df.at[idx, column] != value:
+                        if df is None:
+                            df = self.df.copy()
+                        df.at[idx, column] = value
+                        row_changed = True
+                if row_changed:
+                    changed.append(idx)
+            if df is not None:
+                self.df = df
+
+            self.stats['received'] += received
+            self.stats['unknown'] += unknown
+            self.stats['coalesced'] += received - unknown - len(merged)
+            self.stats['applied'] += len(changed)
+            self.stats['batches'] += 1
+            if changed:
+                self.version += 1
+                self._history.append((self.version, changed))
+            version = self.version
+            listeners = list(self._listeners)
+
+        if changed:
+            for callback in listeners:
+                try:
+                    callback(changed, version)
+                except Exception:
+                    pass
+        return changed
+
+    def changed_since(self, version: int) -> Optional[List[int]]:
+        """指定バージョンより後に変わった行のインデックスを返す
+
+        履歴から遡れないほど古いバージョンの場合はNone（全件再描画が必要）。
+        """
+        with self.lock:
+            if version >= self.version:
+                return []
+            if not self._history or self._history[0][0] > version + 1:
+                return None
+            changed = []
+            seen = set()
+            for entry_version, rows in reversed(self._history):
+                if entry_version <= version:
+                    break
+                for idx in rows:
+                    if idx not in seen:
+                        seen.add(idx)
+                        changed.append(idx)
+            return changed
+
+    def subscribe(self, callback: Callable[[List[int], int], None]):
+        """更新時に callback(変更行, バージョン) を呼ぶ"""
+        with self.lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+
+class FileFeedSource:
+    """追記されていくJSONLファイルをポーリングするフィード"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offset = 0
+        self._partial = b''
+        self._pending: List[Dict] = []
+
+    def _read_new(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < self._offset:
+            # ファイルが作り直された場合は先頭から読み直す
+            self._offset = 0
+            self._partial = b''
+        if size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        self._offset += len(chunk)
+        lines = (self._partial + chunk).split(b'\n')
+        self._partial = lines.pop()  # 書きかけの最終行は次回に回す
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                self._pending.append(json.loads(line))
+            except ValueError:
+                continue
+
+    def poll(self, max_items: int = 10000) -> List[Dict]:
+        if not self._pending:
+            self._read_new()
+        items, self._pending = self._pending[:max_items], self._pending[max_items:]
+        return items
+
+
+class HttpFeedSource:
+    """ローカルHTTPエンドポイントをポーリングするフィード
+
+    GET {url}?since={cursor} に対して {"cursor": 次のカーソル, "updates": [...]}
+    または差分のリストを返すエンドポイントを想定する。
+    """
+
+    def __init__(self, url: str, timeout: float = 3.0):
+        self.url = url
+        self.timeout = timeout
+        self.cursor = 0
+
+    def poll(self, max_items: int = 10000) -> List[Dict]:
+        sep = '&' if '?' in self.url else '?'
+        try:
+            with urllib.request.urlopen(f"{self.url}{sep}since={self.cursor}", timeout=self.timeout) as response:
+                payload = json.loads(response.read().decode('utf-8'))
+        except Exception:
+            return []
+        if isinstance(payload, dict):
+            self.cursor = payload.get('cursor', self.cursor)
+            return payload.get('updates', [])
+        return payload
+
+
+class QueueFeedSource:
+    """プロセス内のキューから差分を受け取るフィード（テストやメッセージキューの代替）"""
+
+    def __init__(self, q: Optional[queue.Queue] = None):
+        self.queue = q or queue.Queue()
+
+    def put(self, delta: Dict):
+        self.queue.put(delta)
+
+    def poll(self, max_items: int = 10000) -> List[Dict]:
+        items = []
+        while len(items) < max_items:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+
+def feed_source_from_env(value: Optional[str] = None):
+    """HITA_SHELTER_FEED からフィードを作る
+
+    "http://..." ならHTTP、"file:パス" またはパスならJSONLファイル。未設定ならNone。
+    """
+    value = value if value is not None else os.environ.get('HITA_SHELTER_FEED', '')
+    if not value:
+        return None
+    if value.startswith(('http://', 'https://')):
+        return HttpFeedSource(value)
+    if value.startswith('file:'):
+        value = value[len('file:'):]
+    return FileFeedSource(value)
+
+
+class FeedIngestor:
+    """フィードを定期的にポーリングしてストアへ適用するバックグラウンドスレッド
+
+    1回のポーリングで届いた差分は1バッチとしてまとめて適用するため、
+    更新頻度が上がっても通知回数は poll_interval で頭打ちになる。
+    store は apply(レコードのリスト) を持つものなら何でもよい。
+    """
+
+    def __init__(self, store, source, poll_interval: float = 1.0,
+                 max_batch: int = 10000):
+        self.store = store
+        self.source = source
+        self.poll_interval = poll_interval
+        self.max_batch = max_batch
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="shelter-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def ingest_once(self):
+        """1回ポーリングして適用し、(受け取った件数, apply の戻り値) を返す"""
+        items = self.source.poll(self.max_batch)
+        if not items:
+            return 0, []
+        return len(items), self.store.apply(items)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                received, _ = self.ingest_once()
+                self.last_error = None
+                if received >= self.max_batch:
+                    # 溜まっている差分は待たずに続けて取り込む
+                    continue
+            except Exception as e:
+                self.last_error = str(e)
+            self._stop.wait(max(0.0, self.poll_interval - (time.monotonic() - started)))
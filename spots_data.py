@@ -0,0 +1,283 @@
+"""スポットデータ（spots.xlsx）の読み込みモジュール
+
+Streamlitの画面とヘッドレスのHTTP API・バッチ処理で同じデータを使うため、
+Streamlitには依存しない。エラーは例外で通知し、表示は呼び出し側で行う。
+
+ワークブックは読み取り専用モードで1回だけ開き、シートを先頭から順に行単位で読み込む
+（コンビニ・スーパー・自動販売機など数万行のシートを追加しても、一度にシート全体を展開しない）。
+行は CHUNK_ROWS 行ずつデータフレームにまとめ、所要時間の変換・座標の範囲・名前の重複の確認は
+列単位でまとめて行う。シートごとの読み込み時間とピークメモリは SheetReport で返す。
+"""
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+SPOTS_PATH = 'spots.xlsx'
+TOURISM_SHEET = '観光'
+DISASTER_SHEET = '防災'
+# 観光・防災と同じ形式（スポット名・緯度・経度）で追加できる施設のシート
+FACILITY_SHEETS = ('コンビニ', 'スーパー', '自動販売機')
+# 必須カラム
+REQUIRED_COLUMNS = {
+    TOURISM_SHEET: ['No', 'スポット名', '緯度', '経度', '説明'],
+    DISASTER_SHEET: ['No', 'スポット名', '緯度', '経度', '説明'],
+}
+FACILITY_COLUMNS = ['スポット名', '緯度', '経度']
+# 有効な座標の範囲（日本の範囲）。範囲外・空欄の行は読み込まない
+LAT_BOUNDS = (20.0, 46.0)
+LNG_BOUNDS = (122.0, 154.0)
+# 何行ずつデータフレームにまとめるか
+CHUNK_ROWS = 5000
+# 所要時間が読み取れない場合の値（分）
+DEFAULT_MINUTES = 60
+MINUTES_PATTERN = re.compile(r'(\d+)')
+
+
+# 所要時間の変換処理（「60分」→60のような変換）
+def parse_time(value):
+    """所要時間の値を数値に変換"""
+    if pd.isna(value) or value == '-':
+        return DEFAULT_MINUTES  # デフォルト値
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        # 「60分」のような文字列から数値を抽出
+        match = MINUTES_PATTERN.search(value)
+        if match:
+            return int(match.group(1))
+    return DEFAULT_MINUTES  # パースできない場合はデフォルト値
+
+
+def parse_time_column(values: pd.Series) -> pd.Series:
+    """所要時間の列をまとめて数値に変換（parse_time と同じ結果）"""
+    numeric = pd.to_numeric(values, errors='coerce')
+    extracted = pd.to_numeric(values.astype('string').str.extract(MINUTES_PATTERN, expand=False), errors='coerce')
+    minutes = numeric.where(numeric.notna(), extracted).fillna(DEFAULT_MINUTES)
+    return minutes.astype('float64').astype('int64')
+
+
+@dataclass
+class SheetReport:
+    """1シートの読み込み結果"""
+    sheet: str
+    rows: int = 0
+    kept: int = 0
+    invalid_coords: int = 0
+    duplicates: int = 0
+    seconds: float = 0.0
+    peak_bytes: Optional[int] = None  # trace_memory=True の場合のみ
+
+    def __str__(self):
+        memory = f" ピーク {self.peak_bytes / 1024 / 1024:.1f}MB" if self.peak_bytes is not None else ""
+        return (f"{self.sheet}: {self.kept}/{self.rows}行（座標不正 {self.invalid_coords}・重複 {self.duplicates}）"
+                f" {self.seconds * 1000:.0f}ms{memory}")
+
+
+def _read_rows(worksheet, chunk_rows: int) -> pd.DataFrame:
+    """1行目を見出しとしてシートを行単位で読み、chunk_rows 行ずつデータフレームにまとめる"""
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    # 見出しの無い末尾の列は捨てる（途中の空の見出しは read_excel と同じ名前にする）
+    width = len(header)
+    while width and header[width - 1] is None:
+        width -= 1
+    columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header[:width])]
+    padding = (None,) * width
+    chunks, buffer = [], []
+    for row in rows:
+        row = row[:width] if len(row) >= width else row + padding[len(row):]
+        if all(value is None for value in row):
+            continue
+        buffer.append(row)
+        if len(buffer) >= chunk_rows:
+            chunks.append(pd.DataFrame.from_records(buffer, columns=columns))
+            buffer = []
+    if buffer or not chunks:
+        chunks.append(pd.DataFrame.from_records(buffer, columns=columns))
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def validate_locations(df: pd.DataFrame, report: SheetReport) -> pd.DataFrame:
+    """座標が空欄・範囲外の行と、スポット名が重複する行（2件目以降）を除く"""
+    lat = pd.to_numeric(df['緯度'], errors='coerce')
+    lng = pd.to_numeric(df['経度'], errors='coerce')
+    valid = lat.between(*LAT_BOUNDS) & lng.between(*LNG_BOUNDS)
+    duplicated = df['スポット名'].duplicated() & valid
+    report.invalid_coords = int((~valid).sum())
+    report.duplicates = int(duplicated.sum())
+    df = df.assign(緯度=lat, 経度=lng)
+    if report.invalid_coords or report.duplicates:
+        df = df[valid & ~duplicated].reset_index(drop=True)
+    return df
+
+
+def _check_columns(df: pd.DataFrame, sheet: str, required: Iterable[str]):
+    for col in required:
+        if col not in df.columns:
+            raise ValueError(f"{sheet}シートに'{col}'カラムがありません")
+
+
+def normalize_tourism(tourism_df: pd.DataFrame) -> pd.DataFrame:
+    """観光データの標準化（所要時間の変換と、無いカラムの既定値）"""
+    if '所要時間（参考）' in tourism_df.columns:
+        tourism_df['所要時間（参考）'] = parse_time_column(tourism_df['所要時間（参考）'])
+    else:
+        tourism_df['所要時間（参考）'] = DEFAULT_MINUTES  # デフォルト60分
+
+    if 'カテゴリ' not in tourism_df.columns:
+        tourism_df['カテゴリ'] = '観光地'
+    if '営業時間' not in tourism_df.columns:
+        tourism_df['営業時間'] = '終日'
+    if '料金' not in tourism_df.columns:
+        tourism_df['料金'] = '無料'
+    if '待ち時間（分）' not in tourism_df.columns:
+        tourism_df['待ち時間（分）'] = 0
+    if '混雑状況' not in tourism_df.columns:
+        tourism_df['混雑状況'] = '空いている'
+
+    # 待ち時間を数値型に変換
+    tourism_df['待ち時間（分）'] = pd.to_numeric(tourism_df['待ち時間（分）'], errors='coerce').fillna(0).astype(int)
+    return tourism_df
+
+
+def normalize_disaster(disaster_df: pd.DataFrame) -> pd.DataFrame:
+    """防災データの標準化（所要時間の変換と、収容人数・状態の既定値）"""
+    if '所要時間（参考）' in disaster_df.columns:
+        disaster_df['所要時間（参考）'] = parse_time_column(disaster_df['所要時間（参考）'])
+
+    if '収容人数' not in disaster_df.columns:
+        disaster_df['収容人数'] = 0
+    if '状態' not in disaster_df.columns:
+        disaster_df['状態'] = '待機中'
+
+    # 収容人数を数値型に変換
+    disaster_df['収容人数'] = pd.to_numeric(disaster_df['収容人数'], errors='coerce').fillna(0).astype(int)
+    return disaster_df
+
+
+NORMALIZERS = {TOURISM_SHEET: normalize_tourism, DISASTER_SHEET: normalize_disaster}
+
+
+def ingest_workbook(path: str = SPOTS_PATH, sheets: Optional[Sequence[str]] = None, trace_memory: bool = False,
+                    chunk_rows: int = CHUNK_ROWS) -> Tuple[Dict[str, pd.DataFrame], List[SheetReport]]:
+    """ワークブックを1回だけ開き、シートを順に読み込む
+
+    観光・防災・施設のシートは必須カラムの確認・座標と重複の確認・標準化を行い、
+    それ以外のシート（イベントなど）は読み込んだまま返す。
+
+    Args:
+        path: Excelファイル
+        sheets: 読み込むシート名（省略時はすべて）
+        trace_memory: シートごとのピークメモリを tracemalloc で計測する（読み込みは遅くなる）
+        chunk_rows: 何行ずつデータフレームにまとめるか
+    Returns: (シート名 → データフレーム, シートごとの SheetReport)
+    Raises:
+        FileNotFoundError: ファイルがない場合
+        ValueError: 必須カラムがない場合
+    """
+    import openpyxl
+
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    frames: Dict[str, pd.DataFrame] = {}
+    reports: List[SheetReport] = []
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            sheet = worksheet.title
+            if sheets is not None and sheet not in sheets:
+                continue
+            if trace_memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            report = SheetReport(sheet)
+            df = _read_rows(worksheet, chunk_rows)
+            report.rows = len(df)
+            required = REQUIRED_COLUMNS.get(sheet, FACILITY_COLUMNS if sheet in FACILITY_SHEETS else None)
+            if required is not None:
+                _check_columns(df, sheet, required)
+                df = validate_locations(df, report)
+                if sheet in NORMALIZERS:
+                    df = NORMALIZERS[sheet](df)
+            report.kept = len(df)
+            report.seconds = time.perf_counter() - started
+            if trace_memory:
+                report.peak_bytes = tracemalloc.get_traced_memory()[1] - baseline
+            frames[sheet] = df
+            reports.append(report)
+    finally:
+        workbook.close()
+        if started_tracing:
+            tracemalloc.stop()
+    return frames, reports
+
+
+def spots_frames(frames: Dict[str, pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """読み込んだシートから観光・防災データを取り出す
+
+    Raises:
+        ValueError: 観光・防災のシートがない場合
+    """
+    for sheet in (TOURISM_SHEET, DISASTER_SHEET):
+        if sheet not in frames:
+            raise ValueError(f"{sheet}シートがありません")
+    return frames[TOURISM_SHEET], frames[DISASTER_SHEET]
+
+
+def read_spots_workbook(path: str = SPOTS_PATH) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Excelファイルから観光・防災データを読み込んで標準化する
+
+    Raises:
+        FileNotFoundError: ファイルがない場合
+        ValueError: 必須カラムがない場合
+    """
+    frames, _ = ingest_workbook(path, sheets=(TOURISM_SHEET, DISASTER_SHEET))
+    return spots_frames(frames)
+
+
+def sample_spots_data() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """spots.xlsxがない場合のサンプルデータ"""
+    # サンプルデータを作成
+    tourism_df = pd.DataFrame({
+        'No': [1, 2, 3, 4, 5, 6],
+        'スポット名': ['豆田町', '日田温泉', '咸宜園', '天ヶ瀬温泉', '小鹿田焼の里', '大山ダム'],
+        '緯度': [33.3219, 33.3200, 33.3240, 33.2967, 33.3500, 33.3800],
+        '経度': [130.9414, 130.9400, 130.9430, 130.9167, 130.9600, 130.9200],
+        '所要時間（参考）': [60, 120, 45, 90, 75, 30],
+        '説明': ['江戸時代の町並みが残る歴史的な地区', '日田の名湯・温泉施設',
+               '日本最大の私塾跡・歴史的教育施設', '自然豊かな温泉街',
+               '伝統工芸の陶器の里', '美しい景観のダム'],
+        'カテゴリ': ['歴史', 'グルメ', '歴史', '自然', '体験', '自然'],
+        '営業時間': ['終日', '9:00-21:00', '9:00-17:00', '終日', '9:00-17:00', '終日'],
+        '料金': ['無料', '500円', '300円', '無料', '無料', '無料'],
+        '待ち時間（分）': [0, 15, 0, 10, 5, 0],
+        '混雑状況': ['空いている', '混雑', '普通', '空いている', '空いている', '空いている']
+    })
+    disaster_df = pd.DataFrame({
+        'No': [1, 2, 3, 4, 5],
+        'スポット名': ['日田市役所（避難所）', '中央公民館', '総合体育館', '桂林公民館', '三花公民館'],
+        '緯度': [33.3219, 33.3250, 33.3180, 33.3300, 33.3100],
+        '経度': [130.9414, 130.9450, 130.9380, 130.9500, 130.9350],
+        '所要時間（参考）': [60, 60, 60, 60, 60],
+        '説明': ['市役所・第一避難所', '中央地区の避難所', '大規模避難所', 
+               '桂林地区の避難所', '三花地区の避難所'],
+        '収容人数': [500, 300, 800, 200, 250],
+        '状態': ['開設中', '開設中', '開設中', '待機中', '待機中']
+    })
+    return tourism_df, disaster_df
+
+
+def load_spots_frames(path: str = SPOTS_PATH) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Excelを読み込み、ファイルがなければサンプルデータを返す"""
+    try:
+        return read_spots_workbook(path)
+    except FileNotFoundError:
+        return sample_spots_data()
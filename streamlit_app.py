@@ -1,18 +1,50 @@
+import importlib
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 import streamlit as st
-import pandas as pd
-import folium
 import streamlit.components.v1 as components
-from streamlit_folium import st_folium
-from datetime import datetime
-from math import radians, sin, cos, sqrt, atan2
-from typing import List, Tuple
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from datetime import date, datetime, timedelta
+from cold_start import STARTUP
 from gps_component import gps_locator  # GPS機能をインポート
-
-try:
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
-except ImportError:
-    GENAI_AVAILABLE = False
+from spots_data import DISASTER_SHEET, SPOTS_PATH, TOURISM_SHEET, ingest_workbook, sample_spots_data, spots_frames
+from route_engine import (
+    calculate_distance,
+    optimize_route_tourism,
+    optimize_route_disaster,
+    evaluate_route_tourism,
+    evaluate_route_disaster,
+    create_google_maps_link,
+    create_google_maps_multi_link
+)
+from weather import WeatherService
+from shelter_feed import ShelterStatusStore, FeedIngestor, feed_source_from_env
+from wait_times import WaitTimeStore, WaitTimeForecaster, congestion_label
+from analytics import EventLogger
+from events import EVENTS_SHEET, EventCalendar, default_events, load_events
+from aggregates import ShelterAggregates, TourismAggregates
+from meetup import meeting_points
+from itinerary import plan_itinerary
+from reoptimize import RouteCost, reached_stops, resume, update_selection
+from hazards import hazard_adjusted_distances, load_hazard_index
+from local_search import improve_route, PARALLEL_SEARCH_MIN_SPOTS
+from distance_matrix import origin_distances
+from route_cache import RouteCache, dataset_fingerprint, route_cache_key
+from travel_time import TravelTimeModel, TRAVEL_PROFILES
+from tile_cache import DEFAULT_MBTILES_PATH, MBTilesStore, start_tile_server, tile_layer_settings
+from load_control import LoadGovernor
+from gemini_client import GeminiClientManager, GeminiError
+# folium・streamlit_folium は読み込みに時間がかかるため、初回の利用時に読み込む
+# （初回表示の後はバックグラウンドで先に読み込んでおく。start_warmup を参照）。
+# 既定のタブは地図なので、起動直後の最初の表示では地図を描かずに枠だけ出し、直後の再実行で描く（defer_first_map）。
+# ヘッドレスAPI・オフライン版の書き出しも、設定されている場合だけ読み込む
+HEAVY_MODULES = ('folium', 'streamlit_folium')
+
+STARTUP.mark('imports')
 
 # ページ設定
 st.set_page_config(
@@ -37,234 +69,331 @@ if 'disaster_optimized_route' not in st.session_state:
     st.session_state.disaster_optimized_route = None
 if 'gemini_api_key' not in st.session_state:
     st.session_state.gemini_api_key = ""
+if 'load_session_id' not in st.session_state:
+    st.session_state.load_session_id = uuid.uuid4().hex
+
+# 縮退運転と受け入れ制御（全セッションで共有）
+@st.cache_resource
+def get_load_governor():
+    """同時セッション数と再実行の所要時間から運転モードを決める"""
+    return LoadGovernor(
+        max_sessions=int(os.environ.get('HITA_MAX_SESSIONS', 150)),
+        admit_sessions=int(os.environ.get('HITA_ADMIT_SESSIONS', 300))
+    )
+
+# Gemini API のクライアント（APIキーごとに使い回し、全セッションで頻度・同時実行数を制限）
+@st.cache_resource
+def get_gemini_manager():
+    """キーごと・全体のレート制限と再試行を行うクライアント管理"""
+    return GeminiClientManager(
+        global_rate=float(os.environ.get('HITA_GEMINI_RPS', 10.0)),
+        global_concurrency=int(os.environ.get('HITA_GEMINI_CONCURRENCY', 16))
+    )
+
+# 一覧の表示件数の上限（縮退モード時）
+DEGRADED_LIST_LIMIT = 20
+
+def in_fragment_rerun():
+    """フラグメントだけの再実行中かどうか"""
+    ctx = get_script_run_ctx()
+    return ctx is not None and bool(ctx.fragment_ids_this_run)
+
+def rerun_view():
+    """フラグメントだけの再実行中ならそのフラグメントだけを、そうでなければページ全体を再実行する"""
+    st.rerun(scope='fragment' if in_fragment_rerun() else 'app')
+
+@contextmanager
+def timed_rerun(scope):
+    """フラグメント単位の所要時間を記録する（フラグメントだけの再実行は縮退モードの判定にも使う）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        st.session_state.setdefault('rerun_seconds', {})[scope] = seconds
+        if in_fragment_rerun():
+            load_governor.record_latency(seconds)
+
+rerun_started = time.perf_counter()
+load_governor = get_load_governor()
+if not load_governor.admit(st.session_state.load_session_id,
+                           disaster=st.session_state.get('mode_selector') == '防災モード'):
+    # 受け入れ上限を超えた場合、新しい観光モードのセッションは受け付けない（防災モードは常に受け付ける）
+    st.title("🗺️ 日田なび")
+    st.warning("⚠️ ただいまアクセスが集中しているため、観光モードの受け付けを一時停止しています。しばらくしてから再度お試しください。")
+    st.info("防災モード（避難所の確認・避難ルート）は引き続きご利用いただけます。")
+    if st.button("🏥 防災モードで開く", type="primary", use_container_width=True):
+        st.session_state.mode_selector = '防災モード'
+        st.rerun()
+    offline_url = os.environ.get('HITA_OFFLINE_BUNDLE_URL')
+    if offline_url:
+        st.link_button("📴 軽量版（オフライン対応）で避難所を探す", offline_url, use_container_width=True)
+    st.stop()
+degraded = load_governor.degraded
+
+# ワークブックの読み込み（観光・防災・イベントのシートを1回で読み込み、全セッションで共有）
+@st.cache_resource(show_spinner=False)
+def load_workbook_sheets():
+    """spots.xlsx を読み取り専用で1回だけ開き、使うシートをまとめて読み込む"""
+    return ingest_workbook(sheets=(TOURISM_SHEET, DISASTER_SHEET, EVENTS_SHEET))
 
 # データ読み込み関数
 @st.cache_data
 def load_spots_data():
     """Excelファイルからスポットデータを読み込む"""
     try:
-        # Excelファイルから読み込み
-        tourism_df = pd.read_excel('spots.xlsx', sheet_name='観光')
-        disaster_df = pd.read_excel('spots.xlsx', sheet_name='防災')
-        
-        # カラム名の確認と標準化
-        required_cols_tourism = ['No', 'スポット名', '緯度', '経度', '説明']
-        required_cols_disaster = ['No', 'スポット名', '緯度', '経度', '説明']
-        
-        # 必須カラムの確認
-        for col in required_cols_tourism:
-            if col not in tourism_df.columns:
-                st.error(f"❌ 観光シートに'{col}'カラムがありません")
-                return None, None
-        
-        for col in required_cols_disaster:
-            if col not in disaster_df.columns:
-                st.error(f"❌ 防災シートに'{col}'カラムがありません")
-                return None, None
-        
-        # 所要時間の変換処理（「60分」→60のような変換）
-        def parse_time(value):
-            """所要時間の値を数値に変換"""
-            if pd.isna(value) or value == '-':
-                return 60  # デフォルト値
-            if isinstance(value, (int, float)):
-                return int(value)
-            if isinstance(value, str):
-                # 「60分」のような文字列から数値を抽出
-                import re
-                match = re.search(r'(\d+)', str(value))
-                if match:
-                    return int(match.group(1))
-            return 60  # パースできない場合はデフォルト値
-        
-        # 観光データの処理
-        if '所要時間（参考）' in tourism_df.columns:
-            tourism_df['所要時間（参考）'] = tourism_df['所要時間（参考）'].apply(parse_time)
-        else:
-            tourism_df['所要時間（参考）'] = 60  # デフォルト60分
-            
-        if 'カテゴリ' not in tourism_df.columns:
-            tourism_df['カテゴリ'] = '観光地'
-        if '営業時間' not in tourism_df.columns:
-            tourism_df['営業時間'] = '終日'
-        if '料金' not in tourism_df.columns:
-            tourism_df['料金'] = '無料'
-        if '待ち時間（分）' not in tourism_df.columns:
-            tourism_df['待ち時間（分）'] = 0
-        if '混雑状況' not in tourism_df.columns:
-            tourism_df['混雑状況'] = '空いている'
-        
-        # 防災データの処理
-        if '所要時間（参考）' in disaster_df.columns:
-            disaster_df['所要時間（参考）'] = disaster_df['所要時間（参考）'].apply(parse_time)
-            
-        if '収容人数' not in disaster_df.columns:
-            disaster_df['収容人数'] = 0
-        if '状態' not in disaster_df.columns:
-            disaster_df['状態'] = '待機中'
-        
-        # 待ち時間と収容人数を数値型に変換
-        tourism_df['待ち時間（分）'] = pd.to_numeric(tourism_df['待ち時間（分）'], errors='coerce').fillna(0).astype(int)
-        disaster_df['収容人数'] = pd.to_numeric(disaster_df['収容人数'], errors='coerce').fillna(0).astype(int)
-        
-        return tourism_df, disaster_df
-        
+        return spots_frames(load_workbook_sheets()[0])
     except FileNotFoundError:
         st.warning("⚠️ spots.xlsxが見つかりません。サンプルデータを使用します。")
-        
-        # サンプルデータを作成
-        tourism_df = pd.DataFrame({
-            'No': [1, 2, 3, 4, 5, 6],
-            'スポット名': ['豆田町', '日田温泉', '咸宜園', '天ヶ瀬温泉', '小鹿田焼の里', '大山ダム'],
-            '緯度': [33.3219, 33.3200, 33.3240, 33.2967, 33.3500, 33.3800],
-            '経度': [130.9414, 130.9400, 130.9430, 130.9167, 130.9600, 130.9200],
-            '所要時間（参考）': [60, 120, 45, 90, 75, 30],
-            '説明': ['江戸時代の町並みが残る歴史的な地区', '日田の名湯・温泉施設',
-                   '日本最大の私塾跡・歴史的教育施設', '自然豊かな温泉街',
-                   '伝統工芸の陶器の里', '美しい景観のダム'],
-            'カテゴリ': ['歴史', 'グルメ', '歴史', '自然', '体験', '自然'],
-            '営業時間': ['終日', '9:00-21:00', '9:00-17:00', '終日', '9:00-17:00', '終日'],
-            '料金': ['無料', '500円', '300円', '無料', '無料', '無料'],
-            '待ち時間（分）': [0, 15, 0, 10, 5, 0],
-            '混雑状況': ['空いている', '混雑', '普通', '空いている', '空いている', '空いている']
-        })
-        disaster_df = pd.DataFrame({
-            'No': [1, 2, 3, 4, 5],
-            'スポット名': ['日田市役所（避難所）', '中央公民館', '総合体育館', '桂林公民館', '三花公民館'],
-            '緯度': [33.3219, 33.3250, 33.3180, 33.3300, 33.3100],
-            '経度': [130.9414, 130.9450, 130.9380, 130.9500, 130.9350],
-            '所要時間（参考）': [60, 60, 60, 60, 60],
-            '説明': ['市役所・第一避難所', '中央地区の避難所', '大規模避難所', 
-                   '桂林地区の避難所', '三花地区の避難所'],
-            '収容人数': [500, 300, 800, 200, 250],
-            '状態': ['開設中', '開設中', '開設中', '待機中', '待機中']
-        })
-        return tourism_df, disaster_df
-    
+        return sample_spots_data()
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return None, None
     except Exception as e:
         st.error(f"❌ Excelファイルの読み込みエラー: {e}")
         return None, None
 
-# 距離計算関数
-def calculate_distance(lat1, lng1, lat2, lng2):
-    """2点間の距離を計算（km）- ヒュベニの公式"""
-    R = 6371  # 地球の半径（km）
-
-    lat1_rad = radians(lat1)
-    lat2_rad = radians(lat2)
-    delta_lat = radians(lat2 - lat1)
-    delta_lng = radians(lng2 - lng1)
-
-    a = sin(delta_lat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lng/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-
-    return R * c
-
-# 最適化経路算出関数（観光モード：待ち時間考慮）
-def optimize_route_tourism(current_loc: List[float], spots_df: pd.DataFrame, selected_indices: List[int]) -> Tuple[List[int], float, float]:
-    """
-    観光モード用の最適化経路算出（待ち時間と距離を考慮）
-    Returns: (訪問順のインデックスリスト, 総移動距離, 総所要時間)
-    """
-    if not selected_indices:
-        return [], 0.0, 0.0
-
-    unvisited = selected_indices.copy()
-    route = []
-    current_position = current_loc
-    total_distance = 0.0
-    total_time = 0.0
-
-    while unvisited:
-        # 各未訪問スポットのスコアを計算
-        scores = []
-        distances = []
-        wait_times = []
-
-        for idx in unvisited:
-            spot = spots_df.iloc[idx]
-            dist = calculate_distance(
-                current_position[0], current_position[1],
-                spot['緯度'], spot['経度']
-            )
-            distances.append(dist)
-            wait_time = spot.get('待ち時間（分）', 0)
-            wait_times.append(wait_time)
-
-        # 距離ランキング（近い順に1, 2, 3...）
-        distance_ranks = [sorted(distances).index(d) + 1 for d in distances]
-
-        # 待ち時間ランキング（短い順に1, 2, 3...）
-        wait_time_ranks = [sorted(wait_times).index(w) + 1 for w in wait_times]
-
-        # スコア計算: S = RD + RW（小さいほど良い）
-        scores = [distance_ranks[i] + wait_time_ranks[i] for i in range(len(unvisited))]
-
-        # 最小スコアのスポットを選択
-        min_score_idx = scores.index(min(scores))
-        selected_idx = unvisited[min_score_idx]
-
-        route.append(selected_idx)
-        selected_spot = spots_df.iloc[selected_idx]
-
-        # 移動距離と時間を加算
-        travel_dist = distances[min_score_idx]
-        total_distance += travel_dist
-        total_time += (travel_dist / 40) * 60  # 時速40kmで計算（分）
-        total_time += selected_spot.get('所要時間（参考）', 60)
-        total_time += selected_spot.get('待ち時間（分）', 0)
-
-        # 現在地を更新
-        current_position = [selected_spot['緯度'], selected_spot['経度']]
-        unvisited.remove(selected_idx)
-
-    return route, total_distance, total_time
-
-# 最適化経路算出関数（防災モード：最近傍法）
-def optimize_route_disaster(current_loc: List[float], spots_df: pd.DataFrame, selected_indices: List[int]) -> Tuple[List[int], float, float]:
-    """
-    防災モード用の最適化経路算出（距離のみ考慮）
-    Returns: (訪問順のインデックスリスト, 総移動距離, 総所要時間)
-    """
-    if not selected_indices:
-        return [], 0.0, 0.0
-
-    unvisited = selected_indices.copy()
-    route = []
-    current_position = current_loc
-    total_distance = 0.0
-    total_time = 0.0
-
-    while unvisited:
-        # 最も近いスポットを選択
-        min_dist = float('inf')
-        nearest_idx = None
-
-        for idx in unvisited:
-            spot = spots_df.iloc[idx]
-            dist = calculate_distance(
-                current_position[0], current_position[1],
-                spot['緯度'], spot['経度']
-            )
-            if dist < min_dist:
-                min_dist = dist
-                nearest_idx = idx
-
-        route.append(nearest_idx)
-        selected_spot = spots_df.iloc[nearest_idx]
-
-        # 移動距離と時間を加算
-        total_distance += min_dist
-        total_time += (min_dist / 4) * 60  # 徒歩時速4kmで計算（分）
-
-        # 現在地を更新
-        current_position = [selected_spot['緯度'], selected_spot['経度']]
-        unvisited.remove(nearest_idx)
-
-    return route, total_distance, total_time
+# 天気予報サービス（全セッションで共有し、バックグラウンドで定期更新）
+@st.cache_resource
+def get_weather_service():
+    """気象庁の予報を定期取得するサービスを起動して返す"""
+    return WeatherService().start()
+
+# 避難所データ（全セッションで共有し、開設状況フィードの差分をその場で反映）
+@st.cache_resource
+def get_shelter_store():
+    """共有の避難所ストアを作成し、フィードが設定されていれば取り込みを開始する"""
+    _, disaster_df = load_spots_data()
+    if disaster_df is None:
+        return None
+    store = ShelterStatusStore(disaster_df.copy())
+    source = feed_source_from_env()
+    if source is not None:
+        FeedIngestor(store, source).start()
+    return store
+
+# 防災モードの静的オフライン版（HITA_OFFLINE_BUNDLE_DIR が設定されている場合のみ、開設状況の変更のたびに書き出す）
+@st.cache_resource
+def get_offline_bundle_exporter():
+    """避難所の静的バンドルを書き出し、以降は変更されたファイルだけを書き直す"""
+    out_dir = os.environ.get('HITA_OFFLINE_BUNDLE_DIR')
+    store = get_shelter_store()
+    if not out_dir or store is None:
+        return None
+    from offline_bundle import OfflineBundleExporter
+    return OfflineBundleExporter(store, out_dir).start()
+
+# 開設状況の更新通知（フラグメントのみ定期的に再実行し、ページ全体は再実行しない）
+@st.fragment(run_every=5)
+def shelter_status_updates(visible_names):
+    """前回表示以降に状態が変わった避難所だけを表示する"""
+    store = get_shelter_store()
+    if store is None:
+        return
+    df = store.df  # 1回だけ読み、以降は同じ時点のデータを使う
+    seen = st.session_state.setdefault('shelter_seen_version', store.version)
+    changed = store.changed_since(seen)
+    if changed is None:
+        changed = list(df.index)
+    if changed:
+        st.session_state.shelter_seen_version = store.version
+        recent = [idx for idx in st.session_state.get('shelter_recent_updates', []) if idx not in changed]
+        st.session_state.shelter_recent_updates = (changed + recent)[:10]
+
+    # 表示中のマーカーに変化があった場合のみアプリ全体を再実行して地図を更新
+    map_version = st.session_state.get('shelter_map_version', store.version)
+    if map_version < store.version:
+        affected = store.changed_since(map_version)
+        if affected is None or visible_names.intersection(df.loc[affected, 'スポット名']):
+            st.rerun()
+        st.session_state.shelter_map_version = store.version
+
+    recent = st.session_state.get('shelter_recent_updates', [])
+    if recent:
+        with st.container(border=True):
+            st.markdown("**🔔 開設状況の更新**")
+            for idx in recent[:5]:
+                row = df.loc[idx]
+                status_color = 'green' if row['状態'] == '開設中' else 'orange'
+                st.markdown(f":{status_color}[{row['状態']}] {row['スポット名']}（収容: {row['収容人数']}名）")
+
+# 待ち時間の観測ストアと予測（全セッションで共有）
+@st.cache_resource
+def get_wait_time_forecaster():
+    """観光スポットの待ち時間予測器を作成し、観測フィードが設定されていれば取り込みを開始する"""
+    tourism_df, _ = load_spots_data()
+    if tourism_df is None:
+        return None
+    store = WaitTimeStore(tourism_df['スポット名'])
+    forecaster = WaitTimeForecaster(
+        store,
+        fallback=dict(zip(tourism_df['スポット名'], tourism_df['待ち時間（分）']))
+    )
+    source = feed_source_from_env(os.environ.get('HITA_WAIT_FEED', ''))
+    if source is not None:
+        FeedIngestor(store, source, poll_interval=5.0).start()
+    return forecaster
+
+# 利用状況の記録（全セッションで共有し、書き込みはバックグラウンドで行う）
+@st.cache_resource
+def get_event_logger():
+    """イベントログの書き込みと月別ランキングの集計を開始する"""
+    return EventLogger(os.environ.get('HITA_ANALYTICS_DIR', 'analytics')).start()
+
+def log_selection_events(key, selected_names):
+    """前回の再実行から新しく選択されたスポットだけを記録する"""
+    previous = st.session_state.get(f'{key}_logged', [])
+    added = [name for name in selected_names if name not in previous]
+    if added:
+        logger = get_event_logger()
+        for name in added:
+            logger.log('select', name)
+    st.session_state[f'{key}_logged'] = list(selected_names)
+
+# 最適化ルートの結果キャッシュ（全セッションとAPIで共有）
+@st.cache_resource
+def get_route_cache():
+    """同じ出発地・同じ組み合わせの算出結果を再利用するキャッシュ"""
+    return RouteCache()
+
+# 移動手段ごとの所要時間モデル（スポット間の所要時間行列はデータのバージョンと移動手段ごとに1回だけ作る）
+@st.cache_resource
+def get_travel_time_model():
+    """車・徒歩・自転車・公共交通の所要時間モデル（公共交通は HITA_GTFS_PATH のGTFSを使う）"""
+    return TravelTimeModel()
+
+@st.cache_resource
+def get_dataset_versions():
+    """観光・防災データの内容から計算したバージョン"""
+    tourism_df, disaster_df = load_spots_data()
+    if tourism_df is None:
+        return None, None
+    return dataset_fingerprint(tourism_df), dataset_fingerprint(disaster_df)
+
+# ヘッドレスAPI（HITA_API_PORT が設定されている場合のみ、アプリと同じデータを共有して起動）
+@st.cache_resource
+def get_routing_api():
+    """経路計算・最寄り避難所APIを別スレッドで起動する"""
+    port = os.environ.get('HITA_API_PORT')
+    if not port:
+        return None
+    tourism_df, _ = load_spots_data()
+    shelter_store = get_shelter_store()
+    if tourism_df is None or shelter_store is None:
+        return None
+    from api_server import RoutingService, start_in_thread
+    service = RoutingService(tourism_df, shelter_store.df, get_wait_time_forecaster(), get_route_cache(),
+                             get_travel_time_model(), get_load_governor(), get_hazard_index()[0],
+                             shelter_store=shelter_store)
+    start_in_thread(service, os.environ.get('HITA_API_HOST', '127.0.0.1'), int(port))
+    return service
+
+# オフライン地図タイル（HITA_TILE_PORT が設定されている場合のみ、MBTiles を配信するサーバーを起動）
+@st.cache_resource
+def get_tile_url():
+    """ローカルのタイル配信を起動し、地図に渡すURLテンプレートを返す（未設定なら None）"""
+    port = os.environ.get('HITA_TILE_PORT')
+    if not port:
+        return None
+    path = os.environ.get('HITA_MBTILES_PATH', DEFAULT_MBTILES_PATH)
+    upstream = os.environ.get('HITA_TILE_UPSTREAM')
+    store = MBTilesStore(path, readonly=upstream is None and os.path.exists(path))
+    host = os.environ.get('HITA_TILE_HOST', '127.0.0.1')
+    start_tile_server(store, host, int(port), upstream)
+    # ブラウザから見たURL（リバースプロキシ経由の場合は HITA_TILE_PUBLIC_URL で上書き）
+    return os.environ.get('HITA_TILE_PUBLIC_URL', f"http://{host}:{port}/tiles/{{z}}/{{x}}/{{y}}.png")
+
+# ハザード区域（HITA_HAZARD_DIR の GeoJSON。STR木で索引を作り、全セッションで共有する）
+@st.cache_resource
+def get_hazard_index():
+    """(索引, 使えない理由)。データが無い・shapely が無い場合の索引は None"""
+    return load_hazard_index()
+
+@st.cache_resource
+def get_shelter_hazards(data_version):
+    """避難所ごとの (危険度, 区域の表示名のリスト)（座標は変わらないのでデータのバージョンごとに1回だけ判定する）"""
+    hazard_index = get_hazard_index()[0]
+    _, disaster_df = load_spots_data()
+    if hazard_index is None or disaster_df is None:
+        return {}
+    lat, lng = disaster_df['緯度'].to_numpy(dtype=float), disaster_df['経度'].to_numpy(dtype=float)
+    levels = hazard_index.point_levels(lat, lng)
+    zones = hazard_index.point_zones(lat, lng)
+    return {name: (int(level), sorted({zone.label for zone in zone_list}))
+            for name, level, zone_list in zip(disaster_df['スポット名'], levels, zones)}
+
+# サイドバー・防災情報の集計値（データのバージョンごとに1回だけ計算し、避難所は差分で更新する）
+@st.cache_resource
+def get_tourism_aggregates(data_version):
+    """観光スポットの件数・カテゴリー別件数・時刻ごとの営業中の件数"""
+    tourism_df, _ = load_spots_data()
+    return TourismAggregates(tourism_df, data_version)
+
+@st.cache_resource
+def get_shelter_aggregates():
+    """避難所の状態別件数・受け入れ可能人数（開設状況の差分を受けて更新される）"""
+    store = get_shelter_store()
+    return ShelterAggregates(store) if store is not None else None
+
+# イベントカレンダー（全セッションで共有。期間の区間木と会場のグリッドで検索する）
+@st.cache_resource
+def get_event_calendar():
+    """イベントを読み込んで索引を作る。読み込めない場合は組み込みの年間イベントと、エラーの内容を返す"""
+    try:
+        try:
+            # スポットデータと一緒に読み込んだシートを使う（シートが無ければワークブックは開き直さない）
+            sheet, workbook = load_workbook_sheets()[0].get(EVENTS_SHEET), None
+        except (OSError, ValueError):
+            sheet, workbook = None, SPOTS_PATH
+        return EventCalendar(load_events(workbook=workbook, sheet=sheet)), None
+    except (OSError, ValueError) as e:
+        return EventCalendar(default_events()), str(e)
+
+# スポット一覧の表示用データ（検索・並び替え・現在地ごとにセッションをまたいでキャッシュ）
+@st.cache_data(max_entries=256, show_spinner=False)
+def spot_list_frame(_tourism_df, data_version, location, search, sort_by):
+    """検索で絞り込み、現在地からの距離を付けて並び替えたスポット一覧"""
+    display_df = _tourism_df
+    if search:
+        display_df = display_df[
+            display_df['スポット名'].str.contains(search, na=False, regex=False) |
+            display_df['説明'].str.contains(search, na=False, regex=False)
+        ]
+    display_df = display_df.assign(
+        距離=origin_distances(location, display_df['緯度'].to_numpy(), display_df['経度'].to_numpy())
+    )
+    if sort_by == "距離が近い順":
+        display_df = display_df.sort_values('距離')
+    elif sort_by == "名前順":
+        display_df = display_df.sort_values('スポット名')
+    return display_df
+
+# 初回表示の後のウォームアップ（プロセスごとに1回、バックグラウンドで実行）
+@st.cache_resource
+def start_warmup(_tourism_df, _disaster_df):
+    """重いモジュールの読み込みと所要時間行列の作成を先に済ませ、2回目以降の操作を待たせない"""
+    model = get_travel_time_model()
+    versions = get_dataset_versions()
+
+    def warmup():
+        for name in HEAVY_MODULES:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+        for df, version in zip((_tourism_df, _disaster_df), versions):
+            if df is not None:
+                for travel_mode in TRAVEL_PROFILES:
+                    model.matrix(df, travel_mode, version)
+        STARTUP.mark('warm')
+
+    thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
 
 # 地図作成関数（改良版）
-def create_enhanced_map(spots_df, center_location, selected_spot=None, show_route=False, selected_spots_list=None):
+def create_enhanced_map(spots_df, center_location, selected_spot=None, show_route=False, selected_spots_list=None,
+                        group_origins=None, hazard_geojson=None, hazard_labels=None):
     """Foliumマップを作成
     
     Args:
@@ -273,11 +402,18 @@ def create_enhanced_map(spots_df, center_location, selected_spot=None, show_rout
         selected_spot: 単一選択時の選択されたスポット名
         show_route: ルート表示フラグ
         selected_spots_list: 複数選択時の選択されたスポット名のリスト
+        group_origins: 集合場所の検索で現在地以外の出発地 [(名前, [緯度, 経度]), ...]
+            （selected_spot があれば各出発地から直線を引く）
+        hazard_geojson: 重ねて表示するハザード区域（HazardIndex.geojson）
+        hazard_labels: スポット名 → そのスポットを含むハザード区域の表示名のリスト（ポップアップに表示）
     """
+    import folium
+    tiles, attr = tile_layer_settings(get_tile_url())
     m = folium.Map(
         location=center_location,
         zoom_start=13,
-        tiles='OpenStreetMap'
+        tiles=tiles,
+        attr=attr
     )
     
     # 現在地マーカー（赤・大きめ）
@@ -287,6 +423,43 @@ def create_enhanced_map(spots_df, center_location, selected_spot=None, show_rout
         tooltip="現在地",
         icon=folium.Icon(color='red', icon='home', prefix='fa')
     ).add_to(m)
+
+    # ハザード区域（洪水は青、土砂災害は茶、その他は紫）
+    if hazard_geojson is not None:
+        hazard_colors = {'flood': '#1f77b4', 'inland_flood': '#17becf', 'landslide': '#8c564b'}
+        folium.GeoJson(
+            hazard_geojson,
+            name="ハザード区域",
+            style_function=lambda feature: {
+                'color': hazard_colors.get(feature['properties']['hazard'], '#9467bd'),
+                'fillColor': hazard_colors.get(feature['properties']['hazard'], '#9467bd'),
+                'weight': 1,
+                'fillOpacity': min(0.15 + 0.1 * feature['properties']['level'], 0.6)
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['label', 'name'], aliases=['区域', '名前'])
+        ).add_to(m)
+
+    # 集合場所の検索の出発地（紫）
+    selected_coords = None
+    if selected_spot is not None and group_origins:
+        selected_rows = spots_df[spots_df['スポット名'] == selected_spot]
+        if not selected_rows.empty:
+            selected_coords = [selected_rows['緯度'].iat[0], selected_rows['経度'].iat[0]]
+    for origin_name, origin_coords in group_origins or []:
+        folium.Marker(
+            origin_coords,
+            popup=folium.Popup(f"🚩 <b>{origin_name}</b>", max_width=200),
+            tooltip=origin_name,
+            icon=folium.Icon(color='purple', icon='flag', prefix='fa')
+        ).add_to(m)
+        if selected_coords is not None:
+            folium.PolyLine(
+                locations=[origin_coords, selected_coords],
+                color='purple',
+                weight=3,
+                opacity=0.7,
+                dash_array='6'
+            ).add_to(m)
     
     # スポットマーカー
     for idx, row in spots_df.iterrows():
@@ -319,6 +492,9 @@ def create_enhanced_map(spots_df, center_location, selected_spot=None, show_rout
             status_color = 'green' if row['状態'] == '開設中' else 'orange'
             popup_html += f'<p style="margin: 5px 0;"><b>🚨 状態:</b> <span style="color: {status_color};">{row["状態"]}</span></p>'
         
+        if hazard_labels and hazard_labels.get(row['スポット名']):
+            popup_html += f'<p style="margin: 5px 0; color: #d62728;"><b>⚠️ ハザード区域:</b> {"、".join(hazard_labels[row["スポット名"]])}</p>'
+
         popup_html += "</div>"
         
         # マーカーの色を決定
@@ -350,201 +526,124 @@ def create_enhanced_map(spots_df, center_location, selected_spot=None, show_rout
     
     return m
 
-# Google Mapsリンク生成関数（単一目的地）
-def create_google_maps_link(origin, destination, mode='driving'):
-    """Google Mapsの外部リンクを生成（単一目的地）"""
-    modes = {
-        'driving': 'driving',
-        'walking': 'walking',
-        'bicycling': 'bicycling',
-        'transit': 'transit'
-    }
-    base_url = "https://www.google.com/maps/dir/?api=1"
-    link = f"{base_url}&origin={origin[0]},{origin[1]}&destination={destination[0]},{destination[1]}&travelmode={modes[mode]}"
-    return link
-
-# Google Mapsリンク生成関数（複数経由地）
-def create_google_maps_multi_link(origin: List[float], waypoints: List[Tuple[float, float]], destination: Tuple[float, float], mode='driving') -> str:
-    """
-    Google Mapsの外部リンクを生成（複数経由地対応）
-    Args:
-        origin: 出発地 [緯度, 経度]
-        waypoints: 経由地のリスト [(緯度, 経度), ...]
-        destination: 最終目的地 (緯度, 経度)
-        mode: 移動手段
-    Returns:
-        Google Maps URL
-    """
-    modes = {
-        'driving': 'driving',
-        'walking': 'walking',
-        'bicycling': 'bicycling',
-        'transit': 'transit'
-    }
-
-    base_url = "https://www.google.com/maps/dir/?api=1"
-    url = f"{base_url}&origin={origin[0]},{origin[1]}&destination={destination[0]},{destination[1]}"
-
-    if waypoints:
-        waypoints_str = "|".join([f"{lat},{lng}" for lat, lng in waypoints])
-        url += f"&waypoints={waypoints_str}"
-
-    url += f"&travelmode={modes.get(mode, 'driving')}"
-
-    return url
-
+# 縮退モード用の静的な地図（同じ表示条件ならセッションをまたいで同じHTMLを使い回す）
+@st.cache_data(max_entries=64, show_spinner=False)
+def static_map_html(_spots_df, spot_names, center, map_key):
+    """地図をHTMLとして作成する（現在地は約100m単位に丸めてキャッシュする）"""
+    m = create_enhanced_map(_spots_df, list(center))
+    return m.get_root().render()
+
+# 地図から受け取る値（マーカーのクリックだけ。パン・ズームなど表示範囲の変更では再実行しない）
+MAP_RETURNED_OBJECTS = ['last_object_clicked_tooltip']
+
+def select_clicked_spot(map_key, select_key, names):
+    """マーカーのクリックで、そのスポットを選択に加える（選択済みなら外す）"""
+    clicked = (st.session_state.get(map_key) or {}).get('last_object_clicked_tooltip')
+    if clicked not in names:
+        # 現在地のマーカーなど
+        return
+    selected = list(st.session_state.get(select_key, []))
+    if clicked in selected:
+        selected.remove(clicked)
+    else:
+        selected.append(clicked)
+    st.session_state[select_key] = selected
+
+def defer_first_map(height=600):
+    """folium がまだ読み込まれていないプロセスで、セッションの最初の表示なら地図の枠だけを表示して True を返す。
+    地図は初回表示の後の再実行（スクリプト末尾を参照）で描く"""
+    if 'folium' in sys.modules or st.session_state.get('page_rendered'):
+        return False
+    st.session_state.map_deferred = True
+    with st.container(height=height, border=True):
+        st.caption("🗺️ 地図を読み込んでいます...")
+    return True
+
+def interactive_map(m, key, select_key, spots_df):
+    """操作できる地図を表示する。クリックされたマーカーは次の再実行の前に select_key の選択へ反映する"""
+    from streamlit_folium import st_folium
+    names = frozenset(spots_df['スポット名'])
+    st_folium(m, width=700, height=600, key=key, returned_objects=MAP_RETURNED_OBJECTS,
+              on_change=lambda: select_clicked_spot(key, select_key, names))
+    STARTUP.mark('first_map')
+
+def render_map(m_factory, spots_df, key, select_key):
+    """通常は操作できる地図、縮退モードでは静的な地図を表示する"""
+    if degraded:
+        load_governor.record_shed('map')
+        center = tuple(round(v, 3) for v in st.session_state.current_location)
+        components.html(static_map_html(spots_df, tuple(spots_df['スポット名']), center, key), height=600)
+        st.caption("⚠️ アクセス集中のため簡易表示の地図です（選択したスポットのルート線は表示されません）")
+    elif not defer_first_map():
+        interactive_map(m_factory(), key, select_key, spots_df)
+
+# 算出済みの最適化ルートの差分更新（選択の追加・削除、現在地の移動、待ち時間の予測の変化）
+def update_optimized_route(state_key, spots_df, data_version, selected_names, evaluate, wait_time_fn=None,
+                           wait_version=None):
+    """保存してある訪問順を最初から計算し直さずに直す
 
-# サイドバー
-with st.sidebar:
-    # モード選択
-    mode = st.radio(
-        "モード選択",
-        ["観光モード", "防災モード"],
-        key='mode_selector'
-    )
-    st.session_state.mode = mode
-    
-    st.divider()
-    
-    # 現在地設定
-    st.subheader("📍 現在地設定")
-    
-    # GPS座標をチェック（LocalStorageから）
-    check_gps_html = """
-    <script>
-        const lat = localStorage.getItem('gps_lat');
-        const lng = localStorage.getItem('gps_lng');
-        
-        if (lat && lng) {
-            // Streamlitのクエリパラメータに設定
-            const url = new URL(window.parent.location.href);
-            url.searchParams.set('gps_lat', lat);
-            url.searchParams.set('gps_lng', lng);
-            
-            // LocalStorageをクリア
-            localStorage.removeItem('gps_lat');
-            localStorage.removeItem('gps_lng');
-            localStorage.removeItem('gps_timestamp');
-            
-            // URLを更新
-            window.parent.history.replaceState({}, '', url);
-            
-            // ページをリロード
-            window.parent.location.reload();
-        }
-    </script>
+    Args:
+        state_key: 最適化ルートを保存しているセッション状態のキー
+        spots_df: スポットのデータフレーム
+        data_version: spots_df のデータのバージョン（get_dataset_versions）
+        selected_names: 現在選択されているスポット名
+        evaluate: (訪問順, 所要時間) → (総移動距離, 総所要時間)
+        wait_time_fn: (スポットのインデックス, 到着予定時刻) → 予測待ち時間（分）。観光モードのみ
+        wait_version: 待ち時間の予測のバージョン（変わった場合は残りの訪問順の先頭を並べ替える）
     """
-    
-    components.html(check_gps_html, height=0)
-    
-    # クエリパラメータから座標を取得
-    query_params = st.query_params
-    
-    if 'gps_lat' in query_params and 'gps_lng' in query_params:
-        try:
-            new_lat = float(query_params['gps_lat'])
-            new_lng = float(query_params['gps_lng'])
-            
-            # 現在地を更新
-            old_location = st.session_state.current_location.copy()
-            st.session_state.current_location = [new_lat, new_lng]
-            
-            # クエリパラメータをクリア
-            st.query_params.clear()
-            
-            # 位置が変わった場合のみリロード
-            if old_location[0] != new_lat or old_location[1] != new_lng:
-                st.success("✅ GPS位置を反映しました！")
-                st.write(f"📍 緯度: {new_lat:.6f}")
-                st.write(f"📍 経度: {new_lng:.6f}")
-                st.rerun()
-        except Exception as e:
-            st.error(f"エラー: {e}")
-    
-    # GPS取得コンポーネント
-    gps_locator()
-    
-    # 現在の位置を表示
-    st.info(f"📍 現在地\n緯度: {st.session_state.current_location[0]:.6f}\n経度: {st.session_state.current_location[1]:.6f}")
-    
-    st.divider()
-    
-    # 天気情報（シンプル版 - APIキー不要）
-    st.subheader("🌤️ 天気情報")
-    
-    # 現在の日時から天気アイコンを選択（サンプル）
-    hour = datetime.now().hour
-    if 6 <= hour < 18:
-        weather_icon = "☀️"
-        weather_text = "晴れ"
-    else:
-        weather_icon = "🌙"
-        weather_text = "夜間"
-    
-    st.markdown(f"### {weather_icon} {weather_text}")
-    
-    col_w1, col_w2 = st.columns(2)
-    with col_w1:
-        st.metric("気温", "23°C")
-    with col_w2:
-        st.metric("湿度", "65%")
-    
-    # 外部天気サイトへのリンク
-    with st.expander("🔗 詳細な天気情報"):
-        # 気象庁
-        jma_url = "https://www.jma.go.jp/bosai/forecast/#area_type=class20s&area_code=4410200"
-        st.link_button(
-            "📊 気象庁（日田市）",
-            jma_url,
-            use_container_width=True
-        )
-        
-        # Yahoo天気
-        yahoo_weather_url = "https://weather.yahoo.co.jp/weather/jp/44/8330/44204.html"
-        st.link_button(
-            "🌐 Yahoo!天気",
-            yahoo_weather_url,
-            use_container_width=True
-        )
-    
-    st.caption(f"表示: {datetime.now().strftime('%Y/%m/%d %H:%M')}")
-    
-    st.divider()
-    
-    # 統計情報
-    if st.session_state.mode == '観光モード':
-        st.metric("登録スポット数", "49箇所")
+    route_data = st.session_state.get(state_key)
+    if route_data is None:
+        return
+    origin = list(st.session_state.current_location)
+    visited = route_data.get('visited', [])
+    selection = tuple(name for name in selected_names if name not in visited)
+    moved = route_data.get('origin', origin) != origin
+    edited = route_data.get('selection', selection) != selection
+    waits_changed = route_data.get('wait_version', wait_version) != wait_version
+    if not (moved or edited or waits_changed):
+        return
+
+    started = time.perf_counter()
+    travel_times = get_travel_time_model().travel_times(origin, spots_df, route_data['mode'], data_version)
+    start_time = datetime.now()
+    if '待ち時間（分）' in spots_df.columns:
+        # 観光: 滞在と待ち時間を到着時刻に含める（防災は移動時間だけ）
+        stay = lambda idx: float(spots_df['所要時間（参考）'].iat[idx])
+        if wait_time_fn is not None:
+            wait = lambda idx, minutes: wait_time_fn(idx, start_time + timedelta(minutes=minutes))
+        else:
+            wait = lambda idx, minutes: float(spots_df['待ち時間（分）'].iat[idx])
+        cost = RouteCost(*travel_times, stay_minutes=stay, wait_minutes=wait)
     else:
-        st.metric("避難所数", "122箇所")
-        st.metric("開設中", "3箇所", delta="安全")
-
-# メインコンテンツ
-# ページトップのタイトル
-st.title("🗺️ 日田なび")
-st.caption("Ver. 1.2 - 観光と防災におけるタイムパフォーマンスを向上")
-st.divider()
-
-# データ読み込み
-tourism_df, disaster_df = load_spots_data()
-
-# 現在のモード表示
-st.subheader(f"📍 {st.session_state.mode}")
+        cost = RouteCost(*travel_times)
+
+    route = list(route_data['route'])
+    if moved:
+        # 到着済みのスポットを除き、選択の比較からも外す
+        reached = reached_stops(route, origin, spots_df)
+        visited = visited + [spots_df['スポット名'].iat[idx] for idx in route[:reached]]
+        route = route[reached:]
+        selection = tuple(name for name in selected_names if name not in visited)
+    if edited or moved:
+        positions = {name: position for position, name in enumerate(spots_df['スポット名'])}
+        route = update_selection(route, [positions[name] for name in selection if name in positions], cost)
+    if moved or waits_changed:
+        route = resume(route, cost)
+
+    total_dist, total_time = evaluate(route, travel_times)
+    st.session_state[state_key] = dict(
+        route_data, route=route, total_distance=total_dist, total_time=total_time, cached=False,
+        origin=origin, selection=selection, wait_version=wait_version, visited=visited,
+        updated_ms=(time.perf_counter() - started) * 1000
+    )
 
-# モードに応じた表示
-if st.session_state.mode == '観光モード':
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "🗺️ マップ",
-        "📋 スポット一覧",
-        "📅 イベント",
-        "⭐ おすすめスポット",
-        "🤖 AIプラン提案"
-    ])
-    
-    with tab1:
-        st.subheader("🗺️ 観光マップ")
-        
+# 地図と操作欄（フラグメントとして独立して再実行する）
+@st.fragment
+def tourism_map_view():
+    """観光マップと目的地選択（操作してもこの部分だけを再実行する）"""
+    with timed_rerun('tourism_map_view'):
         col_map, col_control = st.columns([3, 1])
-        
+
         with col_control:
             st.markdown("### 🎯 目的地選択")
 
@@ -562,17 +661,17 @@ if st.session_state.mode == '観光モード':
             selected_spots_names = st.multiselect(
                 "訪問したいスポットを選択",
                 filtered_df['スポット名'].tolist(),
-                default=[],
                 key='map_multi_select',
-                help="1つだけ選択した場合は単一ルート、2つ以上選択した場合は最適化ルートを表示します"
+                help="1つだけ選択した場合は単一ルート、2つ以上選択した場合は最適化ルートを表示します。地図のマーカーをクリックしても選択できます"
             )
+            log_selection_events('map_multi_select', selected_spots_names)
 
             # 選択数に応じた処理
             if len(selected_spots_names) == 0:
                 # スポット未選択
                 st.info("↑ 訪問したいスポットを選択してください")
                 show_route = False
-                
+
             elif len(selected_spots_names) == 1:
                 # 単一スポット選択モード
                 destination = selected_spots_names[0]
@@ -581,6 +680,9 @@ if st.session_state.mode == '観光モード':
 
                 # 情報表示
                 st.info(f"📍 **{destination}**")
+                if st.session_state.get('last_viewed_spot') != destination:
+                    get_event_logger().log('view', destination)
+                    st.session_state.last_viewed_spot = destination
 
                 # 距離表示
                 distance = calculate_distance(
@@ -605,8 +707,25 @@ if st.session_state.mode == '観光モード':
                     st.write(f"**営業時間:** {dest_row['営業時間']}")
                     st.write(f"**料金:** {dest_row['料金']}")
                     st.write(f"**所要時間（参考）:** {dest_row['所要時間（参考）']}分")
-                    st.write(f"**待ち時間:** {dest_row['待ち時間（分）']}分")
-                    st.write(f"**混雑状況:** {dest_row['混雑状況']}")
+                    wait_forecaster = get_wait_time_forecaster()
+                    if wait_forecaster is not None and wait_forecaster.store.latest(destination) is not None:
+                        # 観測がある場合は現在の予測値を表示
+                        wait_forecaster.refresh()
+                        predicted_wait = wait_forecaster.expected_wait(destination)
+                        st.write(f"**待ち時間（予測）:** {predicted_wait:.0f}分")
+                        st.write(f"**混雑状況:** {congestion_label(predicted_wait)}")
+                    else:
+                        st.write(f"**待ち時間:** {dest_row['待ち時間（分）']}分")
+                        st.write(f"**混雑状況:** {dest_row['混雑状況']}")
+
+                # スポットの近く（3km以内）で今後30日以内に開催されるイベント
+                nearby_events = get_event_calendar()[0].near(
+                    dest_coords[0], dest_coords[1], 3.0, date.today(), date.today() + timedelta(days=30)
+                )
+                if nearby_events:
+                    with st.expander(f"🎉 周辺のイベント（{len(nearby_events)}件）"):
+                        for event, event_distance in nearby_events:
+                            st.write(f"**{event.name}**（{event.period_text}）{event.venue} {event_distance:.1f}km")
 
                 st.markdown("---")
                 st.markdown("### 🚗 ルート案内")
@@ -640,7 +759,7 @@ if st.session_state.mode == '観光モード':
 
                 # 地図上に直線ルートを表示
                 show_route = st.checkbox("地図上に直線を表示", value=True, key='map_show_route')
-                
+
             else:
                 # 複数スポット選択モード（2つ以上）
                 destination = None
@@ -661,6 +780,8 @@ if st.session_state.mode == '観光モード':
                     }[x],
                     key='map_opt_travel_mode'
                 )
+                if travel_mode_opt == 'transit' and get_travel_time_model().gtfs_error:
+                    st.caption("⚠️ 時刻表データを読み込めなかったため、公共交通の所要時間は目安の値で計算します")
 
                 if st.button("🎯 最適化ルートを算出", type="primary", use_container_width=True, key='map_optimize_btn'):
                     # 選択されたスポットのインデックスを取得
@@ -669,23 +790,87 @@ if st.session_state.mode == '観光モード':
                         idx = tourism_df[tourism_df['スポット名'] == spot_name].index[0]
                         selected_indices.append(idx)
 
-                    # 最適化ルート算出
-                    route, total_dist, total_time = optimize_route_tourism(
-                        st.session_state.current_location,
-                        tourism_df,
-                        selected_indices
+                    # 最適化ルート算出（到着時刻の予測待ち時間を使用）
+                    wait_forecaster = get_wait_time_forecaster()
+                    wait_time_fn = None
+                    wait_version = None
+                    if wait_forecaster is not None:
+                        wait_forecaster.refresh()
+                        wait_version = wait_forecaster.store.version
+                        wait_time_fn = lambda idx, eta: wait_forecaster.expected_wait(tourism_df.at[idx, 'スポット名'], eta)
+
+                    # 選んだ移動手段の所要時間で訪問順と総所要時間を計算
+                    travel_times = get_travel_time_model().travel_times(
+                        st.session_state.current_location, tourism_df, travel_mode_opt, get_dataset_versions()[0]
                     )
 
+                    def compute_tourism_route():
+                        route, _, _ = optimize_route_tourism(
+                            st.session_state.current_location,
+                            tourism_df,
+                            selected_indices,
+                            wait_time_fn=wait_time_fn,
+                            travel_times=travel_times
+                        )
+                        # 選択数が多い場合は並列の局所探索で訪問順を改善（seed固定で同じ選択なら同じ結果）
+                        if len(route) >= PARALLEL_SEARCH_MIN_SPOTS:
+                            with st.spinner("訪問順を改善中..."):
+                                try:
+                                    route, _ = improve_route(st.session_state.current_location, tourism_df, route,
+                                                             seed=0, travel_times=travel_times,
+                                                             wait_time_fn=wait_time_fn)
+                                except Exception:
+                                    # 改善に失敗しても貪欲法の訪問順で続ける
+                                    st.warning("⚠️ 訪問順の改善に失敗したため、基本の訪問順を表示します。")
+                        return route
+
+                    # 同じ条件の算出結果は全セッションで再利用（訪問順は予測待ち時間で変わるため出発時刻も15分単位でキーに含める）
+                    cache_key = route_cache_key(
+                        'tourism', st.session_state.current_location, selected_spots_names, travel_mode_opt,
+                        (get_dataset_versions()[0], wait_version, int(datetime.now().timestamp() // 900))
+                    )
+                    route, cache_hit = get_route_cache().get_or_compute(cache_key, compute_tourism_route)
+                    total_dist, total_time = evaluate_route_tourism(
+                        st.session_state.current_location, tourism_df, route, wait_time_fn=wait_time_fn,
+                        travel_times=travel_times
+                    )
+
+                    logger = get_event_logger()
+                    for idx in route:
+                        logger.log('route', tourism_df.at[idx, 'スポット名'], m=travel_mode_opt)
+
                     # セッション状態に保存
                     st.session_state.map_optimized_route = {
                         'route': route,
                         'total_distance': total_dist,
                         'total_time': total_time,
-                        'mode': travel_mode_opt
+                        'mode': travel_mode_opt,
+                        'cached': cache_hit,
+                        'origin': list(st.session_state.current_location),
+                        'selection': tuple(selected_spots_names),
+                        'wait_version': wait_version
                     }
 
                     st.success("✅ 最適化ルートを算出しました！")
-                    st.rerun()
+                    rerun_view()
+
+                # 算出後の選択・現在地・待ち時間の変化は、保存してある訪問順を直して反映する
+                if st.session_state.map_optimized_route is not None:
+                    wait_forecaster = get_wait_time_forecaster()
+                    wait_time_fn = None
+                    wait_version = None
+                    if wait_forecaster is not None:
+                        wait_forecaster.refresh()
+                        wait_version = wait_forecaster.store.version
+                        wait_time_fn = lambda idx, eta: wait_forecaster.expected_wait(tourism_df.at[idx, 'スポット名'], eta)
+                    update_optimized_route(
+                        'map_optimized_route', tourism_df, get_dataset_versions()[0], selected_spots_names,
+                        lambda route, travel_times: evaluate_route_tourism(
+                            st.session_state.current_location, tourism_df, route, wait_time_fn=wait_time_fn,
+                            travel_times=travel_times
+                        ),
+                        wait_time_fn=wait_time_fn, wait_version=wait_version
+                    )
 
                 # 最適化ルート表示
                 if 'map_optimized_route' in st.session_state and st.session_state.map_optimized_route is not None:
@@ -696,6 +881,12 @@ if st.session_state.mode == '観光モード':
 
                     st.markdown("---")
                     st.markdown("### 📋 最適化された訪問順序")
+                    if route_data.get('cached'):
+                        st.caption(f"⚡ 同じ条件の算出結果を再利用しました（キャッシュヒット率 {get_route_cache().hit_rate:.0%}）")
+                    if route_data.get('updated_ms') is not None:
+                        st.caption(f"🔁 選択・現在地の変更に合わせて順序を更新しました（{route_data['updated_ms']:.0f}ms）")
+                    if route_data.get('visited'):
+                        st.caption(f"✅ 到着済み: {'、'.join(route_data['visited'])}")
 
                     # 統計情報
                     col1, col2 = st.columns(2)
@@ -742,334 +933,97 @@ if st.session_state.mode == '観光モード':
                             use_container_width=True,
                             type="primary"
                         )
-        
+
+                # 複数日のプラン（現在地を宿泊先として、毎日そこから出発して戻る）
+                st.markdown("---")
+                st.markdown("### 📆 複数日のプラン")
+                day_hours = st.slider("1日の観光時間（時間）", 2, 14, 8, key='map_day_hours',
+                                      help="移動・滞在・待ち時間の合計です。現在地（宿泊先）から出発して戻ります")
+                if st.button("📆 日程に分ける", use_container_width=True, key='map_itinerary_btn'):
+                    selected_indices = [tourism_df.index.get_loc(tourism_df[tourism_df['スポット名'] == name].index[0])
+                                        for name in selected_spots_names]
+                    st.session_state.map_itinerary = {
+                        'plan': plan_itinerary(st.session_state.current_location, tourism_df, selected_indices,
+                                               get_travel_time_model(), travel_mode_opt, day_hours * 60,
+                                               version=get_dataset_versions()[0]),
+                        'selection': tuple(selected_spots_names),
+                        'lodging': list(st.session_state.current_location),
+                        'mode': travel_mode_opt
+                    }
+
+                itinerary = st.session_state.get('map_itinerary')
+                if itinerary is not None and itinerary['selection'] == tuple(selected_spots_names):
+                    days = itinerary['plan']['days']
+                    total_minutes = sum(day['total_minutes'] for day in days)
+                    st.metric("日数", f"{len(days)}日")
+                    st.caption(f"合計 {int(total_minutes // 60)}時間{int(total_minutes % 60)}分"
+                               f"（移動 {sum(day['travel_minutes'] for day in days):.0f}分・"
+                               f"{sum(day['distance_km'] for day in days):.1f}km）")
+                    if itinerary['plan']['over_budget']:
+                        st.warning("1日の観光時間に収まらないスポット: " + "、".join(
+                            tourism_df.iloc[idx]['スポット名'] for idx in itinerary['plan']['over_budget']))
+                    for day_number, day in enumerate(days, 1):
+                        with st.expander(f"{day_number}日目（{int(day['total_minutes'] // 60)}時間"
+                                         f"{int(day['total_minutes'] % 60)}分・{len(day['route'])}箇所）"):
+                            for i, idx in enumerate(day['route'], 1):
+                                st.write(f"{i}. {tourism_df.iloc[idx]['スポット名']}")
+                            st.caption(f"移動 {day['travel_minutes']:.0f}分・滞在と待ち時間 {day['stay_minutes']:.0f}分")
+                            st.link_button(
+                                f"🗺️ {day_number}日目のルートを開く",
+                                create_google_maps_multi_link(
+                                    itinerary['lodging'],
+                                    [(tourism_df.iloc[idx]['緯度'], tourism_df.iloc[idx]['経度']) for idx in day['route']],
+                                    tuple(itinerary['lodging']),
+                                    itinerary['mode']
+                                ),
+                                use_container_width=True
+                            )
+
         with col_map:
             # 地図表示（カテゴリーフィルターを適用）
             # 選択されたスポットのリストを渡す
-            m = create_enhanced_map(
+            route_line = show_route if 'show_route' in locals() else False
+            render_map(
+                lambda: create_enhanced_map(
+                    filtered_df,
+                    st.session_state.current_location,
+                    selected_spot=selected_spots_names[0] if len(selected_spots_names) == 1 else None,
+                    show_route=route_line,
+                    selected_spots_list=selected_spots_names if len(selected_spots_names) > 0 else None
+                ),
                 filtered_df,
-                st.session_state.current_location,
-                selected_spot=selected_spots_names[0] if len(selected_spots_names) == 1 else None,
-                show_route=show_route if 'show_route' in locals() else False,
-                selected_spots_list=selected_spots_names if len(selected_spots_names) > 0 else None
+                'tourism_map',
+                'map_multi_select'
             )
-            st_folium(m, width=700, height=600, key='tourism_map')
-    
-    with tab2:
-        st.subheader("📋 スポット一覧")
-        
-        # 検索とフィルター
-        col1, col2 = st.columns([2, 1])
-        with col1:
-            search = st.text_input("🔍 スポット名で検索", placeholder="例: 温泉")
-        with col2:
-            sort_by = st.selectbox("並び替え", ["番号順", "距離が近い順", "名前順"])
-        
-        # データフィルタリング
-        display_df = tourism_df.copy()
-        
-        if search:
-            display_df = display_df[
-                display_df['スポット名'].str.contains(search, na=False) |
-                display_df['説明'].str.contains(search, na=False)
-            ]
-        
-        # 距離を計算
-        display_df['距離'] = display_df.apply(
-            lambda row: calculate_distance(
-                st.session_state.current_location[0],
-                st.session_state.current_location[1],
-                row['緯度'],
-                row['経度']
-            ),
-            axis=1
-        )
-        
-        # 並び替え
-        if sort_by == "距離が近い順":
-            display_df = display_df.sort_values('距離')
-        elif sort_by == "名前順":
-            display_df = display_df.sort_values('スポット名')
-        
-        st.write(f"**表示件数:** {len(display_df)}件")
-        
-        # カード表示
-        for idx, row in display_df.iterrows():
-            with st.container():
-                col1, col2, col3 = st.columns([3, 1, 1])
-                
-                with col1:
-                    st.markdown(f"### {row['スポット名']}")
-                    st.write(f"📝 {row['説明']}")
-                    st.caption(f"🏷️ {row['カテゴリ']} | 🕐 {row['営業時間']} | 💰 {row['料金']}")
-                
-                with col2:
-                    st.metric("距離", f"{row['距離']:.2f}km")
-                
-                with col3:
-                    maps_link = create_google_maps_link(
-                        st.session_state.current_location,
-                        (row['緯度'], row['経度']),
-                        'driving'
-                    )
-                    st.link_button("🗺️", maps_link, use_container_width=True)
-                
-                st.divider()
 
-    with tab3:
-        st.subheader("📅 年間イベントカレンダー")
-        
-        col1, col2 = st.columns([1, 3])
-        with col1:
-            selected_month = st.selectbox(
-                "月を選択",
-                list(range(1, 13)),
-                index=datetime.now().month - 1,
-                format_func=lambda x: f"{x}月"
-            )
-        
-        # 日田市の年間イベントデータ
-        events = {
-            2: [("天領日田おひなまつり", "2月中旬～3月下旬", "豆田町一帯で雛人形を展示する春の風物詩")],
-            3: [
-                ("天領日田おひなまつり", "2月中旬～3月下旬", "豆田町一帯で雛人形を展示する春の風物詩"),
-                ("おおやま梅まつり", "3月上旬～中旬", "約6,000本の梅が咲き誇る梅園での祭り")
-            ],
-            4: [("亀山公園桜まつり", "3月下旬～4月上旬", "約1,000本の桜が咲く日田市を代表する桜の名所")],
-            5: [
-                ("日田川開き観光祭", "5月第4土曜・日曜", "九州最大級の花火大会を含む日田最大の祭り"),
-            ],
-            6: [("あまがせの夏まつり", "6月下旬", "天ヶ瀬温泉街で開催される夏の祭り")],
-            7: [("日田祇園祭", "7月第4土曜・日曜", "300年以上の歴史を持つユネスコ無形文化遺産の祭り")],
-            8: [("天ヶ瀬おもてなし花火", "8月中旬", "天ヶ瀬温泉街で開催される花火大会")],
-            9: [("日田市民音楽祭", "9月中旬", "日田市で開催される音楽イベント")],
-            10: [
-                ("日田天領まつり", "10月第3土曜・日曜", "西国筋郡代着任行列や時代絵巻パレードが見どころ"),
-                ("千年あかり", "10月下旬～11月中旬", "豆田町と花月川周辺で竹灯籠を灯すイベント"),
-                 ("小鹿田焼民陶祭", "5月第2土曜・日曜", "伝統工芸の小鹿田焼の窯元を巡るイベント")
-            ],
-            11: [
-                ("千年あかり", "10月下旬～11月中旬", "豆田町と花月川周辺で竹灯籠を灯すイベント")
-            ],
-            12: [("大山ダム湖畔周遊ウォーキング", "12月上旬", "大山ダム周辺を歩くウォーキングイベント")]
-        }
-        
-        if selected_month in events:
-            for event_name, event_date, event_desc in events[selected_month]:
-                with st.container():
-                    st.markdown(f"### 🎉 {event_name}")
-                    st.write(f"📅 **開催日:** {event_date}")
-                    st.write(f"📝 **内容:** {event_desc}")
-                    st.divider()
-        else:
-            st.info(f"{selected_month}月には現在登録されているイベントはありません")
+@st.fragment
+def shelter_map_view():
+    """避難所マップと避難所選択（操作してもこの部分だけを再実行する）"""
+    # フラグメントだけの再実行でも最新の開設状況を使う（ストアは更新のたびにデータフレームを差し替える）
+    disaster_df = current_shelters()
+    with timed_rerun('shelter_map_view'):
+        col_map, col_control = st.columns([3, 1])
 
-    with tab4:
-        st.subheader("⭐ おすすめスポット")
-
-        st.info("日田市の特におすすめの観光スポットをご紹介します")
-
-        # おすすめスポットのリスト（年間を通したおすすめ）
-        recommended_spots = [
-            ("豆田町（重要伝統的建造物群保存地区）", "🔥 必見！", "江戸時代の風情が残る歴史的な町並み"),
-            ("咸宜園跡（日本遺産）", "🗾 日本遺産", "日本最大の私塾跡・世界遺産"),
-            ("三隈川（屋形船・鵜飼い）", "🚣 伝統", "屋形船で川下りと鵜飼い体験"),
-            ("大山ダム（進撃の巨人像）", "🎬 人気", "進撃の巨人ファン必見のスポット"),
-            ("慈恩の滝", "💧 絶景", "裏側から見られる美しい滝"),
-            ("日田祇園山鉾会館", "🎉 文化", "日田祇園祭の山鉾を展示"),
-            ("ひなの里（天領日田資料館）", "🏛️ 歴史", "天領時代の資料を展示"),
-            ("亀山公園", "🌸 自然", "桜の名所として有名な公園"),
-            ("日田市立博物館（AOSE内）", "🏛️ 学習", "日田の歴史と文化を学べる"),
-            ("月隈公園", "🌳 散策", "市街地を一望できる公園")
-        ]
-
-        for i, (spot_name, badge, description) in enumerate(recommended_spots, 1):
-            # スポット情報を取得
-            spot_df = tourism_df[tourism_df['スポット名'] == spot_name]
-
-            if len(spot_df) > 0:
-                spot = spot_df.iloc[0]
-
-                with st.container():
-                    col_rank, col_info, col_action = st.columns([0.5, 3, 1])
-
-                    with col_rank:
-                        if i == 1:
-                            st.markdown("## 🥇")
-                        elif i == 2:
-                            st.markdown("## 🥈")
-                        elif i == 3:
-                            st.markdown("## 🥉")
-                        else:
-                            st.markdown(f"## {i}")
-
-                    with col_info:
-                        st.markdown(f"### {spot_name} {badge}")
-                        st.write(f"📝 {spot['説明']}")
-                        st.caption(f"🏷️ {spot['カテゴリ']} | 💰 {spot['料金']} | ⏱️ 所要時間: {spot['所要時間（参考）']}分")
-
-                    with col_action:
-                        # 距離計算
-                        distance = calculate_distance(
-                            st.session_state.current_location[0],
-                            st.session_state.current_location[1],
-                            spot['緯度'],
-                            spot['経度']
-                        )
-                        st.metric("距離", f"{distance:.1f}km")
-                        maps_link = create_google_maps_link(
-                            st.session_state.current_location,
-                            (spot['緯度'], spot['経度']),
-                            'driving'
-                        )
-                        st.link_button("🗺️", maps_link, use_container_width=True)
-
-                    st.divider()
-
-    with tab5:
-        st.subheader("🤖 AIプラン提案（Gemini API）")
-
-        st.info("Gemini AIがあなたの予算・時間・興味に合わせた最適な観光プランを提案します。")
-
-        # APIキー入力
-        st.markdown("### 🔑 APIキー設定")
-
-        api_key_input = st.text_input(
-            "Gemini APIキーを入力してください",
-            type="password",
-            value=st.session_state.gemini_api_key,
-            help="APIキーはセッション中のみ保持され、サーバーには保存されません"
-        )
-
-        if api_key_input:
-            st.session_state.gemini_api_key = api_key_input
-
-        st.markdown("[🔑 Gemini APIキーを取得する →](https://aistudio.google.com/app/apikey)")
-
-        st.divider()
-
-        # プラン条件入力
-        st.markdown("### 📝 プラン条件を入力")
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            user_budget = st.text_input("💰 予算", placeholder="例: 5000円以内", key='ai_budget')
-            user_duration = st.text_input("⏱️ 滞在時間", placeholder="例: 3時間", key='ai_duration')
-
-        with col2:
-            user_companion = st.selectbox(
-                "👥 同行者",
-                ["一人旅", "家族連れ", "カップル", "友人グループ"],
-                key='ai_companion'
-            )
-
-        # 興味カテゴリー
-        st.markdown("**🎯 興味のあるカテゴリー（複数選択可）:**")
-        interest_categories = st.multiselect(
-            "興味のあるカテゴリーを選択",
-            ["歴史", "自然", "グルメ", "体験", "温泉", "文化"],
-            default=["歴史"],
-            key='ai_interests'
-        )
-
-        # その他の要望
-        st.markdown("**💬 その他の要望（任意）:**")
-        user_request = st.text_area(
-            "自由に要望を入力してください",
-            placeholder="例: 子供が楽しめるスポットを含めてほしい、写真映えする場所を優先してほしい、ランチは和食がいい、など",
-            height=100,
-            key='ai_request'
-        )
-
-        # プラン生成ボタン
-        if st.button("🎯 AIプランを生成", type="primary", use_container_width=True):
-            if not GENAI_AVAILABLE:
-                st.error("❌ google-generativeai パッケージがインストールされていません。")
-                st.info("以下のコマンドでインストールしてください: `pip install google-generativeai`")
-            elif not st.session_state.gemini_api_key:
-                st.error("❌ Gemini APIキーを入力してください")
-            elif not user_budget or not user_duration:
-                st.warning("⚠️ 予算と滞在時間を入力してください")
-            else:
-                try:
-                    with st.spinner("🤖 AIがプランを生成中..."):
-                        # Gemini API設定
-                        genai.configure(api_key=st.session_state.gemini_api_key)
-                        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-                        # スポットリスト作成
-                        spots_context = []
-                        for _, spot in tourism_df.iterrows():
-                            spots_context.append(
-                                f"- {spot['スポット名']}: {spot['説明']} (カテゴリ: {spot['カテゴリ']}, 料金: {spot['料金']}, 所要時間: {spot['所要時間（参考）']}分)"
-                            )
-                        spots_text = "\n".join(spots_context)
-
-                        # 現在の日時と季節情報を取得
-                        current_date = datetime.now()
-                        month = current_date.month
-
-                        # 季節判定
-                        if month in [3, 4, 5]:
-                            season = "春"
-                            season_desc = "桜の季節で、温暖な気候"
-                        elif month in [6, 7, 8]:
-                            season = "夏"
-                            season_desc = "暑い季節で、川開き観光祭や祇園祭などのイベントがある時期"
-                        elif month in [9, 10, 11]:
-                            season = "秋"
-                            season_desc = "紅葉が美しく、天領まつりやもみじ祭りがある時期"
-                        else:
-                            season = "冬"
-                            season_desc = "寒い季節で、温泉が特に人気"
-
-                        # プロンプト作成
-                        system_prompt = "あなたは日田市の観光コンシェルジュです。現在の天気・季節を考慮しながら、以下の観光スポットリストとユーザーの要望に基づき、魅力的な観光プランを提案してください。"
-
-                        user_prompt = f"""
-現在の日付: {current_date.strftime('%Y年%m月%d日')}
-現在の季節: {season}（{season_desc}）
-
-観光スポットリスト:
-{spots_text}
-
-ユーザーの要望:
-- 予算: {user_budget}
-- 滞在時間: {user_duration}
-- 興味: {', '.join(interest_categories)}
-- 同行者: {user_companion}
-{f'- その他の要望: {user_request}' if user_request else ''}
-
-上記の条件と現在の季節・天気を考慮して、日田市の観光プランを訪問順序を含めて具体的に提案してください。
-各スポットの魅力や、なぜそのスポットを選んだのか、季節に合わせたおすすめポイントも簡潔に説明してください。
-                        """
-
-                        # API呼び出し
-                        response = model.generate_content(f"{system_prompt}\n\n{user_prompt}")
-
-                        # 結果表示
-                        st.markdown("---")
-                        st.markdown("### 📋 AI提案プラン")
-                        st.markdown(response.text)
-
-                        st.success("✅ プラン生成完了！")
-
-                except Exception as e:
-                    st.error(f"❌ エラーが発生しました: {str(e)}")
-                    st.info("💡 APIキーが正しいか確認してください。また、Gemini APIが有効化されているか確認してください。")
-
-else:  # 防災モード
-    tab1, tab2, tab3 = st.tabs(["🏥 避難所マップ", "🗾 ハザードマップ", "📢 防災情報"])
-    
-    with tab1:
-        st.subheader("🏥 避難所マップ")
-        
-        col_map, col_control = st.columns([3, 1])
-        
         with col_control:
             st.markdown("### 🚨 避難所情報")
 
+            # ハザード区域（データがある場合のみ。現在地の判定は操作のたびに行う）
+            hazard_index = get_hazard_index()[0]
+            shelter_hazards = get_shelter_hazards(get_dataset_versions()[1]) if hazard_index is not None else {}
+            show_hazards = False
+            if hazard_index is not None:
+                show_hazards = st.checkbox("🌊 ハザード区域を表示", value=True, key='disaster_show_hazards')
+                hazard_policy = st.radio(
+                    "ハザード区域内の避難所",
+                    ['penalize', 'exclude'],
+                    format_func={'penalize': "後回しにする", 'exclude': "候補から除く"}.get,
+                    horizontal=True,
+                    key='disaster_hazard_policy'
+                )
+                here_zones = hazard_index.zones_at(*st.session_state.current_location)
+                if here_zones:
+                    st.error("⚠️ 現在地は " + "、".join(sorted({zone.label for zone in here_zones})) + " の中です")
+
             # 状態フィルター
             status_filter = st.radio(
                 "表示する避難所",
@@ -1085,13 +1039,26 @@ else:  # 防災モード
             else:
                 filtered_df = disaster_df
 
+            # ハザード区域を考慮した近くの避難所
+            if hazard_index is not None and not filtered_df.empty:
+                distances = origin_distances(st.session_state.current_location,
+                                             filtered_df['緯度'].to_numpy(), filtered_df['経度'].to_numpy())
+                levels = [shelter_hazards.get(name, (0, []))[0] for name in filtered_df['スポット名']]
+                ranking = hazard_adjusted_distances(distances, levels, hazard_policy)
+                with st.expander("🧭 近くの避難所（ハザード区域を考慮）", expanded=True):
+                    for pos in ranking.argsort()[:3]:
+                        if ranking[pos] == float('inf'):
+                            break
+                        name = filtered_df['スポット名'].iat[pos]
+                        labels = shelter_hazards.get(name, (0, []))[1]
+                        st.write(f"**{name}** {distances[pos]:.2f} km" + (f"（⚠️ {'、'.join(labels)}）" if labels else ""))
+
             # 複数避難所選択（0個以上選択可能）
             selected_shelters_names = st.multiselect(
                 "避難所を選択",
                 filtered_df['スポット名'].tolist(),
-                default=[],
                 key='disaster_multi_select',
-                help="1つだけ選択した場合は単一ルート、2つ以上選択した場合は最適化避難ルートを表示します"
+                help="1つだけ選択した場合は単一ルート、2つ以上選択した場合は最適化避難ルートを表示します。地図のマーカーをクリックしても選択できます"
             )
 
             # 選択数に応じた処理
@@ -1099,7 +1066,7 @@ else:  # 防災モード
                 # 避難所未選択
                 st.info("↑ 避難所を選択してください")
                 show_route = False
-                
+
             elif len(selected_shelters_names) == 1:
                 # 単一避難所選択モード
                 shelter = selected_shelters_names[0]
@@ -1130,6 +1097,16 @@ else:  # 防災モード
                     st.write(f"**状態:** {shelter_row['状態']}")
                     st.write(f"**説明:** {shelter_row['説明']}")
 
+                # ハザード区域（避難所そのもの・現在地からの直線の区間）
+                if hazard_index is not None:
+                    shelter_labels = shelter_hazards.get(shelter, (0, []))[1]
+                    if shelter_labels:
+                        st.warning(f"⚠️ この避難所は {'、'.join(shelter_labels)} の中にあります")
+                    leg_labels = sorted({zone.label for zone in hazard_index.leg_zones(
+                        st.session_state.current_location, shelter_coords)} - set(shelter_labels))
+                    if leg_labels:
+                        st.caption(f"⚠️ 直線の経路が {'、'.join(leg_labels)} を通ります")
+
                 # Google Mapsで開く
                 maps_link = create_google_maps_link(
                     st.session_state.current_location,
@@ -1145,7 +1122,7 @@ else:  # 防災モード
                 )
 
                 show_route = st.checkbox("地図上に直線を表示", value=True, key='disaster_show_route')
-                
+
             else:
                 # 複数避難所選択モード（2つ以上）
                 shelter = None
@@ -1162,10 +1139,35 @@ else:  # 防災モード
                         selected_indices.append(idx)
 
                     # 最適化ルート算出（防災モード：最近傍法）
-                    route, total_dist, total_time = optimize_route_disaster(
-                        st.session_state.current_location,
-                        disaster_df,
-                        selected_indices
+                    travel_times = get_travel_time_model().travel_times(
+                        st.session_state.current_location, disaster_df, 'walking', get_dataset_versions()[1]
+                    )
+
+                    def compute_disaster_route():
+                        route, _, _ = optimize_route_disaster(
+                            st.session_state.current_location,
+                            disaster_df,
+                            selected_indices
+                        )
+                        # 選択数が多い場合は並列の局所探索で避難順序を改善
+                        if len(route) >= PARALLEL_SEARCH_MIN_SPOTS:
+                            with st.spinner("避難順序を改善中..."):
+                                try:
+                                    route, _ = improve_route(st.session_state.current_location, disaster_df, route,
+                                                             seed=0)
+                                except Exception:
+                                    # 改善に失敗しても最近傍法の避難順序で続ける
+                                    st.warning("⚠️ 避難順序の改善に失敗したため、基本の避難順序を表示します。")
+                        return route
+
+                    # 避難順序は座標だけで決まるので、開設状況の更新ではキャッシュを無効にしない
+                    cache_key = route_cache_key(
+                        'disaster', st.session_state.current_location, selected_shelters_names, 'walking',
+                        get_dataset_versions()[1]
+                    )
+                    route, cache_hit = get_route_cache().get_or_compute(cache_key, compute_disaster_route)
+                    total_dist, total_time = evaluate_route_disaster(
+                        st.session_state.current_location, disaster_df, route, travel_times=travel_times
                     )
 
                     # セッション状態に保存
@@ -1173,11 +1175,22 @@ else:  # 防災モード
                         'route': route,
                         'total_distance': total_dist,
                         'total_time': total_time,
-                        'mode': 'walking'
+                        'mode': 'walking',
+                        'cached': cache_hit,
+                        'origin': list(st.session_state.current_location),
+                        'selection': tuple(selected_shelters_names)
                     }
 
                     st.success("✅ 最適化避難ルートを算出しました！")
-                    st.rerun()
+                    rerun_view()
+
+                # 算出後の選択・現在地の変化は、保存してある避難順序を直して反映する
+                update_optimized_route(
+                    'disaster_optimized_route', disaster_df, get_dataset_versions()[1], selected_shelters_names,
+                    lambda route, travel_times: evaluate_route_disaster(
+                        st.session_state.current_location, disaster_df, route, travel_times=travel_times
+                    )
+                )
 
                 # 最適化ルート表示
                 if 'disaster_optimized_route' in st.session_state and st.session_state.disaster_optimized_route is not None:
@@ -1188,6 +1201,12 @@ else:  # 防災モード
 
                     st.markdown("---")
                     st.markdown("### 📋 最適化された避難順序")
+                    if route_data.get('cached'):
+                        st.caption(f"⚡ 同じ条件の算出結果を再利用しました（キャッシュヒット率 {get_route_cache().hit_rate:.0%}）")
+                    if route_data.get('updated_ms') is not None:
+                        st.caption(f"🔁 選択・現在地の変更に合わせて順序を更新しました（{route_data['updated_ms']:.0f}ms）")
+                    if route_data.get('visited'):
+                        st.caption(f"✅ 到着済み: {'、'.join(route_data['visited'])}")
 
                     # 統計情報
                     col1, col2 = st.columns(2)
@@ -1204,6 +1223,18 @@ else:  # 防災モード
                             shelter_info = disaster_df.iloc[idx]
                             st.write(f"{i}. {shelter_info['スポット名']} (収容: {shelter_info['収容人数']}名)")
 
+                    # ハザード区域を通る区間
+                    if hazard_index is not None and route:
+                        leg_zones = hazard_index.route_zones(
+                            st.session_state.current_location,
+                            [(disaster_df.iloc[idx]['緯度'], disaster_df.iloc[idx]['経度']) for idx in route]
+                        )
+                        for i, zones in enumerate(leg_zones):
+                            if zones:
+                                start_name = "現在地" if i == 0 else disaster_df.iloc[route[i - 1]]['スポット名']
+                                st.caption(f"⚠️ {start_name} → {disaster_df.iloc[route[i]]['スポット名']}: "
+                                           f"{'、'.join(sorted({zone.label for zone in zones}))} を通ります")
+
                     # Google Maps複数経由地リンク生成
                     if len(route) > 0:
                         origin = st.session_state.current_location
@@ -1234,25 +1265,698 @@ else:  # 防災モード
                             use_container_width=True,
                             type="primary"
                         )
-        
+
         with col_map:
             # 地図表示
             # 選択された避難所のリストを渡す
+            if shelter_store is not None:
+                st.session_state.shelter_map_version = shelter_store.version
+            if defer_first_map():
+                return
             m = create_enhanced_map(
                 filtered_df,
                 st.session_state.current_location,
                 selected_spot=selected_shelters_names[0] if len(selected_shelters_names) == 1 else None,
                 show_route=show_route if 'show_route' in locals() else False,
-                selected_spots_list=selected_shelters_names if len(selected_shelters_names) > 0 else None
+                selected_spots_list=selected_shelters_names if len(selected_shelters_names) > 0 else None,
+                hazard_geojson=hazard_index.geojson() if show_hazards else None,
+                hazard_labels={name: labels for name, (_, labels) in shelter_hazards.items()}
             )
-            st_folium(m, width=700, height=600, key='disaster_map')
+            interactive_map(m, 'disaster_map', 'disaster_multi_select', filtered_df)
+            shelter_status_updates(frozenset(filtered_df['スポット名']))
+
+# グループの集合場所（出発地ごとの所要時間から、全員にとって近いスポットを探す）
+MEETUP_OBJECTIVES = {'max': "最も遠い人の所要時間が短い", 'sum': "全員の所要時間の合計が短い"}
+
+def parse_origin_lines(text):
+    """「名前, 緯度, 経度」（名前は省略可）の行を [(名前, [緯度, 経度]), ...] に変換する。読めない行は別に返す"""
+    origins, invalid = [], []
+    for line in text.splitlines():
+        parts = [part.strip() for part in line.replace('，', ',').split(',') if part.strip()]
+        if not parts:
+            continue
+        try:
+            lat, lng = float(parts[-2]), float(parts[-1])
+        except (IndexError, ValueError):
+            invalid.append(line)
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            invalid.append(line)
+            continue
+        origins.append((', '.join(parts[:-2]) or f"出発地{len(origins) + 1}", [lat, lng]))
+    return origins, invalid
+
+@st.fragment
+def group_meetup_view(candidate_sets, key):
+    """出発地・候補・目的を選んで集合場所を探し、地図に表示する（操作してもこの部分だけを再実行する）
+
+    Args:
+        candidate_sets: 候補の種類の表示名 → (スポットのデータフレーム, データのバージョン)
+        key: ウィジェットのキーの接頭辞
+    """
+    with timed_rerun('group_meetup_view'):
+        st.caption("家族や団体が別々の場所から出発するときに、全員が集まりやすいスポットを探します")
+        col_input, col_option = st.columns([2, 1])
+        with col_input:
+            use_current = st.checkbox("現在地を出発地に含める", value=True, key=f'{key}_use_current')
+            origin_text = st.text_area(
+                "出発地（1行に1か所:「名前, 緯度, 経度」）",
+                placeholder="ホテルA, 33.3195, 130.9390\n33.2967, 130.9167",
+                key=f'{key}_origins'
+            )
+            origin_spots = st.multiselect("スポットを出発地に追加", tourism_df['スポット名'].tolist(),
+                                          key=f'{key}_origin_spots')
+        with col_option:
+            candidate_label = st.radio("集合場所の候補", list(candidate_sets), key=f'{key}_candidates')
+            objective = st.radio("選び方", list(MEETUP_OBJECTIVES), format_func=MEETUP_OBJECTIVES.get,
+                                 key=f'{key}_objective')
+            travel_mode = st.selectbox(
+                "移動手段",
+                list(TRAVEL_PROFILES),
+                format_func=lambda x: {
+                    'driving': '🚗 車',
+                    'walking': '🚶 徒歩',
+                    'bicycling': '🚲 自転車',
+                    'transit': '🚌 公共交通'
+                }[x],
+                index=1,
+                key=f'{key}_travel_mode'
+            )
+
+        group_origins, invalid = parse_origin_lines(origin_text)
+        spot_coords = tourism_df.set_index('スポット名')[['緯度', '経度']]
+        group_origins += [(name, spot_coords.loc[name].tolist()) for name in origin_spots]
+        if invalid:
+            st.warning("読み取れない行があります: " + " / ".join(invalid))
+        origins = ([("現在地", list(st.session_state.current_location))] if use_current else []) + group_origins
+        if len(origins) < 2:
+            st.info("出発地を2か所以上指定してください")
+            return
+
+        candidates_df, candidates_version = candidate_sets[candidate_label]
+        results, evaluated = meeting_points([coords for _, coords in origins], candidates_df,
+                                            get_travel_time_model(), travel_mode, objective,
+                                            version=candidates_version)
+        if not results:
+            st.info("候補のスポットがありません")
+            return
+        best = results[0]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("おすすめの集合場所", best['name'])
+        col2.metric("最も遠い人", f"{best['max_minutes']:.0f}分")
+        col3.metric("全員の合計", f"{best['total_minutes']:.0f}分")
+
+        col_map, col_list = st.columns([3, 2])
+        with col_list:
+            for rank, result in enumerate(results, 1):
+                with st.expander(f"{rank}. {result['name']}（最長 {result['max_minutes']:.0f}分）", expanded=rank == 1):
+                    for (origin_name, _), minutes in zip(origins, result['times']):
+                        st.write(f"{origin_name}: {minutes:.0f}分")
+            st.caption(f"候補 {len(candidates_df)}件のうち {evaluated}件の所要時間を計算しました")
+        with col_map:
+            m = create_enhanced_map(
+                candidates_df.loc[[result['index'] for result in results]],
+                st.session_state.current_location,
+                selected_spot=best['name'],
+                show_route=use_current,
+                group_origins=group_origins
+            )
+            if degraded:
+                load_governor.record_shed('map')
+                components.html(m.get_root().render(), height=500)
+            else:
+                from streamlit_folium import st_folium
+                st_folium(m, width=700, height=500, key=f'{key}_map', returned_objects=[])
+
+# サイドバー
+with st.sidebar:
+    # モード選択
+    mode = st.radio(
+        "モード選択",
+        ["観光モード", "防災モード"],
+        key='mode_selector'
+    )
+    st.session_state.mode = mode
+    
+    st.divider()
+    
+    # 現在地設定
+    st.subheader("📍 現在地設定")
+    
+    # GPS座標をチェック（LocalStorageから）
+    check_gps_html = """
+    <script>
+        const lat = localStorage.getItem('gps_lat');
+        const lng = localStorage.getItem('gps_lng');
+        
+        if (lat && lng) {
+            // Streamlitのクエリパラメータに設定
+            const url = new URL(window.parent.location.href);
+            url.searchParams.set('gps_lat', lat);
+            url.searchParams.set('gps_lng', lng);
+            
+            // LocalStorageをクリア
+            localStorage.removeItem('gps_lat');
+            localStorage.removeItem('gps_lng');
+            localStorage.removeItem('gps_timestamp');
+            
+            // URLを更新
+            window.parent.history.replaceState({}, '', url);
+            
+            // ページをリロード
+            window.parent.location.reload();
+        }
+    </script>
+    """
+    
+    components.html(check_gps_html, height=0)
+    
+    # クエリパラメータから座標を取得
+    query_params = st.query_params
+    
+    if 'gps_lat' in query_params and 'gps_lng' in query_params:
+        try:
+            new_lat = float(query_params['gps_lat'])
+            new_lng = float(query_params['gps_lng'])
+            
+            # 現在地を更新
+            old_location = st.session_state.current_location.copy()
+            st.session_state.current_location = [new_lat, new_lng]
+            
+            # クエリパラメータをクリア
+            st.query_params.clear()
+            
+            # 位置が変わった場合のみリロード
+            if old_location[0] != new_lat or old_location[1] != new_lng:
+                st.success("✅ GPS位置を反映しました！")
+                st.write(f"📍 緯度: {new_lat:.6f}")
+                st.write(f"📍 経度: {new_lng:.6f}")
+                st.rerun()
+        except Exception as e:
+            st.error(f"エラー: {e}")
+    
+    # GPS取得コンポーネント
+    gps_locator()
+    
+    # 現在の位置を表示
+    st.info(f"📍 現在地\n緯度: {st.session_state.current_location[0]:.6f}\n経度: {st.session_state.current_location[1]:.6f}")
+    
+    st.divider()
+    
+    # 天気情報（気象庁の予報JSONをバックグラウンドで取得）
+    st.subheader("🌤️ 天気情報")
+    
+    weather_service = get_weather_service()
+    weather_report = weather_service.get()
+    
+    if weather_report is not None:
+        st.markdown(f"### {weather_report.icon} {weather_report.short_text}")
+        st.caption(weather_report.weather_text)
+        
+        col_w1, col_w2 = st.columns(2)
+        with col_w1:
+            if weather_report.temp_max is not None:
+                st.metric("気温", f"{weather_report.temp_max:.0f}°C",
+                          help=f"最低 {weather_report.temp_min:.0f}°C / 最高 {weather_report.temp_max:.0f}°C")
+            else:
+                st.metric("気温", "-")
+        with col_w2:
+            st.metric("降水確率", f"{weather_report.pop}%" if weather_report.pop is not None else "-")
+        if weather_service.is_stale():
+            st.caption("⚠️ 最新の予報を取得中です（前回の予報を表示）")
+    else:
+        st.info("天気予報を取得中です...")
+    
+    # 外部天気サイトへのリンク
+    with st.expander("🔗 詳細な天気情報"):
+        # 気象庁
+        jma_url = "https://www.jma.go.jp/bosai/forecast/#area_type=class20s&area_code=4410200"
+        st.link_button(
+            "📊 気象庁（日田市）",
+            jma_url,
+            use_container_width=True
+        )
+        
+        # Yahoo天気
+        yahoo_weather_url = "https://weather.yahoo.co.jp/weather/jp/44/8330/44204.html"
+        st.link_button(
+            "🌐 Yahoo!天気",
+            yahoo_weather_url,
+            use_container_width=True
+        )
+    
+    if weather_report is not None:
+        st.caption(f"気象庁発表: {weather_report.report_datetime[:16].replace('T', ' ')}")
+    st.caption(f"表示: {datetime.now().strftime('%Y/%m/%d %H:%M')}")
+    
+    st.divider()
+    
+    if degraded:
+        st.warning("⚠️ アクセス集中のため軽量表示中です（AI機能の停止・地図の簡易表示）")
+
+    # 統計情報
+    if st.session_state.mode == '観光モード':
+        tourism_version = get_dataset_versions()[0]
+        if tourism_version is not None:
+            tourism_stats = get_tourism_aggregates(tourism_version).snapshot()
+            st.metric("登録スポット数", f"{tourism_stats['total']}箇所")
+            st.caption(f"営業時間内: {tourism_stats['open_now']}箇所")
+    else:
+        shelter_aggregates = get_shelter_aggregates()
+        if shelter_aggregates is not None:
+            shelter_stats = shelter_aggregates.snapshot()
+            st.metric("避難所数", f"{shelter_stats['total']}箇所")
+            st.metric("開設中", f"{shelter_stats['open']}箇所")
+            if shelter_stats['open']:
+                st.caption(f"受け入れ可能: {shelter_stats['open_capacity']:,}名")
+        # アクセス集中時はサーバーの再実行を伴わない静的なオフライン版へ案内する
+        offline_url = os.environ.get('HITA_OFFLINE_BUNDLE_URL')
+        if offline_url:
+            st.link_button("📴 軽量版（オフライン対応）", offline_url, use_container_width=True)
+
+# メインコンテンツ
+# ページトップのタイトル
+st.title("🗺️ 日田なび")
+st.caption("Ver. 1.2 - 観光と防災におけるタイムパフォーマンスを向上")
+st.divider()
 
+# データ読み込み
+tourism_df, disaster_df = load_spots_data()
+shelter_store = get_shelter_store()
+if shelter_store is not None:
+    # 防災データはフィードで更新される共有データを使う（この再実行の間は同じ時点のデータ）
+    disaster_df = shelter_store.df
+
+def current_shelters():
+    """防災データの最新のスナップショット（フラグメントだけの再実行で使う）"""
+    store = get_shelter_store()
+    return store.df if store is not None else disaster_df
+get_routing_api()
+get_offline_bundle_exporter()
+
+# 現在のモード表示
+st.subheader(f"📍 {st.session_state.mode}")
+
+# モードに応じた表示
+# タブは選択中のものだけを実行する（on_change='rerun' でタブの切り替え時に再実行し、tab.open で判定）
+if st.session_state.mode == '観光モード':
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        "🗺️ マップ",
+        "📋 スポット一覧",
+        "📅 イベント",
+        "⭐ おすすめスポット",
+        "🤖 AIプラン提案",
+        "👥 集合場所"
+    ], key='tourism_view', on_change='rerun')
+    
+    with tab1:
+        if tab1.open:
+            st.subheader("🗺️ 観光マップ")
+        
+            tourism_map_view()
+    
     with tab2:
-        st.subheader("🗾 ハザードマップ")
+        if tab2.open:
+            st.subheader("📋 スポット一覧")
+        
+            # 検索とフィルター
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                search = st.text_input("🔍 スポット名で検索", placeholder="例: 温泉")
+            with col2:
+                sort_by = st.selectbox("並び替え", ["番号順", "距離が近い順", "名前順"])
+        
+            # データフィルタリング・距離の計算・並び替え（同じ条件ならタブを切り替えても計算し直さない）
+            display_df = spot_list_frame(
+                tourism_df, get_dataset_versions()[0], tuple(st.session_state.current_location), search, sort_by
+            )
+
+            st.write(f"**表示件数:** {len(display_df)}件")
+            if degraded and len(display_df) > DEGRADED_LIST_LIMIT:
+                load_governor.record_shed('list')
+                st.caption(f"⚠️ アクセス集中のため上位{DEGRADED_LIST_LIMIT}件のみ表示しています")
+                display_df = display_df.head(DEGRADED_LIST_LIMIT)
+        
+            # カード表示
+            for idx, row in display_df.iterrows():
+                with st.container():
+                    col1, col2, col3 = st.columns([3, 1, 1])
+                
+                    with col1:
+                        st.markdown(f"### {row['スポット名']}")
+                        st.write(f"📝 {row['説明']}")
+                        st.caption(f"🏷️ {row['カテゴリ']} | 🕐 {row['営業時間']} | 💰 {row['料金']}")
+                
+                    with col2:
+                        st.metric("距離", f"{row['距離']:.2f}km")
+                
+                    with col3:
+                        maps_link = create_google_maps_link(
+                            st.session_state.current_location,
+                            (row['緯度'], row['経度']),
+                            'driving'
+                        )
+                        st.link_button("🗺️", maps_link, use_container_width=True)
+                
+                    st.divider()
+
+    with tab3:
+        if tab3.open:
+            st.subheader("📅 年間イベントカレンダー")
+        
+            calendar, calendar_error = get_event_calendar()
+            if calendar_error:
+                st.error(f"❌ イベントデータの読み込みエラー: {calendar_error}（組み込みの年間イベントを表示しています）")
+
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                event_view = st.radio("表示", ["月を選択", "滞在期間で探す"], key='event_view')
+                if event_view == "月を選択":
+                    selected_month = st.selectbox(
+                        "月を選択",
+                        list(range(1, 13)),
+                        index=datetime.now().month - 1,
+                        format_func=lambda x: f"{x}月"
+                    )
+                    period_label = f"{selected_month}月"
+                    events = calendar.in_month(selected_month)
+                else:
+                    today = date.today()
+                    stay = st.date_input("滞在期間", value=(today, today + timedelta(days=2)), key='event_stay')
+                    # 期間の入力途中は開始日だけが返る
+                    stay_start, stay_end = (stay[0], stay[-1]) if isinstance(stay, (tuple, list)) else (stay, stay)
+                    period_label = f"{stay_start.month}月{stay_start.day}日～{stay_end.month}月{stay_end.day}日"
+                    events = calendar.between(stay_start, stay_end)
+                nearby_only = st.checkbox("現在地の近く（5km以内）のみ", key='event_nearby')
+
+            # 現在地からの距離（会場の座標があるイベントのみ）
+            lat, lng = st.session_state.current_location
+            distances = {event: dist for event, dist in calendar.near(lat, lng, 5.0)}
+            if nearby_only:
+                events = [event for event in events if event in distances]
+
+            if events:
+                for event in events:
+                    with st.container():
+                        st.markdown(f"### 🎉 {event.name}")
+                        st.write(f"📅 **開催日:** {event.period_text}")
+                        st.write(f"📝 **内容:** {event.description}")
+                        if event.venue:
+                            distance_text = f"（現在地から {distances[event]:.1f}km）" if event in distances else ""
+                            st.write(f"📍 **会場:** {event.venue}{distance_text}")
+                        st.divider()
+            else:
+                condition = "現在地の近くで" if nearby_only else ""
+                st.info(f"{period_label}に{condition}開催されるイベントは現在登録されていません")
+
+    with tab4:
+        if tab4.open:
+            if degraded:
+                load_governor.record_shed('tabs')
+                st.subheader("⭐ おすすめスポット")
+                st.warning("⚠️ アクセスが集中しているため、おすすめスポットの表示を一時停止しています。")
+            else:
+                st.subheader("⭐ おすすめスポット")
+
+                # 月別人気ランキング（閲覧・選択・ルート算出の利用状況から集計）
+                today = datetime.now()
+                ranking_months = [
+                    f"{today.year + (today.month - 1 - i) // 12}-{(today.month - 1 - i) % 12 + 1:02d}" for i in range(12)
+                ]
+                ranking_month = st.selectbox(
+                    "集計月",
+                    ranking_months,
+                    format_func=lambda x: f"{int(x[:4])}年{int(x[5:])}月",
+                    key='ranking_month'
+                )
+                known_spots = set(tourism_df['スポット名'])
+                ranking = [
+                    (name, score) for name, score in get_event_logger().ranking.top(ranking_month, 20)
+                    if name in known_spots
+                ][:10]
+
+                if len(ranking) >= 3:
+                    st.info(f"{ranking_month[:4]}年{int(ranking_month[5:])}月の人気観光地ランキング（閲覧・選択・ルート算出の回数から集計）")
+                    recommended_spots = [(name, f"📈 {score}pt", "") for name, score in ranking]
+                else:
+                    st.info("日田市の特におすすめの観光スポットをご紹介します")
+                    st.caption("※ この月の利用データが少ないため、おすすめスポットを表示しています")
+
+                # おすすめスポットのリスト（年間を通したおすすめ。ランキングのデータが少ない月に表示）
+                curated_spots = [
+                    ("豆田町（重要伝統的建造物群保存地区）", "🔥 必見！", "江戸時代の風情が残る歴史的な町並み"),
+                    ("咸宜園跡（日本遺産）", "🗾 日本遺産", "日本最大の私塾跡・世界遺産"),
+                    ("三隈川（屋形船・鵜飼い）", "🚣 伝統", "屋形船で川下りと鵜飼い体験"),
+                    ("大山ダム（進撃の巨人像）", "🎬 人気", "進撃の巨人ファン必見のスポット"),
+                    ("慈恩の滝", "💧 絶景", "裏側から見られる美しい滝"),
+                    ("日田祇園山鉾会館", "🎉 文化", "日田祇園祭の山鉾を展示"),
+                    ("ひなの里（天領日田資料館）", "🏛️ 歴史", "天領時代の資料を展示"),
+                    ("亀山公園", "🌸 自然", "桜の名所として有名な公園"),
+                    ("日田市立博物館（AOSE内）", "🏛️ 学習", "日田の歴史と文化を学べる"),
+                    ("月隈公園", "🌳 散策", "市街地を一望できる公園")
+                ]
+                if len(ranking) < 3:
+                    recommended_spots = curated_spots
+
+                for i, (spot_name, badge, description) in enumerate(recommended_spots, 1):
+                    # スポット情報を取得
+                    spot_df = tourism_df[tourism_df['スポット名'] == spot_name]
+
+                    if len(spot_df) > 0:
+                        spot = spot_df.iloc[0]
+
+                        with st.container():
+                            col_rank, col_info, col_action = st.columns([0.5, 3, 1])
+
+                            with col_rank:
+                                if i == 1:
+                                    st.markdown("## 🥇")
+                                elif i == 2:
+                                    st.markdown("## 🥈")
+                                elif i == 3:
+                                    st.markdown("## 🥉")
+                                else:
+                                    st.markdown(f"## {i}")
+
+                            with col_info:
+                                st.markdown(f"### {spot_name} {badge}")
+                                st.write(f"📝 {spot['説明']}")
+                                st.caption(f"🏷️ {spot['カテゴリ']} | 💰 {spot['料金']} | ⏱️ 所要時間: {spot['所要時間（参考）']}分")
+
+                            with col_action:
+                                # 距離計算
+                                distance = calculate_distance(
+                                    st.session_state.current_location[0],
+                                    st.session_state.current_location[1],
+                                    spot['緯度'],
+                                    spot['経度']
+                                )
+                                st.metric("距離", f"{distance:.1f}km")
+                                maps_link = create_google_maps_link(
+                                    st.session_state.current_location,
+                                    (spot['緯度'], spot['経度']),
+                                    'driving'
+                                )
+                                st.link_button("🗺️", maps_link, use_container_width=True)
+
+                            st.divider()
+
+    with tab5:
+        if tab5.open:
+            if degraded:
+                load_governor.record_shed('ai')
+                st.subheader("🤖 AIプラン提案（Gemini API）")
+                st.warning("⚠️ アクセスが集中しているため、AIプラン提案を一時停止しています。しばらくしてからお試しください。")
+            else:
+                st.subheader("🤖 AIプラン提案（Gemini API）")
+
+                st.info("Gemini AIがあなたの予算・時間・興味に合わせた最適な観光プランを提案します。")
+
+                # APIキー入力
+                st.markdown("### 🔑 APIキー設定")
+
+                api_key_input = st.text_input(
+                    "Gemini APIキーを入力してください",
+                    type="password",
+                    value=st.session_state.gemini_api_key,
+                    help="APIキーはセッション中のみ保持され、サーバーには保存されません"
+                )
+
+                if api_key_input:
+                    st.session_state.gemini_api_key = api_key_input
+
+                st.markdown("[🔑 Gemini APIキーを取得する →](https://aistudio.google.com/app/apikey)")
+
+                st.divider()
+
+                # プラン条件入力
+                st.markdown("### 📝 プラン条件を入力")
+
+                col1, col2 = st.columns(2)
+
+                with col1:
+                    user_budget = st.text_input("💰 予算", placeholder="例: 5000円以内", key='ai_budget')
+                    user_duration = st.text_input("⏱️ 滞在時間", placeholder="例: 3時間", key='ai_duration')
+
+                with col2:
+                    user_companion = st.selectbox(
+                        "👥 同行者",
+                        ["一人旅", "家族連れ", "カップル", "友人グループ"],
+                        key='ai_companion'
+                    )
+
+                # 興味カテゴリー
+                st.markdown("**🎯 興味のあるカテゴリー（複数選択可）:**")
+                interest_categories = st.multiselect(
+                    "興味のあるカテゴリーを選択",
+                    ["歴史", "自然", "グルメ", "体験", "温泉", "文化"],
+                    default=["歴史"],
+                    key='ai_interests'
+                )
+
+                # その他の要望
+                st.markdown("**💬 その他の要望（任意）:**")
+                user_request = st.text_area(
+                    "自由に要望を入力してください",
+                    placeholder="例: 子供が楽しめるスポットを含めてほしい、写真映えする場所を優先してほしい、ランチは和食がいい、など",
+                    height=100,
+                    key='ai_request'
+                )
+
+                # プラン生成ボタン
+                if st.button("🎯 AIプランを生成", type="primary", use_container_width=True):
+                    if not st.session_state.gemini_api_key:
+                        st.error("❌ Gemini APIキーを入力してください")
+                    elif not user_budget or not user_duration:
+                        st.warning("⚠️ 予算と滞在時間を入力してください")
+                    else:
+                        try:
+                            with st.spinner("🤖 AIがプランを生成中..."):
+                                # スポットリスト作成
+                                spots_context = []
+                                for _, spot in tourism_df.iterrows():
+                                    spots_context.append(
+                                        f"- {spot['スポット名']}: {spot['説明']} (カテゴリ: {spot['カテゴリ']}, 料金: {spot['料金']}, 所要時間: {spot['所要時間（参考）']}分)"
+                                    )
+                                spots_text = "\n".join(spots_context)
+
+                                # 現在の日時と季節情報を取得
+                                current_date = datetime.now()
+                                month = current_date.month
+
+                                # 季節判定
+                                if month in [3, 4, 5]:
+                                    season = "春"
+                                    season_desc = "桜の季節で、温暖な気候"
+                                elif month in [6, 7, 8]:
+                                    season = "夏"
+                                    season_desc = "暑い季節で、川開き観光祭や祇園祭などのイベントがある時期"
+                                elif month in [9, 10, 11]:
+                                    season = "秋"
+                                    season_desc = "紅葉が美しく、天領まつりやもみじ祭りがある時期"
+                                else:
+                                    season = "冬"
+                                    season_desc = "寒い季節で、温泉が特に人気"
+
+                                # 天気予報（キャッシュ済みの値のみ使用し、ここでは取得しない）
+                                weather_report = get_weather_service().get()
+                                weather_line = weather_report.summary() if weather_report else "取得できませんでした"
+
+                                # 開催中・1週間以内に始まるイベント
+                                events_text = get_event_calendar()[0].prompt_lines(
+                                    current_date.date(), current_date.date() + timedelta(days=7)
+                                )
+
+                                # プロンプト作成
+                                system_prompt = "あなたは日田市の観光コンシェルジュです。現在の天気・季節を考慮しながら、以下の観光スポットリストとユーザーの要望に基づき、魅力的な観光プランを提案してください。"
+
+                                user_prompt = f"""
+現在の日付: {current_date.strftime('%Y年%m月%d日')}
+現在の季節: {season}（{season_desc}）
+現在の天気: {weather_line}
+
+開催中・1週間以内のイベント:
+{events_text}
+
+観光スポットリスト:
+{spots_text}
+
+ユーザーの要望:
+- 予算: {user_budget}
+- 滞在時間: {user_duration}
+- 興味: {', '.join(interest_categories)}
+- 同行者: {user_companion}
+{f'- その他の要望: {user_request}' if user_request else ''}
+
+上記の条件と現在の季節・天気・開催中のイベントを考慮して、日田市の観光プランを訪問順序を含めて具体的に提案してください。
+各スポットの魅力や、なぜそのスポットを選んだのか、季節に合わせたおすすめポイントも簡潔に説明してください。
+                        """
+
+                                # API呼び出し（キーごとのクライアントを使い回し、混雑時は待機・再試行する）
+                                response_text = get_gemini_manager().generate(
+                                    st.session_state.gemini_api_key, f"{system_prompt}\n\n{user_prompt}"
+                                )
+
+                                # 結果表示
+                                st.markdown("---")
+                                st.markdown("### 📋 AI提案プラン")
+                                st.markdown(response_text)
+
+                                st.success("✅ プラン生成完了！")
+
+                        except GeminiError as e:
+                            st.error(f"❌ {e}")
+                            if e.status not in (429, None):
+                                st.info("💡 APIキーが正しいか確認してください。また、Gemini APIが有効化されているか確認してください。")
+                        except Exception as e:
+                            st.error(f"❌ エラーが発生しました: {str(e)}")
+                            st.info("💡 APIキーが正しいか確認してください。また、Gemini APIが有効化されているか確認してください。")
 
-        st.info("日田市の公式ハザードマップで、災害時の危険箇所や避難場所を確認できます")
 
-        st.markdown("""
+    with tab6:
+        if tab6.open:
+            st.subheader("👥 グループの集合場所")
+            tourism_version, disaster_version = get_dataset_versions()
+            group_meetup_view({"観光スポット": (tourism_df, tourism_version),
+                               "避難所": (disaster_df, disaster_version)}, 'tourism_meetup')
+
+else:  # 防災モード
+    tab1, tab2, tab3, tab4 = st.tabs(["🏥 避難所マップ", "🗾 ハザードマップ", "📢 防災情報", "👥 集合場所"],
+                               key='disaster_view', on_change='rerun')
+    
+    with tab1:
+        if tab1.open:
+            st.subheader("🏥 避難所マップ")
+        
+            shelter_map_view()
+
+    with tab2:
+        if tab2.open:
+            st.subheader("🗾 ハザードマップ")
+
+            st.info("日田市の公式ハザードマップで、災害時の危険箇所や避難場所を確認できます")
+
+            # 読み込んだハザード区域（避難所マップに重ねて表示する）
+            hazard_index, hazard_error = get_hazard_index()
+            if hazard_error:
+                st.warning(f"⚠️ {hazard_error}")
+            elif hazard_index is not None:
+                zone_counts = {}
+                for zone in hazard_index.zones:
+                    zone_counts[zone.label] = zone_counts.get(zone.label, 0) + 1
+                shelter_hazards = get_shelter_hazards(get_dataset_versions()[1])
+                here_zones = hazard_index.zones_at(*st.session_state.current_location)
+                st.markdown("### 🌊 ハザード区域")
+                st.write("、".join(f"{label}: {count}区域" for label, count in zone_counts.items()))
+                st.write(f"区域内の避難所: {sum(1 for level, _ in shelter_hazards.values() if level > 0)}"
+                         f" / {len(shelter_hazards)}箇所")
+                if here_zones:
+                    st.error("⚠️ 現在地は " + "、".join(sorted({zone.label for zone in here_zones})) + " の中です")
+                else:
+                    st.success("現在地は読み込んだハザード区域の外です")
+                st.caption("避難所マップに区域を重ねて表示し、最寄りの避難所は区域内を後回し・除外して探せます")
+
+            st.markdown("""
         ### 📌 確認事項
         - 最寄りの避難所を事前に確認
         - 避難経路を複数確認
@@ -1260,117 +1964,119 @@ else:  # 防災モード
         - 家族との連絡方法を決めておく
         """)
 
-        st.divider()
+            st.divider()
 
-        st.markdown("### 🗾 日田市公式ハザードマップ")
+            st.markdown("### 🗾 日田市公式ハザードマップ")
 
-        col1, col2 = st.columns(2)
+            col1, col2 = st.columns(2)
 
-        with col1:
-            st.markdown("#### 📍 洪水・土砂災害ハザードマップ")
-            st.write("日田市の洪水・土砂災害の危険エリアを確認できます")
-            st.link_button(
-                "🗾 洪水・土砂災害ハザードマップを見る",
-                "https://www.city.hita.oita.jp/soshiki/somubu/kikikanrishitu/kikikanri/anshin/bosai/Preparing_for_disaster/3317.html",
-                use_container_width=True,
-                type="primary"
-            )
+            with col1:
+                st.markdown("#### 📍 洪水・土砂災害ハザードマップ")
+                st.write("日田市の洪水・土砂災害の危険エリアを確認できます")
+                st.link_button(
+                    "🗾 洪水・土砂災害ハザードマップを見る",
+                    "https://www.city.hita.oita.jp/soshiki/somubu/kikikanrishitu/kikikanri/anshin/bosai/Preparing_for_disaster/3317.html",
+                    use_container_width=True,
+                    type="primary"
+                )
 
-        with col2:
-            st.markdown("#### 📍 地震ハザードマップ")
-            st.write("日田市の地震による被害想定を確認できます")
-            st.link_button(
-                "🗾 地震ハザードマップを見る",
-                "https://www.city.hita.oita.jp/soshiki/somubu/kikikanrishitu/kikikanri/anshin/bosai/Preparing_for_disaster/12441.html",
-                use_container_width=True,
-                type="primary"
-            )
+            with col2:
+                st.markdown("#### 📍 地震ハザードマップ")
+                st.write("日田市の地震による被害想定を確認できます")
+                st.link_button(
+                    "🗾 地震ハザードマップを見る",
+                    "https://www.city.hita.oita.jp/soshiki/somubu/kikikanrishitu/kikikanri/anshin/bosai/Preparing_for_disaster/12441.html",
+                    use_container_width=True,
+                    type="primary"
+                )
 
     with tab3:
-        st.subheader("📢 防災情報")
-        
-        col1, col2 = st.columns(2)
+        if tab3.open:
+            st.subheader("📢 防災情報")
         
-        with col1:
-            st.markdown("### 🏪 営業中の店舗")
-            
-            stores = [
-                ("ファミリーマート日田淡窓店", "✅ 営業中", "green"),
-                ("ローソン日田中央一丁目店", "✅ 営業中", "green"),
-                ("セブンイレブン日田三本松2丁目店", "⚠️ 確認中", "orange"),
-            ]
-            
-            for store_name, status, color in stores:
-                st.markdown(f":{color}[{status}] {store_name}")
+            col1, col2 = st.columns(2)
         
-        with col2:
-            st.markdown("### 🥤 近くの自動販売機")
-            st.info("現在地から500m圏内: 8台")
-            st.success("すべて稼働中")
+            with col1:
+                st.markdown("### 🏥 避難所の開設状況")
+                shelter_aggregates = get_shelter_aggregates()
+                shelter_stats = shelter_aggregates.snapshot() if shelter_aggregates is not None else None
+                if shelter_stats is None:
+                    st.warning("避難所データを読み込めませんでした")
+                else:
+                    for status, count in shelter_stats['by_status'].items():
+                        color = 'green' if status == '開設中' else 'orange'
+                        st.markdown(f":{color}[{status}] {count}箇所")
+
+            with col2:
+                st.markdown("### 👥 受け入れ可能人数")
+                if shelter_stats is not None:
+                    if shelter_stats['open']:
+                        st.info(f"開設中の避難所: {shelter_stats['open_capacity']:,}名")
+                    else:
+                        st.info("現在、開設中の避難所はありません")
+                    for category, count in shelter_stats['by_category'].items():
+                        st.caption(f"{category}: {shelter_stats['open_by_category'].get(category, 0)} / {count}箇所 開設中")
         
-        st.divider()
+            st.divider()
         
-        st.markdown("### 🎒 AI防災グッズ提案")
+            st.markdown("### 🎒 AI防災グッズ提案")
 
-        st.info("💡 Gemini AIがあなたの予算や状況に合わせた最適な防災グッズを提案します")
+            st.info("💡 Gemini AIがあなたの予算や状況に合わせた最適な防災グッズを提案します")
 
-        # 条件入力
-        col1, col2 = st.columns(2)
-        with col1:
-            disaster_budget = st.selectbox(
-                "💰 予算",
-                ["3,000円以下", "3,000～10,000円", "10,000～30,000円", "30,000円以上"],
-                key='disaster_budget_select'
-            )
+            # 条件入力
+            col1, col2 = st.columns(2)
+            with col1:
+                disaster_budget = st.selectbox(
+                    "💰 予算",
+                    ["3,000円以下", "3,000～10,000円", "10,000～30,000円", "30,000円以上"],
+                    key='disaster_budget_select'
+                )
             
-            household_size = st.selectbox(
-                "👥 家族構成",
-                ["一人暮らし", "二人暮らし", "3～4人家族", "5人以上の家族"],
-                key='household_size'
-            )
+                household_size = st.selectbox(
+                    "👥 家族構成",
+                    ["一人暮らし", "二人暮らし", "3～4人家族", "5人以上の家族"],
+                    key='household_size'
+                )
 
-        with col2:
-            living_situation = st.selectbox(
-                "🏠 住居タイプ",
-                ["マンション・アパート", "一戸建て", "高層階（5階以上）", "1階・低層階"],
-                key='living_situation'
-            )
+            with col2:
+                living_situation = st.selectbox(
+                    "🏠 住居タイプ",
+                    ["マンション・アパート", "一戸建て", "高層階（5階以上）", "1階・低層階"],
+                    key='living_situation'
+                )
             
-            priority = st.multiselect(
-                "🎯 重視する項目（複数選択可）",
-                ["持ち運びやすさ", "長期保存", "衛生面", "通信手段", "照明・電源", "食料・水"],
-                default=["食料・水"],
-                key='disaster_priority'
-            )
+                priority = st.multiselect(
+                    "🎯 重視する項目（複数選択可）",
+                    ["持ち運びやすさ", "長期保存", "衛生面", "通信手段", "照明・電源", "食料・水"],
+                    default=["食料・水"],
+                    key='disaster_priority'
+                )
 
-        # その他の要望
-        additional_requirements = st.text_area(
-            "💬 その他の要望（任意）",
-            placeholder="例: ペットがいる、小さい子供がいる、高齢者と同居、アレルギーがある、など",
-            height=80,
-            key='disaster_additional'
-        )
+            # その他の要望
+            additional_requirements = st.text_area(
+                "💬 その他の要望（任意）",
+                placeholder="例: ペットがいる、小さい子供がいる、高齢者と同居、アレルギーがある、など",
+                height=80,
+                key='disaster_additional'
+            )
 
-        # AI提案ボタン
-        if st.button("🤖 AI防災グッズ提案を生成", type="primary", use_container_width=True, key='disaster_ai_btn'):
-            if not GENAI_AVAILABLE:
-                st.error("❌ google-generativeai パッケージがインストールされていません。")
-                st.info("以下のコマンドでインストールしてください: `pip install google-generativeai`")
-            elif not st.session_state.gemini_api_key:
-                st.warning("⚠️ AIプラン提案タブでGemini APIキーを設定してください")
-                st.markdown("👉 **観光モード** → **AIプラン提案タブ** → **APIキー設定**")
-            else:
-                try:
-                    with st.spinner("🤖 AIが防災グッズを提案中..."):
-                        # Gemini API設定
-                        genai.configure(api_key=st.session_state.gemini_api_key)
-                        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-                        # プロンプト作成
-                        system_prompt = """あなたは防災の専門家です。ユーザーの予算、家族構成、住居状況、優先項目に基づいて、
+            # AI提案ボタン
+            if degraded:
+                load_governor.record_shed('ai')
+                st.caption("⚠️ アクセスが集中しているため、AI提案は一時停止しています")
+            if st.button("🤖 AI防災グッズ提案を生成", type="primary", use_container_width=True, key='disaster_ai_btn',
+                         disabled=degraded):
+                if not st.session_state.gemini_api_key:
+                    st.warning("⚠️ AIプラン提案タブでGemini APIキーを設定してください")
+                    st.markdown("👉 **観光モード** → **AIプラン提案タブ** → **APIキー設定**")
+                else:
+                    try:
+                        with st.spinner("🤖 AIが防災グッズを提案中..."):
+                            # プロンプト作成
+                            system_prompt = """あなたは防災の専門家です。ユーザーの予算、家族構成、住居状況、優先項目に基づいて、
 実用的で具体的な防災グッズのリストを提案してください。各商品には概算価格も含めてください。"""
 
-                        user_prompt = f"""
+                            user_prompt = f"""
 以下の条件に基づいて、防災グッズのおすすめリストを作成してください：
 
 【条件】
@@ -1389,38 +2095,56 @@ else:  # 防災モード
 実用的で、すぐに購入できる具体的な商品名を挙げてください。
 """
 
-                        # API呼び出し
-                        response = model.generate_content(f"{system_prompt}\n\n{user_prompt}")
+                            # API呼び出し（キーごとのクライアントを使い回し、混雑時は待機・再試行する）
+                            response_text = get_gemini_manager().generate(
+                                st.session_state.gemini_api_key, f"{system_prompt}\n\n{user_prompt}"
+                            )
 
-                        # 結果表示
-                        st.markdown("---")
-                        st.markdown("### 📋 AI提案：あなたに最適な防災グッズ")
-                        st.markdown(response.text)
+                            # 結果表示
+                            st.markdown("---")
+                            st.markdown("### 📋 AI提案：あなたに最適な防災グッズ")
+                            st.markdown(response_text)
 
-                        st.success("✅ 提案完了！")
+                            st.success("✅ 提案完了！")
                         
-                        # 注意事項
-                        st.info("💡 **購入前の確認事項**\n- 価格は目安です。購入時に最新価格を確認してください\n- 賞味期限・使用期限を定期的にチェックしましょう\n- 家族で避難場所や連絡方法を事前に話し合いましょう")
-
-                except Exception as e:
-                    st.error(f"❌ エラーが発生しました: {str(e)}")
-                    st.info("💡 APIキーが正しいか確認してください")
+                            # 注意事項
+                            st.info("💡 **購入前の確認事項**\n- 価格は目安です。購入時に最新価格を確認してください\n- 賞味期限・使用期限を定期的にチェックしましょう\n- 家族で避難場所や連絡方法を事前に話し合いましょう")
+
+                    except GeminiError as e:
+                        st.error(f"❌ {e}")
+                        if e.status not in (429, None):
+                            st.info("💡 APIキーが正しいか確認してください")
+                    except Exception as e:
+                        st.error(f"❌ エラーが発生しました: {str(e)}")
+                        st.info("💡 APIキーが正しいか確認してください")
         
-        st.divider()
+            st.divider()
         
-        # 緊急連絡先
-        st.markdown("### 📞 緊急連絡先")
+            # 緊急連絡先
+            st.markdown("### 📞 緊急連絡先")
         
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.error("**🚒 消防・救急**")
-            st.markdown("### 119")
-        with col2:
-            st.info("**🚓 警察**")
-            st.markdown("### 110")
-        with col3:
-            st.warning("**🏛️ 日田市役所**")
-            st.markdown("### 0973-23-3111")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.error("**🚒 消防・救急**")
+                st.markdown("### 119")
+            with col2:
+                st.info("**🚓 警察**")
+                st.markdown("### 110")
+            with col3:
+                st.warning("**🏛️ 日田市役所**")
+                st.markdown("### 0973-23-3111")
+
+    with tab4:
+        if tab4.open:
+            st.subheader("👥 家族の集合場所")
+            shelter_store = get_shelter_store()
+            shelters_df = shelter_store.df if shelter_store is not None else disaster_df
+            disaster_version = get_dataset_versions()[1]
+            # 開設中の避難所は状態の更新で行が変わるので、ストアの更新番号もバージョンに含める
+            open_version = (disaster_version, 'open', shelter_store.version if shelter_store is not None else 0)
+            group_meetup_view({"すべての避難所": (shelters_df, disaster_version),
+                               "開設中の避難所": (shelters_df[shelters_df['状態'] == '開設中'], open_version)},
+                              'disaster_meetup')
 
 # フッター
 st.divider()
@@ -1449,6 +2173,7 @@ with st.expander("💡 使い方のヒント"):
     6. **イベント情報**: 月別にイベントを確認できます
     7. **おすすめスポット**: 日田市の人気観光地をランキング形式で表示
     8. **AIプラン提案**: Gemini APIを使って、予算・時間・興味に合わせた最適な観光プランを自動生成
+    9. **集合場所**: 別々の宿などから出発するグループが集まりやすいスポットを検索
 
     #### 防災モードでできること
     1. **最寄り避難所の確認**: 現在地から近い避難所を表示
@@ -1457,8 +2182,9 @@ with st.expander("💡 使い方のヒント"):
        - 2つ以上選択：最適化避難ルートを算出（最短距離）
     3. **避難ルート**: 徒歩での避難ルートをGoogle Mapsで確認
     4. **開設状況の確認**: 避難所の開設状況と収容人数をリアルタイム表示
-    5. **営業店舗情報**: 災害時の営業中コンビニ・スーパーを確認
+    5. **避難所の集計**: 状態別の避難所数と開設中の避難所の受け入れ可能人数を確認
     6. **防災グッズ提案**: 予算に応じた防災グッズのおすすめ
+    7. **集合場所**: 家族が別々の場所から集まりやすい避難所を検索
 
     #### 最適化ルート機能について
     - **観光モード**: 待ち時間と距離を考慮したスコアリングで最適な訪問順序を算出
@@ -1490,4 +2216,16 @@ with st.expander("💡 使い方のヒント"):
     - 移動手段（車・徒歩・自転車・公共交通）を選択してからボタンを押してください
     - スマートフォンではGoogle Mapsアプリが自動的に開きます
     - 最適化ルートでは複数の経由地を含むルートをGoogle Mapsで開くことができます
-    """)
\ No newline at end of file
+    """)
+
+# 再実行の所要時間を記録（縮退モードの判定に使う）
+rerun_seconds = time.perf_counter() - rerun_started
+load_governor.record_latency(rerun_seconds)
+st.session_state.setdefault('rerun_seconds', {})['page'] = rerun_seconds
+# 起動から初回の画面表示までの時間を記録し、残りの準備はバックグラウンドで行う
+STARTUP.mark('first_render')
+start_warmup(tourism_df, disaster_df)
+# 最初の表示で地図を後回しにした場合は、表示済みの画面のまま再実行して地図を描く
+st.session_state.page_rendered = True
+if st.session_state.pop('map_deferred', False):
+    st.rerun()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# リポジトリ直下のモジュールを読み込めるようにする（tools/ のスクリプトと同じ）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
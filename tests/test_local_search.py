@@ -0,0 +1,28 @@
+import random
+
+import pandas as pd
+
+from local_search import improve_route
+
+
+def make_spots(n, seed=0):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'スポット名': [f"スポット{i}" for i in range(n)],
+        '緯度': [rng.uniform(33.25, 33.40) for _ in range(n)],
+        '経度': [rng.uniform(130.85, 131.00) for _ in range(n)],
+    })
+
+
+def test_seeded_search_does_not_depend_on_workers_or_deadline():
+    spots = make_spots(25)
+    route = list(range(len(spots)))
+    origin = [33.32, 130.94]
+
+    in_process = improve_route(origin, spots, route, restarts=4, iterations=20, seed=7, workers=0)
+    in_pool = improve_route(origin, spots, route, restarts=4, iterations=20, seed=7, workers=2)
+    short_deadline = improve_route(origin, spots, route, restarts=4, iterations=20, seed=7, workers=0,
+                                   deadline_seconds=0.0)
+
+    assert in_process == in_pool == short_deadline
+    assert sorted(in_process[0]) == route
@@ -0,0 +1,230 @@
+"""地図タイルのオフラインキャッシュ（MBTiles）とローカル配信
+
+災害時に公開タイルサーバーへ接続できない・帯域が足りない場合でも地図を表示できるように、
+日田周辺のタイルを事前に MBTiles（SQLite）へ保存しておき、ローカルのHTTPエンドポイントから配信する。
+レスポンスには Cache-Control / ETag を付け、ブラウザが同じタイルを再取得しないようにする。
+HITA_TILE_UPSTREAM を設定すると、キャッシュに無いタイルだけを取得して保存する（読み込み時キャッシュ）。
+
+タイルの事前保存は tools/seed_tiles.py で行う。
+
+使い方（単独起動）:
+    python tile_cache.py --mbtiles tiles/hita.mbtiles --port 8700
+Streamlitアプリ内で起動する場合は HITA_TILE_PORT を設定する（地図は HITA_TILE_URL のテンプレートを使う）。
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import urllib.request
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+OSM_TILE_URL = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+OSM_ATTRIBUTION = '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+DEFAULT_MBTILES_PATH = os.path.join('tiles', 'hita.mbtiles')
+# タイルは更新頻度が低いので長めにキャッシュさせる（秒）
+TILE_MAX_AGE = 7 * 24 * 3600
+USER_AGENT = 'hita-navi-tile-cache/1.0'
+
+
+class MBTilesStore:
+    """MBTiles 形式のタイル保存先（行番号は仕様どおり TMS で保存する）
+
+    Args:
+        path: MBTiles ファイル
+        readonly: 読み込み専用で開く（配信のみで、保存しない場合）
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        if not readonly:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        uri = f"file:{path}?mode=ro" if readonly else f"file:{path}"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        if not readonly:
+            with self._lock:
+                self._conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+                    CREATE TABLE IF NOT EXISTS tiles (
+                        zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+                        PRIMARY KEY (zoom_level, tile_column, tile_row)
+                    );
+                """)
+                self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _tms_row(z: int, y: int) -> int:
+        return (1 << z) - 1 - y
+
+    def get_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """XYZ 形式の座標でタイルを取得する（無ければ None）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, self._tms_row(z, y))
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bytes(row[0])
+
+    def has_tile(self, z: int, x: int, y: int) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, self._tms_row(z, y))
+            ).fetchone() is not None
+
+    def put_tiles(self, tiles):
+        """(z, x, y, data) のまとまりを1トランザクションで保存する"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                [(z, x, self._tms_row(z, y), sqlite3.Binary(data)) for z, x, y, data in tiles]
+            )
+            self._conn.commit()
+
+    def put_tile(self, z: int, x: int, y: int, data: bytes):
+        self.put_tiles([(z, x, y, data)])
+
+    def set_metadata(self, values: Dict[str, str]):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                                   [(k, str(v)) for k, v in values.items()])
+            self._conn.commit()
+
+    def metadata(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM metadata").fetchall())
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def fetch_tile(url_template: str, z: int, x: int, y: int, timeout: float = 10.0) -> bytes:
+    """上流のタイルサーバーから1枚取得する"""
+    request = urllib.request.Request(url_template.format(z=z, x=x, y=y), headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def parse_tile_path(path: str) -> Optional[Tuple[int, int, int]]:
+    """'/tiles/{z}/{x}/{y}.png' → (z, x, y)"""
+    parts = path.split('?', 1)[0].strip('/').split('/')
+    if len(parts) != 4 or parts[0] != 'tiles':
+        return None
+    try:
+        z, x = int(parts[1]), int(parts[2])
+        y = int(parts[3].split('.', 1)[0])
+    except ValueError:
+        return None
+    if not (0 <= z <= 22 and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        return None
+    return z, x, y
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    store: MBTilesStore = None
+    upstream: Optional[str] = None
+    started = formatdate(usegmt=True)
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] == '/health':
+            self._send(200, b'ok', 'text/plain; charset=utf-8', cache=False)
+            return
+        tile = parse_tile_path(self.path)
+        if tile is None:
+            self._send(404, b'not found', 'text/plain; charset=utf-8', cache=False)
+            return
+        data = self.store.get_tile(*tile)
+        if data is None and self.upstream and not self.store.readonly:
+            try:
+                data = fetch_tile(self.upstream, *tile)
+                self.store.put_tile(*tile, data)
+            except OSError:
+                data = None
+        if data is None:
+            self._send(404, b'tile not cached', 'text/plain; charset=utf-8', cache=False)
+            return
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f'public, max-age={TILE_MAX_AGE}')
+            self.end_headers()
+            return
+        content_type = 'image/jpeg' if data[:3] == b'\xff\xd8\xff' else 'image/png'
+        self._send(200, data, content_type, etag=etag)
+
+    def _send(self, status: int, body: bytes, content_type: str, cache: bool = True, etag: Optional[str] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        # 地図はStreamlitとは別のオリジンから読み込まれる
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if cache:
+            self.send_header('Cache-Control', f'public, max-age={TILE_MAX_AGE}')
+            self.send_header('Last-Modified', self.started)
+        else:
+            self.send_header('Cache-Control', 'no-store')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_tile_server(store: MBTilesStore, host: str = '127.0.0.1', port: int = 8700,
+                      upstream: Optional[str] = None) -> ThreadingHTTPServer:
+    """タイル配信サーバーを別スレッドで起動する"""
+    handler = type('BoundTileHandler', (TileHandler,), {'store': store, 'upstream': upstream})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="tile-server", daemon=True).start()
+    return server
+
+
+def tile_layer_settings(local_url: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """Folium の tiles / attr に渡す値
+
+    HITA_TILE_URL、ローカルのタイル配信のURL（local_url）の順に使い、どちらも無ければ公開のOpenStreetMap。
+    """
+    url = os.environ.get('HITA_TILE_URL') or local_url
+    if url:
+        return url, os.environ.get('HITA_TILE_ATTRIBUTION', OSM_ATTRIBUTION)
+    return 'OpenStreetMap', None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MBTiles のタイル配信サーバー")
+    parser.add_argument('--mbtiles', default=DEFAULT_MBTILES_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--upstream', default=os.environ.get('HITA_TILE_UPSTREAM'),
+                        help="キャッシュに無いタイルを取得する上流のURLテンプレート（省略時は取得しない）")
+    args = parser.parse_args()
+
+    store = MBTilesStore(args.mbtiles, readonly=args.upstream is None and os.path.exists(args.mbtiles))
+    server = start_tile_server(store, args.host, args.port, args.upstream)
+    print(f"tile server: http://{args.host}:{args.port}/tiles/{{z}}/{{x}}/{{y}}.png（{store.count()}枚）")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Gemini API（generateContent）のローカルスタブサーバー
+
+負荷試験や動作確認でGoogleのサーバーに接続せず、APIキーも消費しないためのもの。
+応答までの待ち時間と、一定の割合で 429 / 503 を返す設定ができる。
+
+使い方:
+    python tools/gemini_stub_server.py --port 8766 --latency 0.8
+    HITA_GEMINI_BASE_URL=http://127.0.0.1:8766 streamlit run streamlit_app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def sample_response(prompt: str) -> dict:
+    """generateContent と同じ構造の応答を作る"""
+    text = ("## 🗺️ おすすめプラン（スタブ）\n\n"
+            "1. 豆田町（重要伝統的建造物群保存地区） — 町並み散策 60分\n"
+            "2. 咸宜園跡（日本遺産） — 見学 45分\n"
+            "3. 三隈川（屋形船・鵜飼い） — 川下り 90分\n\n"
+            f"（プロンプト {len(prompt)} 文字に対するスタブの応答です）")
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": len(prompt) // 2, "candidatesTokenCount": 120,
+                          "totalTokenCount": len(prompt) // 2 + 120},
+        "modelVersion": "stub",
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    error_rate = 0.0
+    error_status = 429
+    requests = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        with StubHandler._lock:
+            StubHandler.requests += 1
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if ':generateContent' not in self.path:
+            self._send(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+            return
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            status = self.error_status
+            self._send(status, {"error": {"code": status, "message": "stub error",
+                                          "status": "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"}})
+            return
+        try:
+            payload = json.loads(body or b'{}')
+            prompt = ''.join(part.get('text', '') for content in payload.get('contents', [])
+                             for part in content.get('parts', []))
+        except ValueError:
+            prompt = ''
+        self._send(200, sample_response(prompt))
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port: int = 0, latency: float = 0.5, error_rate: float = 0.0, error_status: int = 429):
+    """スタブを別スレッドで起動し、(server, base_url) を返す"""
+    handler = type('ConfiguredStubHandler', (StubHandler,),
+                   {'latency': latency, 'error_rate': error_rate, 'error_status': error_status})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini API のローカルスタブ")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.5, help="応答までの秒数")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="エラーを返す割合（0〜1）")
+    parser.add_argument('--error-status', type=int, default=429, choices=(429, 500, 503))
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, args.latency, args.error_rate, args.error_status)
+    print(f"Gemini stub: {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""気象庁の天気予報JSONを返すローカルスタブサーバー
+
+本番のJMAサーバーに接続せずに天気表示を確認するためのもの。
+
+使い方:
+    python tools/jma_stub_server.py --port 8765
+    HITA_JMA_FORECAST_URL=http://127.0.0.1:8765/bosai/forecast/data/forecast/{office}.json streamlit run streamlit_app.py
+"""
+import argparse
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def sample_forecast(weather_code="201", weather="くもり　時々　晴れ", pops=("10", "20", "30", "20"),
+                    temps=("12", "24")):
+    """forecast/440000.json と同じ構造のサンプルを作る"""
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    stamp = lambda dt: dt.strftime("%Y-%m-%dT%H:%M:%S+09:00")
+    days = [stamp(now + timedelta(days=i)) for i in range(3)]
+    hours = [stamp(now + timedelta(hours=6 * i)) for i in range(len(pops))]
+    return [
+        {
+            "publishingOffice": "大分地方気象台",
+            "reportDatetime": stamp(now),
+            "timeSeries": [
+                {
+                    "timeDefines": days,
+                    "areas": [
+                        {"area": {"name": "中部", "code": "440010"},
+                         "weatherCodes": ["100", "100", "101"],
+                         "weathers": ["晴れ", "晴れ", "晴れ　時々　くもり"]},
+                        {"area": {"name": "西部", "code": "440030"},
+                         "weatherCodes": [weather_code, "100", "200"],
+                         "weathers": [weather, "晴れ", "くもり"]},
+                    ]
+                },
+                {
+                    "timeDefines": hours,
+                    "areas": [
+                        {"area": {"name": "中部", "code": "440010"}, "pops": ["0"] * len(pops)},
+                        {"area": {"name": "西部", "code": "440030"}, "pops": list(pops)},
+                    ]
+                },
+                {
+                    "timeDefines": days[:2],
+                    "areas": [
+                        {"area": {"name": "大分", "code": "44132"}, "temps": ["14", "25"]},
+                        {"area": {"name": "日田", "code": "44081"}, "temps": list(temps)},
+                    ]
+                }
+            ]
+        }
+    ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # 差し替え可能なレスポンス（テストからstatusやpayloadを書き換える）
+    payload = None
+    status = 200
+
+    def do_GET(self):
+        if not self.path.startswith("/bosai/forecast/data/forecast/"):
+            self.send_error(404)
+            return
+        if self.status != 200:
+            self.send_error(self.status)
+            return
+        body = json.dumps(self.payload or sample_forecast(), ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(host="127.0.0.1", port=0):
+    """別スレッドでスタブサーバーを起動し、(server, URLテンプレート) を返す"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}/bosai/forecast/data/forecast/{{office}}.json"
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="気象庁予報JSONのスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"JMA stub: http://{args.host}:{args.port}/bosai/forecast/data/forecast/{{office}}.json")
+    server.serve_forever()
@@ -0,0 +1,147 @@
+"""経路計算APIの負荷試験
+
+api_server.py に対して keep-alive の同時接続でリクエストを送り、
+1秒あたりの処理数とレイテンシ（p50/p95/p99）を表示する。
+--compare-streamlit を付けると、同じ最適化ルート算出を Streamlit の AppTest
+（ボタン押下 → スクリプト全体の再実行）で行った場合の処理数も測って並べる。
+
+使い方:
+    python api_server.py --port 8600 &
+    python tools/loadtest_api.py --url http://127.0.0.1:8600 --concurrency 16 --duration 10
+    python tools/loadtest_api.py --inprocess --compare-streamlit
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_requests(tourism_names, kind):
+    """負荷試験で送るリクエスト (method, path, body) を作る"""
+    origin = [33.3219, 130.9414]
+    if kind == 'nearest':
+        return 'GET', f"/v1/shelters/nearest?lat={origin[0]}&lng={origin[1]}&k=5", b''
+    if kind == 'optimize':
+        body = {'mode': 'tourism', 'origin': origin, 'spots': tourism_names[:5], 'travel_mode': 'driving'}
+    else:  # batch
+        body = {'requests': [
+            {'op': 'optimize', 'mode': 'tourism', 'origin': origin, 'spots': tourism_names[i:i + 5]}
+            for i in range(0, 40, 5)
+        ]}
+        return 'POST', '/v1/batch', json.dumps(body, ensure_ascii=False).encode('utf-8')
+    return 'POST', '/v1/route/optimize', json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+async def worker(host, port, request, deadline, latencies, errors):
+    method, path, body = request
+    reader, writer = await asyncio.open_connection(host, port)
+    head = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode('utf-8') + body
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(head)
+            await writer.drain()
+            response_head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in response_head.split(b'\r\n'):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            if not response_head.startswith(b'HTTP/1.1 200'):
+                errors.append(response_head.split(b'\r\n')[0])
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+async def run_load(url, request, concurrency, duration):
+    parts = urlsplit(url)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        worker(parts.hostname, parts.port, request, deadline, latencies, errors)
+        for _ in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(label, latencies, elapsed, errors=()):
+    print(f"{label:<28} {len(latencies) / elapsed:9.1f} req/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:7.2f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.2f} ms  errors {len(errors)}")
+
+
+def measure_streamlit(tourism_names, iterations):
+    """AppTestで最適化ボタンを押したときのスクリプト再実行時間を測る"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, 'streamlit_app.py'), default_timeout=60).run()
+    at.multiselect(key='map_multi_select').set_value(tourism_names[:5]).run()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        at.button(key='map_optimize_btn').click().run()
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="経路計算APIの負荷試験")
+    parser.add_argument('--url', default='http://127.0.0.1:8600')
+    parser.add_argument('--inprocess', action='store_true', help="このプロセス内でAPIサーバーを起動して測る")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--kinds', default='nearest,optimize,batch')
+    parser.add_argument('--compare-streamlit', action='store_true')
+    parser.add_argument('--streamlit-iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    from spots_data import load_spots_frames
+    tourism_df, disaster_df = load_spots_frames()
+    names = tourism_df['スポット名'].tolist()
+
+    url = args.url
+    if args.inprocess:
+        import socket
+        from api_server import RoutingService, start_in_thread
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        start_in_thread(RoutingService(tourism_df, disaster_df), '127.0.0.1', port)
+        url = f"http://127.0.0.1:{port}"
+        time.sleep(0.3)
+
+    print(f"target {url}  concurrency {args.concurrency}  duration {args.duration}s")
+    for kind in args.kinds.split(','):
+        latencies, errors, elapsed = asyncio.run(
+            run_load(url, build_requests(names, kind), args.concurrency, args.duration))
+        report(f"API {kind}", latencies, elapsed, errors)
+
+    if args.compare_streamlit:
+        latencies, elapsed = measure_streamlit(names, args.streamlit_iterations)
+        report("Streamlit optimize (rerun)", latencies, elapsed)
+        print(f"  (平均再実行時間 {statistics.mean(latencies) * 1000:.1f} ms / 1セッション直列)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Streamlitアプリ（streamlit_app.py）の同時セッション負荷試験
+
+Streamlit の AppTest で利用者のセッションを再現し、同時セッション数を段階的に増やしながら
+1回の再実行（ウィジェット操作 → スクリプト全体の実行）にかかる時間を測る。
+全セッションを1つのプロセス内のスレッドで動かすので、st.cache_resource などの共有資源は
+1台のStreamlitサーバーと同じように共有される。Gemini API はローカルのスタブ
+（tools/gemini_stub_server.py）に向ける。
+
+注意: AppTest は実行中のランタイムをプロセス全体で1つだけ持つため、再実行そのものは
+1つずつ順に行う（セッションは再実行の合間に入れ替わる）。待ち時間を含む p95/p99 は
+スクリプトを1本ずつしか実行できないサーバーの値に近く、Gemini の応答待ちも直列になるので、
+実サーバー（スレッドで並行に実行し、待ちの間は他のセッションが進む）より悲観的な値になる。
+
+各セッションのシナリオ（乱数シードで決まる）:
+    観光モードでスポットを選ぶ → 最適化ルートを算出 → スポット一覧を検索
+    → （一部のセッションのみ）AIプランを生成 → 防災モードに切り替え → 避難所を選んで避難ルートを算出
+
+表示する値:
+    同時セッション数ごとの 再実行の p50 / p95 / p99（秒）、1秒あたりの再実行数、失敗数、
+    1セッションあたりのメモリ増加量（RSSの増分 ÷ セッション数）
+
+使い方:
+    python tools/loadtest_app.py --levels 1,2,4,8 --sessions 2
+    python tools/loadtest_app.py --levels 4,16 --ai-ratio 0.5 --gemini-latency 1.0 --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+APP_PATH = os.path.join(ROOT, 'streamlit_app.py')
+# AppTest の再実行はスレッドセーフでないため、プロセス全体で1つずつ実行する
+_RUN_LOCK = threading.Lock()
+
+
+def rss_bytes() -> int:
+    """このプロセスの常駐メモリ（Linux の /proc を使い、無ければ最大RSS）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class SessionScript:
+    """1人分のセッション。各操作の再実行時間を latencies に記録する"""
+
+    def __init__(self, seed: int, ai_ratio: float, timeout: float):
+        from streamlit.testing.v1 import AppTest
+        self.rng = random.Random(seed)
+        self.ai_ratio = ai_ratio
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.latencies = []
+        self.errors = 0
+        self.messages = []
+
+    def _run(self, element=None):
+        # 所要時間にはロックの待ち時間（他のセッションの再実行を待つ時間）も含める
+        started = time.perf_counter()
+        with _RUN_LOCK:
+            (element.run() if element is not None else self.app.run())
+        self.latencies.append(time.perf_counter() - started)
+        if self.app.exception:
+            self.errors += 1
+            self.messages.append(self.app.exception[0].message)
+
+    def _switch_view(self, key, label):
+        # タブの切り替え（ブラウザでタブを押したときと同じく、再実行される）
+        self.app.session_state[key] = label
+        self._run()
+
+    def _by_label(self, elements, label):
+        for element in elements:
+            if element.label == label:
+                return element
+        return None
+
+    def play(self):
+        at = self.app
+        self._run()
+        if not at.multiselect:
+            # 受け入れ制限で観光モードを受け付けなかった場合は防災モードで続ける
+            button = self._by_label(at.button, "🏥 防災モードで開く")
+            if button is None:
+                return
+            self._run(button.click())
+        else:
+            # 観光: スポットを選んで最適化ルートを算出
+            spots = at.multiselect(key='map_multi_select')
+            self._run(spots.set_value(self.rng.sample(spots.options, self.rng.randint(2, 6))))
+            self._run(at.button(key='map_optimize_btn').click())
+
+            # スポット一覧を検索（タブは選択中のものだけが実行されるので、先にタブを切り替える）
+            self._switch_view('tourism_view', "📋 スポット一覧")
+            search = self._by_label(at.text_input, "🔍 スポット名で検索")
+            if search is not None:
+                self._run(search.input(self.rng.choice(["温泉", "公園", "日田", "神社"])))
+
+            # 一部のセッションのみAIプランを生成（Gemini はスタブ）
+            if self.rng.random() < self.ai_ratio:
+                self._switch_view('tourism_view', "🤖 AIプラン提案")
+                api_key = self._by_label(at.text_input, "Gemini APIキーを入力してください")
+                if api_key is not None:
+                    self._run(api_key.input("stub-key"))
+                    self._run(at.text_input(key='ai_budget').input("5000円以内"))
+                    self._run(at.text_input(key='ai_duration').input("3時間"))
+                    button = self._by_label(at.button, "🎯 AIプランを生成")
+                    if button is not None:
+                        self._run(button.click())
+
+            # 防災モードに切り替え
+            self._switch_view('tourism_view', "🗺️ マップ")
+            self._run(at.sidebar.radio[0].set_value('防災モード'))
+
+        shelters = at.multiselect(key='disaster_multi_select')
+        self._run(shelters.set_value(self.rng.sample(shelters.options, self.rng.randint(2, 5))))
+        self._run(at.button(key='disaster_optimize_btn').click())
+
+
+def run_level(concurrency: int, sessions_per_worker: int, seed: int, ai_ratio: float, timeout: float):
+    """同時に concurrency 個のセッションを動かし、結果を集計する"""
+    latencies, errors, messages = [], 0, []
+    lock = threading.Lock()
+    kept = []  # メモリ計測のため、終わったセッションもこのレベルの間は保持する
+
+    def worker(worker_id):
+        nonlocal errors
+        for i in range(sessions_per_worker):
+            session = SessionScript(seed * 100003 + worker_id * 1009 + i, ai_ratio, timeout)
+            try:
+                session.play()
+            except Exception as e:
+                session.errors += 1
+                session.messages.append(f"{type(e).__name__}: {e}")
+            with lock:
+                latencies.extend(session.latencies)
+                errors += session.errors
+                messages.extend(session.messages)
+                kept.append(session)
+
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes()
+    sessions = len(kept)
+    return {
+        'concurrency': concurrency,
+        'sessions': sessions,
+        'reruns': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'reruns_per_second': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50': round(percentile(latencies, 50), 3),
+        'p95': round(percentile(latencies, 95), 3),
+        'p99': round(percentile(latencies, 99), 3),
+        'mean': round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        'memory_per_session_mb': round(max(0, rss_after - rss_before) / sessions / 2**20, 2) if sessions else 0.0,
+        'error_messages': sorted(set(messages))[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="streamlit_app.py の同時セッション負荷試験（AppTest）")
+    parser.add_argument('--levels', default='1,2,4,8', help="同時セッション数の段階（カンマ区切り）")
+    parser.add_argument('--sessions', type=int, default=2, help="各同時セッションが順に実行するセッション数")
+    parser.add_argument('--ai-ratio', type=float, default=0.2, help="AIプランを生成するセッションの割合")
+    parser.add_argument('--gemini-latency', type=float, default=0.8, help="Gemini スタブの応答時間（秒）")
+    parser.add_argument('--timeout', type=float, default=120.0, help="1回の再実行のタイムアウト（秒）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    from gemini_stub_server import start_stub_server
+    _, gemini_url = start_stub_server(latency=args.gemini_latency)
+    os.environ['HITA_GEMINI_BASE_URL'] = gemini_url
+    # 利用状況のログは一時ディレクトリへ（リポジトリを汚さない）
+    os.environ.setdefault('HITA_ANALYTICS_DIR', tempfile.mkdtemp(prefix='hita-loadtest-'))
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    # 1回目は共有資源の初期化（データ読み込みなど）を含むので計測から除く
+    warmup = SessionScript(args.seed, 0.0, args.timeout)
+    warmup.app.run()
+
+    results = []
+    print(f"{'同時数':>6} {'セッション':>10} {'再実行':>6} {'失敗':>4} {'再実行/秒':>9} "
+          f"{'p50':>7} {'p95':>7} {'p99':>7} {'MB/セッション':>13}")
+    for level in (int(v) for v in args.levels.split(',')):
+        result = run_level(level, args.sessions, args.seed, args.ai_ratio, args.timeout)
+        results.append(result)
+        print(f"{result['concurrency']:>6} {result['sessions']:>10} {result['reruns']:>6} {result['errors']:>4} "
+              f"{result['reruns_per_second']:>9.2f} {result['p50']:>7.3f} {result['p95']:>7.3f} "
+              f"{result['p99']:>7.3f} {result['memory_per_session_mb']:>13.2f}")
+        for message in result['error_messages']:
+            print(f"       失敗: {message[:200]}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
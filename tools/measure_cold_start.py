@@ -0,0 +1,88 @@
+"""コールドスタート（プロセス起動から初回の画面表示まで）の計測
+
+オートスケールで新しいコンテナが立ち上がった直後の状態を再現するため、毎回新しいPythonプロセスを起動し、
+Streamlit の AppTest でアプリを1回だけ実行する。アプリ側（cold_start.STARTUP）が記録した
+プロセス起動からの経過秒数を集計する。
+
+    imports       streamlit_app.py のモジュール読み込みが終わるまで
+    first_render  初回の再実行（画面表示）が終わるまで。既定の地図タブはこの時点では枠だけで、
+                  folium の読み込みは含まない（streamlit_app.defer_first_map を参照）
+    first_map     初回表示の直後の再実行で、既定のタブの地図が描かれるまで
+    warm          バックグラウンドのウォームアップ（重いモジュール・所要時間行列）が終わるまで
+
+使い方:
+    python tools/measure_cold_start.py --runs 5
+    python tools/measure_cold_start.py --runs 5 --json cold_start.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKS = ('imports', 'first_render', 'first_map', 'warm')
+
+# 子プロセスで実行するスクリプト（アプリを1回実行し、記録された時点をJSONで出力する）
+CHILD_SCRIPT = """
+import json, logging, sys, time
+sys.path.insert(0, {root!r})
+logging.getLogger('streamlit').setLevel(logging.ERROR)
+from streamlit.testing.v1 import AppTest
+from cold_start import STARTUP
+at = AppTest.from_file({app!r}, default_timeout={timeout!r})
+at.run()
+deadline = time.time() + {timeout!r}
+while STARTUP.seconds('warm') is None and time.time() < deadline:
+    time.sleep(0.05)
+print(json.dumps({{'marks': STARTUP.metrics(), 'errors': [e.message for e in at.exception]}}))
+"""
+
+
+def run_once(timeout: float) -> dict:
+    """新しいプロセスでアプリを1回実行し、記録された時点を返す"""
+    script = CHILD_SCRIPT.format(root=ROOT, app=os.path.join(ROOT, 'streamlit_app.py'), timeout=timeout)
+    env = dict(os.environ)
+    env.setdefault('HITA_ANALYTICS_DIR', tempfile.mkdtemp(prefix='hita-coldstart-'))
+    completed = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env,
+                               capture_output=True, text=True, timeout=timeout * 2)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith('{')]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"計測に失敗しました: {completed.stderr.strip()[-500:]}")
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="streamlit_app.py のコールドスタート計測")
+    parser.add_argument('--runs', type=int, default=5, help="計測回数（毎回新しいプロセスを起動する）")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--json', help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        result = run_once(args.timeout)
+        runs.append(result)
+        marks = result['marks']
+        print(f"#{i + 1}: " + "  ".join(f"{name} {marks.get(name, float('nan')):.2f}秒" for name in MARKS)
+              + (f"  失敗: {result['errors'][0][:100]}" if result['errors'] else ""))
+
+    summary = {}
+    for name in MARKS:
+        values = [run['marks'][name] for run in runs if name in run['marks']]
+        if values:
+            summary[name] = {'median': round(statistics.median(values), 3),
+                             'min': round(min(values), 3), 'max': round(max(values), 3)}
+    print()
+    for name, stats in summary.items():
+        print(f"{name:>13}: 中央値 {stats['median']:.2f}秒（最小 {stats['min']:.2f} / 最大 {stats['max']:.2f}）")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'runs': runs, 'summary': summary}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""ワークブック読み込みの計測（シートごとの読み込み時間とピークメモリ）
+
+spots.xlsx の観光・防災シートに、コンビニ・スーパー・自動販売機のような数万行の施設シートを加えた
+合成のワークブックを一時ディレクトリに作り、次の2つの読み込み方を比べる。
+
+    streaming   spots_data.ingest_workbook（読み取り専用で1回だけ開き、行単位で読んで列単位で変換・確認する）
+    read_excel  シートごとに pd.read_excel で読み、所要時間を parse_time の .apply で変換する（従来の方法）
+
+ピークメモリは tracemalloc で計測したPythonのメモリ確保量（シートごとにリセットする）。
+合成データには座標の範囲外・空欄の行と、スポット名の重複した行を少し混ぜてある。
+
+使い方:
+    python tools/measure_ingest.py
+    python tools/measure_ingest.py --rows 50000 --json ingest.json
+    python tools/measure_ingest.py --workbook spots.xlsx   # 既存のワークブックを計測する
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openpyxl  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from spots_data import (DISASTER_SHEET, FACILITY_SHEETS, NORMALIZERS, SPOTS_PATH, TOURISM_SHEET,  # noqa: E402
+                        ingest_workbook, parse_time)
+
+# 日田市周辺（合成データの座標の範囲）
+LAT_RANGE = (33.0, 33.45)
+LNG_RANGE = (130.8, 131.1)
+
+
+def build_workbook(path: str, rows: int, seed: int = 0):
+    """観光・防災シート（spots.xlsx があればその内容）と施設シート（各 rows 行）のワークブックを作る"""
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    if os.path.exists(os.path.join(ROOT, SPOTS_PATH)):
+        with pd.ExcelFile(os.path.join(ROOT, SPOTS_PATH)) as book:
+            for sheet in (TOURISM_SHEET, DISASTER_SHEET):
+                df = book.parse(sheet)
+                worksheet = workbook.create_sheet(sheet)
+                worksheet.append(list(df.columns))
+                for record in df.itertuples(index=False):
+                    worksheet.append([None if pd.isna(v) else v for v in record])
+    for sheet in FACILITY_SHEETS:
+        worksheet = workbook.create_sheet(sheet)
+        worksheet.append(['No', 'スポット名', '緯度', '経度', '説明', '営業時間'])
+        for i in range(1, rows + 1):
+            lat, lng = rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)
+            name = f"{sheet}{i}"
+            if i % 997 == 0:
+                lat = None  # 座標の空欄
+            elif i % 991 == 0:
+                lng = 0.0  # 範囲外
+            elif i % 983 == 0:
+                name = f"{sheet}{i - 1}"  # 重複
+            worksheet.append([i, name, lat, lng, f"{sheet}の店舗", '24時間' if i % 3 else '7:00-23:00'])
+    workbook.save(path)
+
+
+def measure_streaming(path: str) -> list:
+    _, reports = ingest_workbook(path, trace_memory=True)
+    return [{'sheet': r.sheet, 'rows': r.rows, 'kept': r.kept, 'invalid_coords': r.invalid_coords,
+             'duplicates': r.duplicates, 'seconds': r.seconds, 'peak_bytes': r.peak_bytes} for r in reports]
+
+
+def measure_read_excel(path: str) -> list:
+    """従来の読み込み方（シートごとに read_excel で開き直し、所要時間を1件ずつ変換する）"""
+    results = []
+    tracemalloc.start()
+    try:
+        for sheet in pd.ExcelFile(path).sheet_names:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            df = pd.read_excel(path, sheet_name=sheet)
+            if '所要時間（参考）' in df.columns:
+                df['所要時間（参考）'] = df['所要時間（参考）'].apply(parse_time)
+            if sheet in NORMALIZERS:
+                df = NORMALIZERS[sheet](df)
+            results.append({'sheet': sheet, 'rows': len(df), 'seconds': time.perf_counter() - started,
+                            'peak_bytes': tracemalloc.get_traced_memory()[1] - baseline})
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def print_table(title: str, results: list):
+    print(f"\n[{title}]")
+    print(f"{'シート':<10}{'行数':>8}{'採用':>8}{'座標不正':>8}{'重複':>6}{'時間(ms)':>10}{'ピーク(MB)':>11}")
+    for r in results:
+        print(f"{r['sheet']:<10}{r['rows']:>8}{r.get('kept', r['rows']):>8}{r.get('invalid_coords', '-'):>8}"
+              f"{r.get('duplicates', '-'):>6}{r['seconds'] * 1000:>10.0f}{r['peak_bytes'] / 1024 / 1024:>11.1f}")
+    total = sum(r['seconds'] for r in results)
+    print(f"{'合計':<10}{sum(r['rows'] for r in results):>8}{'':>30}{total * 1000:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ワークブック読み込みの計測")
+    parser.add_argument('--rows', type=int, default=20000, help="施設シート1つあたりの行数")
+    parser.add_argument('--workbook', help="計測するワークブック（省略時は合成のワークブックを作る）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='hita-ingest-') as tmp:
+        path = args.workbook
+        if path is None:
+            path = os.path.join(tmp, 'spots.xlsx')
+            build_workbook(path, args.rows, args.seed)
+        print(f"ワークブック: {path}（{os.path.getsize(path) / 1024 / 1024:.1f}MB）")
+        results = {'streaming': measure_streaming(path), 'read_excel': measure_read_excel(path)}
+
+    print_table('streaming（ingest_workbook）', results['streaming'])
+    print_table('read_excel（従来）', results['read_excel'])
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""地図・操作欄の操作1回あたりの再実行時間（ページ全体 vs フラグメントのみ）の計測
+
+観光マップ・避難所マップの操作欄（カテゴリー・スポット選択・直線表示・状態フィルター・避難所選択）を
+Streamlit の AppTest で操作し、操作ごとに次の2つを比べる。
+
+    page      ページ全体の再実行の所要時間（フラグメント化する前は、操作のたびにこれだけかかっていた）
+    fragment  操作欄と地図のフラグメントの実行時間（フラグメント化した後、実際のサーバーで操作時に再実行される部分）
+
+AppTest はウィジェットの操作でも常にページ全体を実行するため、fragment はページ全体の実行の中で
+アプリが記録したフラグメントの実行時間（st.session_state['rerun_seconds']）を使う。
+
+使い方:
+    python tools/measure_reruns.py --repeat 5
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+APP_PATH = os.path.join(ROOT, 'streamlit_app.py')
+
+
+def measure(at, interact, scope):
+    """1回操作して (ページ全体の秒数, フラグメントの秒数) を返す"""
+    started = time.perf_counter()
+    interact().run()
+    page = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return page, at.session_state['rerun_seconds'][scope]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地図・操作欄の再実行時間（ページ全体 vs フラグメント）")
+    parser.add_argument('--repeat', type=int, default=5, help="各操作の回数")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('HITA_ANALYTICS_DIR', tempfile.mkdtemp(prefix='hita-reruns-'))
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.run()
+    at.run()  # 共有資源の初期化を計測から除く
+
+    results = {}
+
+    def record(name, interact, scope):
+        samples = [measure(at, lambda i=i: interact(i), scope) for i in range(args.repeat)]
+        results[name] = (statistics.median(s[0] for s in samples), statistics.median(s[1] for s in samples))
+
+    categories = at.selectbox(key='map_category').options
+    spots = at.multiselect(key='map_multi_select').options
+    record("観光: カテゴリー", lambda i: at.selectbox(key='map_category').set_value(categories[i % len(categories)]),
+           'tourism_map_view')
+    at.selectbox(key='map_category').set_value('すべて').run()
+    record("観光: スポット選択", lambda i: at.multiselect(key='map_multi_select').set_value(spots[i:i + 3]),
+           'tourism_map_view')
+    at.multiselect(key='map_multi_select').set_value(spots[:1]).run()
+    record("観光: 直線を表示", lambda i: at.checkbox(key='map_show_route').set_value(i % 2 == 0),
+           'tourism_map_view')
+
+    at.sidebar.radio[0].set_value('防災モード').run()
+    filters = at.radio(key='disaster_status_filter').options
+    shelters = at.multiselect(key='disaster_multi_select').options
+    record("防災: 状態フィルター", lambda i: at.radio(key='disaster_status_filter').set_value(filters[i % len(filters)]),
+           'shelter_map_view')
+    at.radio(key='disaster_status_filter').set_value('すべて').run()
+    record("防災: 避難所選択", lambda i: at.multiselect(key='disaster_multi_select').set_value(shelters[i:i + 3]),
+           'shelter_map_view')
+
+    print(f"{'操作':<16} {'ページ全体':>10} {'フラグメント':>12} {'短縮率':>7}")
+    for name, (page, fragment) in results.items():
+        print(f"{name:<16} {page:>9.3f}s {fragment:>11.3f}s {1 - fragment / page:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""日田周辺の地図タイルを MBTiles へ事前保存するツール
+
+スポットデータの範囲（または --bbox）を指定したズームレベルで覆うタイルを取得し、
+tile_cache.py が配信する MBTiles ファイルに保存する。保存済みのタイルは取得しない。
+OpenStreetMap の公開タイルサーバーは大量取得を禁止しているため、--upstream には
+一括取得が許可されたタイルサーバーを指定し、--delay で取得間隔を空けること。
+
+使い方:
+    python tools/seed_tiles.py --zooms 10-16 --upstream https://tiles.example.jp/{z}/{x}/{y}.png
+    python tools/seed_tiles.py --bbox 33.25,130.85,33.40,131.00 --zooms 12-15 --dry-run
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tile_cache import DEFAULT_MBTILES_PATH, MBTilesStore, OSM_TILE_URL, fetch_tile
+
+
+def lat_lng_to_tile(lat: float, lng: float, z: int):
+    """緯度経度 → XYZ タイル番号"""
+    n = 1 << z
+    x = int((lng + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_bbox(south: float, west: float, north: float, east: float, zooms):
+    for z in zooms:
+        x0, y0 = lat_lng_to_tile(north, west, z)
+        x1, y1 = lat_lng_to_tile(south, east, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def parse_zooms(value: str):
+    if '-' in value:
+        low, high = value.split('-', 1)
+        return list(range(int(low), int(high) + 1))
+    return [int(z) for z in value.split(',')]
+
+
+def spots_bbox(path: str, margin: float):
+    """観光・防災スポットの全体を囲む範囲（度単位の余白付き）"""
+    from spots_data import load_spots_frames
+    frames = load_spots_frames(path)
+    lats = [lat for df in frames for lat in df['緯度']]
+    lngs = [lng for df in frames for lng in df['経度']]
+    return min(lats) - margin, min(lngs) - margin, max(lats) + margin, max(lngs) + margin
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地図タイルを MBTiles へ事前保存する")
+    parser.add_argument('--mbtiles', default=DEFAULT_MBTILES_PATH)
+    parser.add_argument('--zooms', default='10-16', help="例: 10-16 または 12,14,16")
+    parser.add_argument('--bbox', help="南,西,北,東（省略時は spots.xlsx の範囲）")
+    parser.add_argument('--spots', default='spots.xlsx')
+    parser.add_argument('--margin', type=float, default=0.02, help="スポット範囲に足す余白（度）")
+    parser.add_argument('--upstream', default=OSM_TILE_URL)
+    parser.add_argument('--delay', type=float, default=0.5, help="1枚ごとの取得間隔（秒）")
+    parser.add_argument('--max-tiles', type=int, default=20000, help="これを超える場合は中止する")
+    parser.add_argument('--dry-run', action='store_true', help="枚数だけを表示する")
+    args = parser.parse_args()
+
+    if args.bbox:
+        south, west, north, east = (float(v) for v in args.bbox.split(','))
+    else:
+        south, west, north, east = spots_bbox(args.spots, args.margin)
+    zooms = parse_zooms(args.zooms)
+    tiles = list(tiles_in_bbox(south, west, north, east, zooms))
+    print(f"範囲 {south:.4f},{west:.4f} – {north:.4f},{east:.4f} / ズーム {zooms[0]}–{zooms[-1]}: {len(tiles)}枚",
+          file=sys.stderr)
+    if args.dry_run:
+        return
+    if len(tiles) > args.max_tiles:
+        sys.exit(f"{len(tiles)}枚は上限（--max-tiles {args.max_tiles}）を超えています")
+
+    store = MBTilesStore(args.mbtiles)
+    store.set_metadata({
+        'name': 'hita', 'format': 'png', 'type': 'baselayer',
+        'bounds': f"{west},{south},{east},{north}",
+        'minzoom': zooms[0], 'maxzoom': zooms[-1],
+        'attribution': 'OpenStreetMap contributors',
+    })
+    fetched = skipped = failed = 0
+    batch = []
+    try:
+        for z, x, y in tiles:
+            if store.has_tile(z, x, y):
+                skipped += 1
+                continue
+            try:
+                batch.append((z, x, y, fetch_tile(args.upstream, z, x, y)))
+                fetched += 1
+            except OSError as e:
+                failed += 1
+                print(f"取得失敗 {z}/{x}/{y}: {e}", file=sys.stderr)
+            if len(batch) >= 100:
+                store.put_tiles(batch)
+                batch = []
+            time.sleep(args.delay)
+    finally:
+        if batch:
+            store.put_tiles(batch)
+        print(f"取得 {fetched}枚・保存済み {skipped}枚・失敗 {failed}枚（合計 {store.count()}枚）", file=sys.stderr)
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""避難所開設状況フィードのローカル代替
+
+spots.xlsx の防災シートにある避難所名を使い、状態・収容人数の差分を
+JSONLファイルへ追記する（--serve を付けるとHTTPエンドポイントとして配信する）。
+--burst で災害発生直後のような短時間の大量更新を再現できる。
+
+使い方:
+    python tools/shelter_feed_simulator.py --out feed.jsonl --rate 20 --burst 2000
+    HITA_SHELTER_FEED=file:feed.jsonl streamlit run streamlit_app.py
+
+    python tools/shelter_feed_simulator.py --serve --port 8766
+    HITA_SHELTER_FEED=http://127.0.0.1:8766/updates streamlit run streamlit_app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+STATUSES = ['開設中', '開設中', '待機中', '満員', '閉鎖']
+
+
+def load_shelter_names(path='spots.xlsx'):
+    try:
+        return pd.read_excel(path, sheet_name='防災')['スポット名'].tolist()
+    except FileNotFoundError:
+        return ['日田市役所（避難所）', '中央公民館', '総合体育館', '桂林公民館', '三花公民館']
+
+
+def make_delta(names, rng):
+    return {
+        'name': rng.choice(names),
+        'status': rng.choice(STATUSES),
+        'capacity': rng.randrange(0, 800, 10),
+        'ts': time.time()
+    }
+
+
+class UpdateLog:
+    """HTTP配信用の差分ログ（カーソル = 先頭からの件数）"""
+
+    def __init__(self):
+        self.items = []
+        self.lock = threading.Lock()
+
+    def append(self, delta):
+        with self.lock:
+            self.items.append(delta)
+
+    def since(self, cursor):
+        with self.lock:
+            return len(self.items), self.items[cursor:]
+
+
+def serve(log, host, port):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/updates':
+                self.send_error(404)
+                return
+            cursor = int(parse_qs(url.query).get('since', ['0'])[0])
+            next_cursor, updates = log.since(cursor)
+            body = json.dumps({'cursor': next_cursor, 'updates': updates}, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"shelter feed: http://{host}:{port}/updates")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="避難所開設状況フィードのシミュレーター")
+    parser.add_argument('--out', default='shelter_feed.jsonl', help="追記先のJSONLファイル")
+    parser.add_argument('--serve', action='store_true', help="ファイルの代わりにHTTPで配信する")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--rate', type=float, default=5.0, help="平常時の1秒あたり更新件数")
+    parser.add_argument('--burst', type=int, default=0, help="開始直後にまとめて送る更新件数")
+    parser.add_argument('--duration', type=float, default=0, help="実行秒数（0で無制限）")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = load_shelter_names()
+    log = UpdateLog()
+    if args.serve:
+        serve(log, args.host, args.port)
+        emit = log.append
+    else:
+        out = open(args.out, 'a', encoding='utf-8')
+
+        def emit(delta):
+            out.write(json.dumps(delta, ensure_ascii=False) + '\n')
+            out.flush()
+
+    for _ in range(args.burst):
+        emit(make_delta(names, rng))
+
+    started = time.monotonic()
+    interval = 1.0 / args.rate if args.rate > 0 else None
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            if interval is None:
+                time.sleep(1)
+                continue
+            emit(make_delta(names, rng))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
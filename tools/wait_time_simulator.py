@@ -0,0 +1,71 @@
+"""待ち時間観測フィードのローカル代替
+
+観光シートのスポットについて、昼食時や週末に混む合成データを
+過去 --weeks 週間分（--interval 分間隔）JSONLに書き出す。
+--follow を付けると、その後も現在時刻の観測を追記し続ける。
+
+使い方:
+    python tools/wait_time_simulator.py --out wait_feed.jsonl --weeks 3
+    HITA_WAIT_FEED=file:wait_feed.jsonl streamlit run streamlit_app.py
+"""
+import argparse
+import json
+import math
+import random
+import time
+
+import pandas as pd
+
+
+def load_spot_names(path='spots.xlsx'):
+    try:
+        return pd.read_excel(path, sheet_name='観光')['スポット名'].tolist()
+    except FileNotFoundError:
+        return ['豆田町', '日田温泉', '咸宜園', '天ヶ瀬温泉', '小鹿田焼の里', '大山ダム']
+
+
+def synthetic_wait(base, ts, rng):
+    """時間帯・曜日で変動する合成の待ち時間（分）"""
+    local = time.localtime(ts)
+    hour = local.tm_hour + local.tm_min / 60
+    lunch = math.exp(-((hour - 12.5) ** 2) / 2)
+    afternoon = 0.5 * math.exp(-((hour - 15) ** 2) / 3)
+    weekend = 1.6 if local.tm_wday >= 5 else 1.0
+    if hour < 8 or hour > 20:
+        return 0
+    return max(0, round(base * (lunch + afternoon) * weekend + rng.gauss(0, 2)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="待ち時間観測フィードのシミュレーター")
+    parser.add_argument('--out', default='wait_feed.jsonl')
+    parser.add_argument('--weeks', type=float, default=3)
+    parser.add_argument('--interval', type=float, default=15, help="観測間隔（分）")
+    parser.add_argument('--follow', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = load_spot_names()
+    # スポットごとの混みやすさ（0〜40分）
+    bases = {name: rng.choice([0, 0, 5, 10, 20, 40]) for name in names}
+    step = args.interval * 60
+    now = time.time()
+    ts = now - args.weeks * 7 * 86400
+
+    with open(args.out, 'a', encoding='utf-8') as out:
+        while True:
+            while ts <= now:
+                for name in names:
+                    record = {'name': name, 'wait': synthetic_wait(bases[name], ts, rng), 'ts': ts}
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                ts += step
+            out.flush()
+            if not args.follow:
+                break
+            time.sleep(step)
+            now = time.time()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""移動手段ごとの所要時間モデルと所要時間行列
+
+最適化ルートの訪問順と総所要時間に、画面で選んだ移動手段（車・徒歩・自転車・公共交通）を反映する。
+各移動手段は「直線距離 × 迂回係数 ÷ 速度 ＋ 1区間ごとの固定時間」で見積もり、
+公共交通は最寄りの停留所までの徒歩・平均待ち時間（運行間隔の半分）・乗車時間の合計と
+全区間徒歩の短い方を使う。停留所と運行間隔はローカルのGTFS（HITA_GTFS_PATH、
+ディレクトリまたはzip）から読み込み、無い場合・読み込めない場合は既定の想定値を使う。
+スポット間の所要時間行列はデータのバージョンと移動手段ごとに1回だけ作って使い回す。
+バージョンは呼び出し側が計算済みのもの（アプリの get_dataset_versions など）を version で渡し、
+省略した場合だけデータの内容から計算する（データ全体を走査するので、リクエストごとの呼び出しでは渡すこと）。
+"""
+import csv
+import io
+import logging
+import os
+import threading
+import zipfile
+from collections import Counter
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from distance_matrix import haversine_matrix, origin_distances
+from route_cache import dataset_fingerprint
+
+# 移動手段ごとの速度（km/h）・迂回係数（道のり ÷ 直線距離）・1区間ごとの固定時間（分、駐車や乗り降りなど）
+TRAVEL_PROFILES: Dict[str, Dict[str, float]] = {
+    'driving':   {'speed_kmh': 40.0, 'detour': 1.3, 'overhead_min': 5.0},
+    'walking':   {'speed_kmh': 4.0,  'detour': 1.2, 'overhead_min': 0.0},
+    'bicycling': {'speed_kmh': 12.0, 'detour': 1.2, 'overhead_min': 2.0},
+    'transit':   {'speed_kmh': 20.0, 'detour': 1.3, 'overhead_min': 0.0},
+}
+
+# GTFSが無い場合の公共交通の想定値（停留所までの距離 km・運行間隔 分）
+DEFAULT_TRANSIT_ACCESS_KM = 0.4
+DEFAULT_TRANSIT_HEADWAY_MIN = 60.0
+# 運行間隔を数える時間帯（時）
+HEADWAY_WINDOW = (7, 19)
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_seconds(value: str) -> Optional[int]:
+    """GTFSの時刻 'HH:MM:SS'（24時以降も可）を秒に変換"""
+    try:
+        h, m, s = value.strip().split(':')
+        return int(h) * 3600 + int(m) * 60 + int(s)
+    except ValueError:
+        return None
+
+
+def load_gtfs_headways(path: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """GTFSから停留所の座標と日中の平均運行間隔（分）を読み込む
+
+    Returns: (緯度, 経度, 運行間隔) の配列。ファイルが無い・発着の無い停留所だけの場合は None
+    """
+    if not path or not os.path.exists(path):
+        return None
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        open_member = lambda name: io.TextIOWrapper(archive.open(name), encoding='utf-8-sig')
+    else:
+        archive = None
+        open_member = lambda name: open(os.path.join(path, name), encoding='utf-8-sig')
+    try:
+        with open_member('stops.txt') as f:
+            stops = {row['stop_id']: (float(row['stop_lat']), float(row['stop_lon']))
+                     for row in csv.DictReader(f) if row.get('stop_lat') and row.get('stop_lon')}
+        # stop_times.txt は大きいので1行ずつ読み、時間帯内の発車回数だけを数える
+        start, end = HEADWAY_WINDOW[0] * 3600, HEADWAY_WINDOW[1] * 3600
+        departures = Counter()
+        with open_member('stop_times.txt') as f:
+            for row in csv.DictReader(f):
+                seconds = _parse_seconds(row.get('departure_time') or row.get('arrival_time') or '')
+                if seconds is not None and start <= seconds < end:
+                    departures[row['stop_id']] += 1
+    except (OSError, KeyError, ValueError, csv.Error) as e:
+        raise ValueError(f"GTFSの読み込みに失敗しました: {e}")
+    finally:
+        if archive is not None:
+            archive.close()
+
+    served = [stop_id for stop_id in stops if departures[stop_id] > 0]
+    if not served:
+        return None
+    window_minutes = (end - start) / 60
+    lat = np.array([stops[s][0] for s in served])
+    lng = np.array([stops[s][1] for s in served])
+    headway = np.array([window_minutes / departures[s] for s in served])
+    return lat, lng, headway
+
+
+class TravelTimeModel:
+    """移動手段ごとの所要時間（分）を計算し、スポット間の行列をキャッシュする
+
+    GTFSが読み込めない場合は記録（gtfs_error）だけして、公共交通は既定の想定値で見積もる。
+
+    Args:
+        gtfs_path: 公共交通の停留所・運行間隔を読み込むGTFS（省略時は HITA_GTFS_PATH）
+        profiles: 移動手段ごとの速度・迂回係数・固定時間
+    """
+
+    def __init__(self, gtfs_path: Optional[str] = None, profiles: Optional[Dict[str, Dict[str, float]]] = None):
+        self.profiles = profiles or TRAVEL_PROFILES
+        self.gtfs_path = gtfs_path if gtfs_path is not None else os.environ.get('HITA_GTFS_PATH', 'gtfs')
+        self.gtfs_error: Optional[str] = None
+        try:
+            self.stops = load_gtfs_headways(self.gtfs_path)
+        except ValueError as e:
+            logger.warning("%s（公共交通は既定の想定値で見積もります）", e)
+            self.stops, self.gtfs_error = None, str(e)
+        self._matrices: Dict[Tuple[Hashable, str], np.ndarray] = {}
+        self._access: Dict[Hashable, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # プロセスプールへ渡すときはロックとキャッシュを除く
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_matrices'] = {}
+        state['_access'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _profile(self, mode: str) -> Dict[str, float]:
+        if mode not in self.profiles:
+            raise ValueError(f"不明な移動手段: {mode}")
+        return self.profiles[mode]
+
+    def _leg(self, dist_km, mode: str):
+        profile = self._profile(mode)
+        minutes = dist_km * profile['detour'] / profile['speed_kmh'] * 60
+        return np.where(dist_km > 0, minutes + profile['overhead_min'], 0.0)
+
+    def _stop_access(self, lat, lng) -> Tuple[np.ndarray, np.ndarray]:
+        """各地点から最寄り停留所までの距離（km）とその停留所の運行間隔（分）"""
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lng = np.atleast_1d(np.asarray(lng, dtype=np.float64))
+        if self.stops is None:
+            return (np.full(len(lat), DEFAULT_TRANSIT_ACCESS_KM),
+                    np.full(len(lat), DEFAULT_TRANSIT_HEADWAY_MIN))
+        stop_lat, stop_lng, headway = self.stops
+        dist = np.stack([origin_distances((a, b), stop_lat, stop_lng) for a, b in zip(lat, lng)])
+        nearest = dist.argmin(axis=1)
+        return dist[np.arange(len(lat)), nearest], headway[nearest]
+
+    @staticmethod
+    def _version(spots_df, version: Optional[Hashable]) -> Hashable:
+        return version if version is not None else dataset_fingerprint(spots_df)
+
+    def _spots_access(self, spots_df, version: Hashable) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            cached = self._access.get(version)
+        if cached is None:
+            cached = self._stop_access(spots_df['緯度'].to_numpy(), spots_df['経度'].to_numpy())
+            with self._lock:
+                self._access[version] = cached
+        return cached
+
+    def _times(self, dist_km, mode: str, access_from, headway_from, access_to):
+        """距離（km）から所要時間（分）を計算する（配列はブロードキャストされる）"""
+        if mode != 'transit':
+            return self._leg(dist_km, mode)
+        walk = self._leg(dist_km, 'walking')
+        ride = self._leg(dist_km, 'transit')
+        via_transit = self._leg(access_from, 'walking') + headway_from / 2 + ride + self._leg(access_to, 'walking')
+        return np.where(dist_km > 0, np.minimum(walk, via_transit), 0.0)
+
+    def matrix(self, spots_df, mode: str, version: Optional[Hashable] = None) -> np.ndarray:
+        """スポット間の所要時間行列（分、spots_df の行順）。データのバージョンと移動手段ごとに1回だけ作る"""
+        key = (self._version(spots_df, version), mode)
+        with self._lock:
+            cached = self._matrices.get(key)
+        if cached is not None:
+            return cached
+        lat = spots_df['緯度'].to_numpy(dtype=np.float64)
+        lng = spots_df['経度'].to_numpy(dtype=np.float64)
+        dist = haversine_matrix(lat, lng)
+        if mode == 'transit':
+            access, headway = self._spots_access(spots_df, key[0])
+            times = self._times(dist, mode, access[:, None], headway[:, None], access[None, :])
+        else:
+            times = self._times(dist, mode, None, None, None)
+        times = times.astype(np.float32)
+        times.setflags(write=False)
+        with self._lock:
+            self._matrices[key] = times
+        return times
+
+    def origin_times(self, origin, spots_df, mode: str, positions=None,
+                     version: Optional[Hashable] = None) -> np.ndarray:
+        """出発地から各スポットまでの所要時間（分）
+
+        positions（spots_df の行位置）を指定した場合はそのスポットだけを計算する。
+        """
+        lat = spots_df['緯度'].to_numpy(dtype=np.float64)
+        lng = spots_df['経度'].to_numpy(dtype=np.float64)
+        if positions is not None:
+            lat, lng = lat[positions], lng[positions]
+        dist = origin_distances(origin, lat, lng)
+        if mode == 'transit':
+            access_from, headway_from = self._stop_access(origin[0], origin[1])
+            access_to, _ = self._spots_access(spots_df, self._version(spots_df, version))
+            if positions is not None:
+                access_to = access_to[positions]
+            return self._times(dist, mode, access_from[0], headway_from[0], access_to)
+        return self._times(dist, mode, None, None, None)
+
+    def minutes_per_km_bound(self, mode: str) -> float:
+        """直線距離1kmあたりの所要時間（分）の下限（固定時間・待ち時間を除いた最速の場合）"""
+        modes = ('walking', 'transit') if mode == 'transit' else (mode,)
+        return min(self._profile(m)['detour'] / self._profile(m)['speed_kmh'] * 60 for m in modes)
+
+    def travel_times(self, origin, spots_df, mode: str,
+                     version: Optional[Hashable] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """最適化に渡す (出発地からの所要時間, スポット間の所要時間行列)"""
+        version = self._version(spots_df, version)
+        return self.origin_times(origin, spots_df, mode, version=version), self.matrix(spots_df, mode, version)
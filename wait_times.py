@@ -0,0 +1,210 @@
+"""待ち時間の時系列ストアと予測モジュール
+
+スポットごとに観測した待ち時間をリングバッファ（numpy配列）に保存し、
+曜日×時間帯（7×24）ごとの指数平滑プロファイルと直近の偏差から、
+到着予定時刻（ETA）における待ち時間を予測する。
+プロファイルは観測が増えたときだけ一括で再計算してルックアップ表にしておき、
+最適化ルートの計算中は表引きと数回の四則演算だけで済むようにする。
+"""
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+# 日田市の時刻（JST）で曜日・時間帯を判定する
+TZ_OFFSET_SECONDS = 9 * 3600
+HOURS_PER_WEEK = 7 * 24
+
+
+def week_bucket(ts):
+    """UNIX時刻（スカラーまたは配列）→ 曜日×時間帯のバケット番号（月曜0時 = 0）"""
+    local = np.asarray(ts, dtype=np.int64) + TZ_OFFSET_SECONDS
+    hours = local // 3600
+    # 1970-01-01 は木曜日（月曜始まりで3）
+    weekday = (hours // 24 + 3) % 7
+    return weekday * 24 + hours % 24
+
+
+def congestion_label(wait_minutes: float) -> str:
+    """待ち時間から混雑状況の表示を決める"""
+    if wait_minutes < 10:
+        return '空いている'
+    if wait_minutes < 30:
+        return '普通'
+    return '混雑'
+
+
+class WaitTimeStore:
+    """スポットごとの待ち時間観測を保持するリングバッファ
+
+    Args:
+        names: スポット名のリスト（この順番がスポット番号になる）
+        capacity: スポットごとに保持する観測数（既定は15分間隔で3週間分）
+    """
+
+    def __init__(self, names: Iterable[str], capacity: int = 2016):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.capacity = capacity
+        n = len(self.names)
+        self._ts = np.zeros((n, capacity), dtype=np.float64)
+        self._wait = np.zeros((n, capacity), dtype=np.float32)
+        self._head = np.zeros(n, dtype=np.int64)  # 次に書き込む位置
+        self._count = np.zeros(n, dtype=np.int64)
+        self.lock = threading.Lock()
+        self.version = 0
+
+    def record(self, name: str, wait_minutes: float, ts: Optional[float] = None) -> bool:
+        """観測を1件追加する。未知のスポットならFalse"""
+        return bool(self.apply([{'name': name, 'wait': wait_minutes, 'ts': ts}]))
+
+    def apply(self, records: Iterable[Dict]) -> List[str]:
+        """観測レコードをまとめて追加し、更新されたスポット名を返す
+
+        レコード形式: {"name": スポット名, "wait": 分, "ts": UNIX時刻（省略時は現在）}
+        （FeedIngestor からそのまま呼べるよう ShelterStatusStore.apply と同じ形にしている）
+        """
+        updated = set()
+        now = time.time()
+        with self.lock:
+            for record in records:
+                i = self.index.get(record.get('name', record.get('スポット名')))
+                wait = record.get('wait', record.get('待ち時間（分）'))
+                if i is None or wait is None:
+                    continue
+                try:
+                    wait = float(wait)
+                except (TypeError, ValueError):
+                    continue
+                head = self._head[i]
+                self._ts[i, head] = record.get('ts') or now
+                self._wait[i, head] = wait
+                self._head[i] = (head + 1) % self.capacity
+                self._count[i] = min(self._count[i] + 1, self.capacity)
+                updated.add(self.names[i])
+            if updated:
+                self.version += 1
+        return list(updated)
+
+    def latest(self, name: str):
+        """最新の観測 (UNIX時刻, 待ち時間) を返す。観測がなければNone"""
+        i = self.index.get(name)
+        with self.lock:
+            if i is None or self._count[i] == 0:
+                return None
+            last = (self._head[i] - 1) % self.capacity
+            return float(self._ts[i, last]), float(self._wait[i, last])
+
+    def snapshot(self):
+        """全観測を (スポット番号, 時刻, 待ち時間) の1次元配列として返す"""
+        with self.lock:
+            valid = np.arange(self.capacity)[None, :] < self._count[:, None]
+            spot = np.broadcast_to(np.arange(len(self.names))[:, None], valid.shape)[valid]
+            return spot.copy(), self._ts[valid].copy(), self._wait[valid].astype(np.float64)
+
+
+class WaitTimeForecaster:
+    """曜日×時間帯プロファイル＋直近偏差による待ち時間予測
+
+    Args:
+        store: 観測ストア
+        fallback: 観測がないスポットに使う待ち時間（スポット名 → 分、Excelの静的な値）
+        alpha: 同じバケット内の指数平滑係数（新しい観測ほど重い）
+        tau_minutes: 直近の偏差が予測に効く時間の目安（指数減衰の時定数）
+        min_rebuild_interval: プロファイル再計算の最短間隔（秒）
+    """
+
+    def __init__(self, store: WaitTimeStore, fallback: Optional[Dict[str, float]] = None,
+                 alpha: float = 0.3, tau_minutes: float = 90, min_rebuild_interval: float = 30):
+        self.store = store
+        self.alpha = alpha
+        self.tau = tau_minutes * 60
+        self.min_rebuild_interval = min_rebuild_interval
+        n = len(store.names)
+        fallback = fallback or {}
+        self._fallback = np.array([float(fallback.get(name, 0)) for name in store.names])
+        # ルックアップ表: profile[スポット, バケット]（分）
+        self.profile = np.repeat(self._fallback[:, None], HOURS_PER_WEEK, axis=1)
+        self._residual = np.zeros(n)
+        self._residual_ts = np.zeros(n)
+        self._built_version = -1
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> bool:
+        """観測が増えていればルックアップ表を作り直す"""
+        if self._built_version == self.store.version:
+            return False
+        if not force and time.monotonic() - self._built_at < self.min_rebuild_interval:
+            return False
+        with self._lock:
+            self._rebuild()
+        return True
+
+    def _rebuild(self):
+        version = self.store.version
+        spot, ts, wait = self.store.snapshot()
+        n = len(self.store.names)
+        profile = np.repeat(self._fallback[:, None], HOURS_PER_WEEK, axis=1)
+        residual = np.zeros(n)
+        residual_ts = np.zeros(n)
+
+        if len(ts):
+            bucket = week_bucket(ts)
+            key = spot * HOURS_PER_WEEK + bucket
+            # (スポット, バケット, 時刻) 順に並べ、グループ内で新しい順の順位から重みを付ける
+            order = np.lexsort((ts, key))
+            key_sorted = key[order]
+            last_in_group = np.r_[key_sorted[1:] != key_sorted[:-1], True]
+            # group_end[i] はiが属するグループの末尾位置（末尾位置の逆向き累積最小値）
+            group_end = np.minimum.accumulate(np.where(last_in_group, np.arange(len(order)), len(order))[::-1])[::-1]
+            rank_from_newest = group_end - np.arange(len(order))
+            weights = self.alpha * (1 - self.alpha) ** rank_from_newest
+
+            size = n * HOURS_PER_WEEK
+            weight_sum = np.bincount(key_sorted, weights=weights, minlength=size)
+            value_sum = np.bincount(key_sorted, weights=weights * wait[order], minlength=size)
+
+            # 観測のないバケットはスポット全体の平均、それもなければ静的な値
+            spot_count = np.bincount(spot, minlength=n)
+            spot_mean = np.where(spot_count > 0,
+                                 np.bincount(spot, weights=wait, minlength=n) / np.maximum(spot_count, 1),
+                                 self._fallback)
+            has_data = weight_sum > 0
+            flat = np.repeat(spot_mean, HOURS_PER_WEEK)
+            flat[has_data] = value_sum[has_data] / weight_sum[has_data]
+            profile = flat.reshape(n, HOURS_PER_WEEK)
+
+            # 各スポットの最新観測とプロファイルとの差（直近の偏差）
+            by_spot = np.lexsort((ts, spot))
+            spot_sorted = spot[by_spot]
+            idx = by_spot[np.r_[spot_sorted[1:] != spot_sorted[:-1], True]]
+            residual[spot[idx]] = wait[idx] - profile[spot[idx], bucket[idx]]
+            residual_ts[spot[idx]] = ts[idx]
+
+        self.profile = profile
+        self._residual = residual
+        self._residual_ts = residual_ts
+        self._built_version = version
+        self._built_at = time.monotonic()
+
+    def expected_wait(self, name: str, eta: Union[datetime, float, None] = None) -> float:
+        """到着予定時刻における待ち時間の予測（分）"""
+        i = self.store.index.get(name)
+        if i is None:
+            return 0.0
+        if eta is None:
+            eta_ts = time.time()
+        elif isinstance(eta, datetime):
+            eta_ts = eta.timestamp()
+        else:
+            eta_ts = float(eta)
+        bucket = int(week_bucket(eta_ts))
+        value = self.profile[i, bucket]
+        if self._residual_ts[i] > 0:
+            age = max(0.0, eta_ts - self._residual_ts[i])
+            value += self._residual[i] * math.exp(-age / self.tau)
+        return max(0.0, float(value))
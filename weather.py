@@ -0,0 +1,230 @@
+"""気象庁（JMA）の天気予報JSONを取得・キャッシュするモジュール
+
+天気予報はセッションや再実行ごとではなく、プロセス内で1つのバックグラウンド
+スレッドが定期的に取得する。取得結果はTTL付きでキャッシュし、TTL切れ後も
+stale期間内は古い値を返しつつ裏で再取得する（stale-while-revalidate）。
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# 日田市の予報区（class20）と、それを含む府県予報区・一次細分区域
+JMA_AREA_CODE = "4410200"
+JMA_OFFICE_CODE = "440000"  # 大分県
+JMA_CLASS10_CODE = "440030"  # 西部（日田市を含む一次細分区域）
+JMA_TEMP_AREA_NAME = "日田"
+
+# テスト時はローカルのスタブサーバーに差し替えられるよう環境変数で上書き可能
+JMA_FORECAST_URL = os.environ.get(
+    "HITA_JMA_FORECAST_URL",
+    "https://www.jma.go.jp/bosai/forecast/data/forecast/{office}.json"
+)
+
+# 天気コードの先頭桁 → (アイコン, 表示名)
+WEATHER_CODE_ICONS = {
+    "1": ("☀️", "晴れ"),
+    "2": ("☁️", "くもり"),
+    "3": ("🌧️", "雨"),
+    "4": ("❄️", "雪"),
+}
+
+
+@dataclass
+class WeatherReport:
+    """パース済みの天気予報"""
+    report_datetime: str
+    area_name: str
+    weather_code: str
+    weather_text: str
+    temp_min: Optional[float]
+    temp_max: Optional[float]
+    pop: Optional[int]  # 降水確率（%）
+    fetched_at: float
+
+    @property
+    def icon(self) -> str:
+        return WEATHER_CODE_ICONS.get(self.weather_code[:1], ("🌤️", ""))[0]
+
+    @property
+    def short_text(self) -> str:
+        """サイドバー表示用の短い天気名"""
+        return WEATHER_CODE_ICONS.get(self.weather_code[:1], ("", self.weather_text))[1]
+
+    def summary(self) -> str:
+        """Geminiのプロンプトに埋め込む1行の要約"""
+        parts = [f"{self.weather_text}（{self.area_name}）"]
+        if self.temp_min is not None and self.temp_max is not None:
+            parts.append(f"気温 {self.temp_min:.0f}〜{self.temp_max:.0f}°C")
+        if self.pop is not None:
+            parts.append(f"降水確率 {self.pop}%")
+        return "、".join(parts)
+
+
+def _first_numbers(values, count):
+    """空文字を除いた先頭count個の数値を返す"""
+    numbers = []
+    for value in values:
+        if value in ("", None, "--"):
+            continue
+        try:
+            numbers.append(float(value))
+        except (TypeError, ValueError):
+            continue
+        if len(numbers) == count:
+            break
+    return numbers
+
+
+def parse_forecast(payload, class10_code: str = JMA_CLASS10_CODE,
+                   temp_area_name: str = JMA_TEMP_AREA_NAME) -> WeatherReport:
+    """気象庁の予報JSON（forecast/{office}.json）から必要な値を取り出す
+
+    Raises:
+        ValueError: 想定した構造でない場合
+    """
+    try:
+        short_term = payload[0]
+        series = short_term["timeSeries"]
+    except (IndexError, KeyError, TypeError) as e:
+        raise ValueError(f"予報JSONの形式が不正です: {e}") from e
+
+    def find_area(areas, code=None, name=None):
+        for entry in areas:
+            area = entry.get("area", {})
+            if (code and area.get("code") == code) or (name and area.get("name") == name):
+                return entry
+        return areas[0] if areas else None
+
+    weather_area = find_area(series[0].get("areas", []), code=class10_code)
+    if weather_area is None:
+        raise ValueError("予報JSONに天気の区域がありません")
+
+    pop = None
+    if len(series) > 1:
+        pop_area = find_area(series[1].get("areas", []), code=class10_code)
+        if pop_area:
+            pops = _first_numbers(pop_area.get("pops", []), 1)
+            pop = int(pops[0]) if pops else None
+
+    temp_min = temp_max = None
+    if len(series) > 2:
+        temp_area = find_area(series[2].get("areas", []), name=temp_area_name)
+        if temp_area:
+            temps = _first_numbers(temp_area.get("temps", []), 2)
+            if temps:
+                temp_min, temp_max = min(temps), max(temps)
+
+    weathers = weather_area.get("weathers") or [""]
+    codes = weather_area.get("weatherCodes") or [""]
+    return WeatherReport(
+        report_datetime=short_term.get("reportDatetime", ""),
+        area_name=weather_area.get("area", {}).get("name", ""),
+        weather_code=str(codes[0]),
+        # 気象庁の表記は全角スペース区切り（例:「くもり　時々　雨」）
+        weather_text=" ".join(str(weathers[0]).split()),
+        temp_min=temp_min,
+        temp_max=temp_max,
+        pop=pop,
+        fetched_at=time.time()
+    )
+
+
+def fetch_forecast(office: str = JMA_OFFICE_CODE, url_template: Optional[str] = None,
+                   timeout: float = 5.0) -> WeatherReport:
+    """予報JSONを取得してパースする"""
+    url = (url_template or JMA_FORECAST_URL).format(office=office)
+    request = urllib.request.Request(url, headers={"User-Agent": "hita-navi/1.2"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        payload = json.loads(response.read().decode("utf-8"))
+    return parse_forecast(payload)
+
+
+class WeatherService:
+    """天気予報のTTLキャッシュとバックグラウンド更新
+
+    Args:
+        fetcher: WeatherReportを返す取得関数
+        ttl: この秒数以内の値は新鮮とみなす
+        stale_ttl: TTL切れ後、この秒数までは古い値を返しつつ再取得する
+        refresh_interval: バックグラウンドでの定期取得間隔（秒）
+    """
+
+    def __init__(self, fetcher: Callable[[], WeatherReport] = fetch_forecast,
+                 ttl: float = 600, stale_ttl: float = 3600, refresh_interval: float = 600):
+        self._fetcher = fetcher
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_interval = refresh_interval
+        self._report: Optional[WeatherReport] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """定期取得スレッドを起動する（2回目以降の呼び出しは何もしない）"""
+        with self._lock:
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._run, name="weather-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            # 失敗時は短めの間隔で再試行する
+            wait = self.refresh_interval if self.last_error is None else min(60, self.refresh_interval)
+            self._stop.wait(wait)
+
+    def refresh(self) -> Optional[WeatherReport]:
+        """同期的に再取得する。失敗しても直前の値は保持する"""
+        with self._lock:
+            if self._refreshing:
+                return self._report
+            self._refreshing = True
+        try:
+            report = self._fetcher()
+            with self._lock:
+                self._report = report
+            self.last_error = None
+            return report
+        except Exception as e:
+            self.last_error = str(e)
+            return self._report
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self) -> Optional[WeatherReport]:
+        """キャッシュ済みの予報を返す（描画をブロックしない）
+
+        新鮮な値はそのまま、TTL切れでstale期間内の値は裏で再取得を走らせつつ返す。
+        stale期間も過ぎた値や未取得の場合はNoneを返す。
+        """
+        with self._lock:
+            report = self._report
+            refreshing = self._refreshing
+        if report is None:
+            return None
+        age = time.time() - report.fetched_at
+        if age <= self.ttl:
+            return report
+        if not refreshing:
+            threading.Thread(target=self.refresh, name="weather-revalidate", daemon=True).start()
+        if age <= self.ttl + self.stale_ttl:
+            return report
+        return None
+
+    def is_stale(self) -> bool:
+        with self._lock:
+            report = self._report
+        return report is not None and time.time() - report.fetched_at > self.ttl